@@ -0,0 +1,75 @@
+"""
+Package entry point to the NextRequest scraper, the San Diego time to close scraper and the EDA utilities. The
+modules themselves stay where the notebooks import them from (steven/scraper, steven/eda and sai), which are added to
+sys.path when the package is imported. Their public names are imported on first access, so that importing the package
+(or running python -m nextrequest --help) does not import selenium, pandas or lxml.
+
+    import nextrequest
+    scraper = nextrequest.NextRequestScraper(None, 'https://lacity.nextrequest.com/requests/', backend='html')
+"""
+
+import importlib
+import importlib.util
+import os
+import sys
+
+__version__ = '0.1.0'
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIRS = [os.path.join(ROOT, 'steven', 'scraper'), os.path.join(ROOT, 'steven', 'eda'), os.path.join(ROOT, 'sai')]
+
+for source_dir in SOURCE_DIRS:
+    if source_dir not in sys.path: sys.path.append(source_dir)
+
+# Public name -> module it is imported from on first access
+EXPORTS = {
+    'NextRequestScraper': 'nextrequest_scraper',
+    'make_session': 'nextrequest_html',
+    'HostRateLimiter': 'nextrequest_rate',
+    'AdaptiveRateLimiter': 'nextrequest_rate',
+    'CheckpointStore': 'nextrequest_checkpoint',
+    'RequestBatch': 'nextrequest_records',
+    'RetryQueue': 'nextrequest_retry',
+    'PageArchive': 'nextrequest_archive',
+    'PageCache': 'nextrequest_cache',
+    'TimingLog': 'nextrequest_timing',
+    'discover_ids': 'nextrequest_discovery',
+    'discovered_ids': 'nextrequest_discovery',
+    'load_discovery': 'nextrequest_discovery',
+    'save_discovery': 'nextrequest_discovery',
+    'expand_id_ranges': 'nextrequest_async',
+    'check_document_counts': 'nextrequest_scraper_utils',
+    'nextrequest_df_clean': 'nextrequest_eda_utils',
+    'nextrequest_df_clean_bulk': 'nextrequest_eda_utils',
+    'nextrequest_df_clean_parallel': 'nextrequest_eda_utils',
+    'clean_requests_zip': 'nextrequest_eda_utils',
+    'iter_requests_zip': 'nextrequest_eda_utils',
+    'get_request_times': 'nextrequest_eda_utils',
+    'parse_sandiego_page': 'sandiego_parser',
+}
+
+__all__ = sorted(EXPORTS)
+
+
+def load_sandiego():
+    """
+    Imports sai/main.py, the San Diego time to close scraper. It is loaded by path since 'main' is too generic a
+    module name to put on sys.path.
+    """
+    if 'sandiego_main' not in sys.modules:
+        spec = importlib.util.spec_from_file_location('sandiego_main', os.path.join(ROOT, 'sai', 'main.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['sandiego_main'] = module
+        spec.loader.exec_module(module)
+    return sys.modules['sandiego_main']
+
+
+def __getattr__(name):
+    if name not in EXPORTS: raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module(EXPORTS[name]), name)
+    globals()[name] = value  # Later accesses skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,3 @@
+from nextrequest.cli import main
+
+main()
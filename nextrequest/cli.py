@@ -0,0 +1,296 @@
+"""
+Command line interface of the nextrequest package:
+
+    nextrequest scrape URL (--ids DISCOVERY_JSON | --range PREFIX START END ... | --earliest-id ID) [options]
+    nextrequest scrape --time-to-close LISTING_URL [--prefix PREFIX ...] [--start N]
+    nextrequest discover URL PREFIX [PREFIX ...] [--output DISCOVERY_JSON]
+    nextrequest clean REQUESTS_ZIP [--name NAME] [--path DIR]
+    nextrequest report {requests,timings,retries,archive,cache} FILE [FILE ...]
+
+Every subcommand imports what it needs only once it runs, so that --help and the lightweight commands start without
+importing selenium, pandas or lxml. python -m nextrequest.startup_bench measures the startup time of each command.
+"""
+
+import argparse
+import os
+import sys
+
+import nextrequest
+
+REPORTS = ('requests', 'timings', 'retries', 'archive', 'cache')
+
+
+def scrape(args):
+    """
+    Scrapes a portal with NextRequestScraper: the given request IDs concurrently, or the whole database sequentially
+    from earliest_id. With --time-to-close, scrapes the department and time to close of every San Diego style request
+    page instead (see sai/main.py).
+    """
+    if args.time_to_close:
+        return scrape_time_to_close(args)
+
+    from nextrequest_scraper import NextRequestScraper
+    from nextrequest_html import make_session
+    from nextrequest_rate import HostRateLimiter, AdaptiveRateLimiter
+
+    os.makedirs(args.path, exist_ok=True)
+    log = args.log if args.log is not None else args.path + args.name + '.log'
+    rate = args.rate if args.rate is not None else 1
+    if args.adaptive:
+        limiter = AdaptiveRateLimiter(rate, capacity=args.burst)
+    else:
+        limiter = HostRateLimiter(rate, capacity=args.burst)
+
+    if args.checkpoint:
+        from nextrequest_checkpoint import CheckpointStore
+        requests = CheckpointStore(args.checkpoint)
+    else:
+        from nextrequest_records import RequestBatch
+        requests = RequestBatch()
+    retry_queue, cache = None, None
+    if args.retry_queue:
+        from nextrequest_retry import RetryQueue
+        retry_queue = RetryQueue(args.retry_queue)
+    if args.cache:
+        from nextrequest_cache import PageCache
+        cache = PageCache(args.cache)
+    previous = None
+    if args.previous:
+        from nextrequest_incremental import load_previous_requests
+        previous = load_previous_requests(args.previous)
+
+    driver, pool, scraper = None, None, None
+    try:
+        if args.backend == 'selenium':
+            from nextrequest_driver_pool import DriverPool, make_headless_firefox
+            if args.earliest_id:
+                driver = make_headless_firefox()
+            else:
+                pool = DriverPool(size=args.concurrency)
+        scraper = NextRequestScraper(driver, args.url, backend=args.backend, extraction=args.extraction,
+                                     session=make_session(pool_size=args.concurrency), limiter=limiter,
+                                     timing_log=args.timing_log or '', retry_queue=retry_queue, archive=args.archive,
+                                     cache=cache)
+
+        if args.earliest_id:
+            scraper.scrape(requests, args.earliest_id, requests_name=args.name, path=args.path,
+                           num_requests=args.num_requests, progress=args.progress, log=log, previous=previous)
+        else:
+            stats = scraper.scrape_ids(requests, request_ids(args), concurrency=args.concurrency,
+                                       progress=args.progress, log=log, previous=previous, pool=pool)
+            print(stats)
+            requests.export(args.name, path=args.path, log=log)
+    finally:
+        if driver is not None: driver.quit()
+        if pool is not None: pool.close()
+        archive = scraper.archive if scraper is not None else None
+        for store in (requests, retry_queue, cache, archive):
+            if hasattr(store, 'close'): store.close()
+
+
+def request_ids(args):
+    """
+    Request IDs given to scrape, from a discovery file and/or ID ranges
+    """
+    from nextrequest_async import expand_id_ranges
+
+    ranges = [(prefix, int(start), int(end)) for prefix, start, end in args.range or []]
+    if args.ids:
+        from nextrequest_discovery import load_discovery
+        ranges = [r for result in load_discovery(args.ids) for r in result['ranges']] + ranges
+    return expand_id_ranges(ranges)
+
+
+def scrape_time_to_close(args):
+    sandiego = nextrequest.load_sandiego()
+    limiter = None  # get_time_to_close starts at its own slow, adaptive pace
+    if args.rate is not None:
+        from nextrequest_rate import AdaptiveRateLimiter
+        limiter = AdaptiveRateLimiter(rate=args.rate, capacity=args.burst)
+    os.makedirs(args.path, exist_ok=True)
+    result_df = sandiego.get_time_to_close(listing=args.time_to_close.rstrip('/'), prefixes=args.prefix or ['21'],
+                                           start=args.start, cache_file=args.cache or sandiego.cache_file,
+                                           limiter=limiter)
+    result_df.to_csv(args.path + args.name + '.csv', index=False)
+    print('{:d} requests written to {}'.format(len(result_df), args.path + args.name + '.csv'))
+
+
+def discover(args):
+    """
+    Discovers the request IDs of a portal (see nextrequest_discovery)
+    """
+    from nextrequest_discovery import discover_ids, save_discovery
+
+    results = discover_ids(args.url, args.prefixes, start=args.start, window=args.window, max_gap=args.max_gap,
+                           enumerate_ids=not args.dense, concurrency=args.concurrency, rate=args.rate)
+    save_discovery(results, args.output)
+    print('{:d} request IDs written to {}'.format(
+        sum(end - start + 1 for result in results for _, start, end in result['ranges']), args.output))
+
+
+def clean(args):
+    """
+    Cleans a zipped CSV written by the scraper into Parquet tables, chunk by chunk (see clean_requests_zip)
+    """
+    from nextrequest_eda_utils import clean_requests_zip
+
+    name = args.name or os.path.splitext(os.path.basename(args.requests))[0]
+    os.makedirs(args.path, exist_ok=True)
+    num_requests, peak = clean_requests_zip(args.requests, name, path=args.path, chunksize=args.chunksize,
+                                            debug=args.debug)
+    print('{:d} requests cleaned into {}{}_clean(_docs|_msgs).parquet{}'.format(
+        num_requests, args.path, name, ', peak memory {:.0f} MB'.format(peak) if peak else ''))
+
+
+def report(args):
+    """
+    Prints a report of the scraped requests, timing logs, retry queue, page archive or page cache
+    """
+    if args.kind == 'requests':
+        for filename in args.files:
+            print(requests_report(filename))
+    elif args.kind == 'timings':
+        from nextrequest_timing import load_timings, timing_report
+        print(timing_report(load_timings(args.files), bins=args.bins))
+    elif args.kind == 'retries':
+        from nextrequest_retry import RetryQueue
+        for filename in args.files:
+            with RetryQueue(filename) as queue:
+                print(queue.report(), end='')
+    elif args.kind == 'archive':
+        from nextrequest_archive import PageArchive
+        for filename in args.files:
+            with PageArchive(filename) as archive:
+                print(archive.summary())
+    else:
+        from nextrequest_cache import PageCache
+        for filename in args.files:
+            with PageCache(filename, max_bytes=float('inf')) as cache:
+                print('{:d} pages, {:,d} bytes'.format(len(cache), cache.total))
+
+
+def requests_report(filename):
+    """
+    String displaying the statuses, busiest departments, time to close and document shortfalls of the requests in a
+    zipped CSV written by the scraper or a CheckpointStore database
+    """
+    import pandas as pd
+    from nextrequest_eda_utils import nextrequest_df_clean_bulk, dept_index, dept_counts, get_request_times
+    from nextrequest_scraper_utils import check_document_counts, REQUEST_FIELDS
+
+    # Every column is read as strings, since a column left entirely empty would otherwise be inferred as numbers
+    if filename.endswith('.zip'):
+        df = pd.read_csv(filename, dtype=str)
+        shortfalls = check_document_counts(df.to_dict('records'))
+    else:
+        from nextrequest_checkpoint import CheckpointStore
+        store = CheckpointStore(filename)
+        try:
+            rows = list(store.iter_requests(complete=True))
+        finally:
+            store.close()
+        shortfalls = check_document_counts(rows)
+        df = pd.DataFrame(rows, columns=REQUEST_FIELDS).astype('string')
+    df, docs, msgs = nextrequest_df_clean_bulk(df, views=False)
+    time_to_close = get_request_times(msgs)['time_to_close'].dropna()
+
+    return '\n'.join([
+        '{}: {:d} requests, {:d} documents, {:d} messages\n'.format(filename, len(df), len(docs), len(msgs)),
+        'Status:', df['status'].value_counts().to_string(), '',
+        'Busiest departments:', dept_counts(dept_index(df)).head(10).to_string(), '',
+        'Time to close:', time_to_close.describe().to_string() if len(time_to_close) else '  (no closed requests)', '',
+        '{:d} requests with fewer documents scraped than released'.format(len(shortfalls)), ''
+    ])
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='nextrequest',
+                                     description='Scrape, clean and report on NextRequest public records portals')
+    parser.add_argument('--version', action='version', version='%(prog)s ' + nextrequest.__version__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('scrape', help='Scrape the requests of a portal',
+                              description='Scrape requests by ID (--ids, --range) or sequentially (--earliest-id)')
+    p.add_argument('url', nargs='?',
+                   help='Request URL prefix of the portal, e.g. https://lacity.nextrequest.com/requests/')
+    ids = p.add_argument_group('requests to scrape')
+    ids.add_argument('--ids', help='Discovery file written by nextrequest discover')
+    ids.add_argument('--range', nargs=3, action='append', metavar=('PREFIX', 'START', 'END'),
+                     help='Range of request IDs, e.g. 21 1 500 (repeatable)')
+    ids.add_argument('--earliest-id', help='Walk the database sequentially from this request ID')
+    ids.add_argument('--num-requests', type=int, default=-1, help='Requests to scrape sequentially (default: all)')
+    p.add_argument('--backend', choices=('html', 'selenium'), default='html')
+    p.add_argument('--extraction', choices=('elements', 'js'), default='elements', help='Selenium page extraction')
+    p.add_argument('--concurrency', type=int, default=10, help='Concurrent fetches (browsers with selenium)')
+    p.add_argument('--rate', type=float, help='Requests per second, unlimited if non-positive (default: 1, or the slow '
+                                              'adaptive pace of sai/main.py with --time-to-close)')
+    p.add_argument('--burst', type=int, default=1)
+    p.add_argument('--adaptive', action='store_true', help='Adapt the rate to how the portal responds')
+    p.add_argument('--name', default='requests', help='Name of the exported <path><name>.zip')
+    p.add_argument('--path', default='data/', help='Output directory, with a trailing slash')
+    p.add_argument('--log', help='Log file (default: <path><name>.log)')
+    p.add_argument('--progress', type=int, default=100, help='Log progress every N requests')
+    p.add_argument('--checkpoint', help='CheckpointStore database to scrape into, resuming a previous run')
+    p.add_argument('--previous', help='Previous scrape (zip or checkpoint) to re-scrape incrementally')
+    p.add_argument('--retry-queue', help='RetryQueue database for failed requests')
+    p.add_argument('--archive', help='PageArchive database to keep the fetched pages in')
+    p.add_argument('--cache', help='PageCache database to revalidate pages with conditional requests')
+    p.add_argument('--timing-log', help='File to record per-request timings to')
+    sandiego = p.add_argument_group('time to close')
+    sandiego.add_argument('--time-to-close', metavar='LISTING_URL',
+                          help='Scrape the department and time to close of each request into <path><name>.csv '
+                               'instead, e.g. https://sandiego.nextrequest.com/requests')
+    sandiego.add_argument('--prefix', action='append', help='Year prefix of the request IDs (repeatable, default: 21)')
+    sandiego.add_argument('--start', type=int, default=500, help='First request number of each prefix')
+    p.set_defaults(func=scrape)
+
+    p = subparsers.add_parser('discover', help='Discover the request IDs of a portal')
+    p.add_argument('url', help='Request URL prefix of the portal, e.g. https://lacity.nextrequest.com/requests/')
+    p.add_argument('prefixes', nargs='+', help='Year prefixes of the request IDs, e.g. 19 20 21')
+    p.add_argument('--start', type=int, default=1, help='First request number to consider')
+    p.add_argument('--window', type=int, default=5, help='Consecutive numbers probed to bridge deleted requests')
+    p.add_argument('--max-gap', type=int, default=50, help='Longest run of deleted requests to look past')
+    p.add_argument('--dense', action='store_true', help='Assume every number up to the last one exists')
+    p.add_argument('--concurrency', type=int, default=10)
+    p.add_argument('--rate', type=float, default=2, help='Probes per second')
+    p.add_argument('--output', default='discovered_ids.json')
+    p.set_defaults(func=discover)
+
+    p = subparsers.add_parser('clean', help='Clean scraped requests into Parquet tables')
+    p.add_argument('requests', help='Zipped CSV written by the scraper')
+    p.add_argument('--name', help='Name of the cleaned tables (default: name of the zip)')
+    p.add_argument('--path', default='data/', help='Output directory, with a trailing slash')
+    p.add_argument('--chunksize', type=int, default=1000, help='Requests cleaned at a time')
+    p.add_argument('--debug', action='store_true')
+    p.set_defaults(func=clean)
+
+    p = subparsers.add_parser('report', help='Summarize scraped requests or scraper databases and logs')
+    p.add_argument('kind', choices=REPORTS, help='requests: zip or checkpoint database, timings: timing logs, '
+                                                 'retries/archive/cache: scraper databases')
+    p.add_argument('files', nargs='+')
+    p.add_argument('--bins', type=int, default=10, help='Number of timing histogram bins')
+    p.set_defaults(func=report)
+    return parser
+
+
+def main(argv=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'scrape':
+        if args.time_to_close:
+            if args.url or args.ids or args.range or args.earliest_id:
+                parser.error('--time-to-close takes the listing URL instead of a request URL and IDs')
+        elif not args.url:
+            parser.error('scrape requires the request URL prefix of the portal')
+        elif not (args.ids or args.range or args.earliest_id):
+            parser.error('scrape requires --ids, --range or --earliest-id')
+        elif args.earliest_id and (args.ids or args.range):
+            parser.error('--earliest-id cannot be combined with --ids or --range')
+    try:
+        args.func(args)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == '__main__':
+    main()
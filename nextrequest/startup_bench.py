@@ -0,0 +1,82 @@
+"""
+Startup time of the nextrequest CLI. Each command is run in a fresh interpreter several times, reporting the median
+wall time and the heavy modules it imported (from python -X importtime). The lightweight report commands are run on
+empty databases. For comparison, the last line imports everything the subcommands use up front, which is what every
+command would cost without lazy imports.
+
+Usage: python -m nextrequest.startup_bench [--repeat N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+import nextrequest
+
+HEAVY_MODULES = ('selenium', 'pandas', 'numpy', 'pyarrow', 'lxml', 'requests', 'bs4')
+
+EAGER_IMPORTS = ('import nextrequest, nextrequest_scraper, nextrequest_discovery, nextrequest_eda_utils, '
+                 'nextrequest_timing, nextrequest_retry, nextrequest_archive, nextrequest_cache; '
+                 'nextrequest.load_sandiego()')
+
+
+def commands(tmp):
+    """
+    (label, interpreter arguments) of every command timed
+    """
+    cli = ['-m', 'nextrequest']
+    retries, archive, cache = (os.path.join(tmp, name + '.db') for name in ('retries', 'archive', 'cache'))
+    return [
+        ('python -c pass', ['-c', 'pass']),
+        ('nextrequest --help', cli + ['--help']),
+        ('nextrequest scrape --help', cli + ['scrape', '--help']),
+        ('nextrequest discover --help', cli + ['discover', '--help']),
+        ('nextrequest clean --help', cli + ['clean', '--help']),
+        ('nextrequest report --help', cli + ['report', '--help']),
+        ('nextrequest report retries', cli + ['report', 'retries', retries]),
+        ('nextrequest report archive', cli + ['report', 'archive', archive]),
+        ('nextrequest report cache', cli + ['report', 'cache', cache]),
+        ('eager imports', ['-c', EAGER_IMPORTS])
+    ]
+
+
+def run(args, cwd):
+    """
+    Runs the interpreter with args, returning the wall time in seconds and the -X importtime output
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [nextrequest.ROOT,
+                                                                     os.environ.get('PYTHONPATH')])))
+    start = timer()
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=cwd, env=env, capture_output=True,
+                            text=True)
+    elapsed = timer() - start
+    if result.returncode: raise RuntimeError('{} failed:\n{}'.format(args, result.stderr[-2000:]))
+    return elapsed, result.stderr
+
+
+def heavy_imports(importtime):
+    """
+    Top-level packages among HEAVY_MODULES that appear in -X importtime output
+    """
+    imported = {line.split('|')[-1].strip().split('.')[0] for line in importtime.splitlines()
+                if line.startswith('import time:')}
+    return [module for module in HEAVY_MODULES if module in imported]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the startup time of the nextrequest CLI commands')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each command')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, command in commands(tmp):
+            times = []
+            for _ in range(args.repeat):
+                elapsed, importtime = run(command, tmp)
+                times.append(elapsed)
+            print('{:<30} {:>7.0f}ms   {}'.format(label, statistics.median(times) * 1e3,
+                                                 ', '.join(heavy_imports(importtime)) or '-'))
@@ -1,14 +1,20 @@
 import requests
-from bs4 import BeautifulSoup
-import re
-import datetime
-import pandas as pd
-import random
+import os
+import sys
 import time
 from lxml.html import fromstring
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'steven', 'eda'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'steven', 'scraper'))
+from nextrequest_rate import AdaptiveRateLimiter, retry_after_seconds
+from nextrequest_discovery import discover_ids, discovered_ids
+from nextrequest_cache import PageCache
+from sandiego_parser import parse_sandiego_page
+from nextrequest_records import TimeToCloseRecord, TimeToCloseBatch
 
-randos = ["https://sandiego.nextrequest.com/documents","https://sandiego.nextrequest.com/requests/new","https://sandiego.nextrequest.com/users/sign_in"]
+
+listing = 'https://sandiego.nextrequest.com/requests'
+cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandiego_cache.db')
 headers = requests.utils.default_headers()
 headers.update({
     'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0',
@@ -28,85 +34,57 @@ def get_proxies():
 
 # PROXIES = list(get_proxies())
 
-def get_data(url):
-    
-    def cleanhtml(raw_html):
-        cleanr = re.compile('<.*?>')
-        cleantext = re.sub(cleanr, '', raw_html)
-        return cleantext
+def get_data(url, page=None):
 
-    ids = url[-7:]
-    
     # rand_proxy = random.randrange(len(PROXIES))
     # proxy = {'http':'http://'+PROXIES[rand_proxy],'https':'https://'+PROXIES[rand_proxy]}
-    page = requests.get(url,headers = headers)#,proxies = proxy)
-    soup = BeautifulSoup(page.content, 'html.parser')
-    dept = soup.find_all(class_="current-department")
-    depts = cleanhtml(str(dept[0])).strip()
-
-    times = soup.find_all(class_="time-quotes")
-
-    creation = cleanhtml(str(times[0])).strip()
-    closing = cleanhtml(str(times[-1])).strip()
-    
-    
-    def get_am_or_pm(time):
-        if(time.partition("pm")[0][-2:] != 'am'):
-#             print(time.partition("pm")[0][:-2],time.partition("pm")[0][:-2]!="am")
-            return time.partition("pm")[0]+"pm"
-        return time.partition("pm")[0]
-    
-    
-    
-    try:
-        doj_creation = datetime.datetime.strptime(get_am_or_pm(creation), '%B %d, %Y, %I:%M%p')
-        doj_closing  = datetime.datetime.strptime(get_am_or_pm(closing), '%B %d, %Y, %I:%M%p')
-    except(ValueError):
+    if page is None:
+        page = requests.get(url,headers = headers)#,proxies = proxy)
+    request = parse_sandiego_page(page.content, url=url)
+    if request.time_to_close is None:
         print(url)
-        print(get_am_or_pm(creation))
-        print(get_am_or_pm(closing))
-    time_to_close = (doj_creation - doj_closing)
-
-    return ids, depts, time_to_close
-
-
-ids = []
-depts = []
-time_to_close = []
-
-for i in range(21,22):
-    for j in range(500,1000):
-        time.sleep(15)
-        url = "https://sandiego.nextrequest.com/requests/"+str(i) + "-" + str(j)
+        print(request.time_quotes[-1])
+        print(request.time_quotes[0])
+        return request.id, request.department, None
+
+    return request.id, request.department, request.time_to_close
+
+
+def get_time_to_close(listing=listing, prefixes=('21',), start=500, cache_file=cache_file, limiter=None):
+    """
+    Department and time to close of every request of the portal whose request listing is at listing, from request
+    number start of each year prefix on. Returns a DataFrame with one row per request.
+    """
+    # Start at the old pace of one request every 15s, speeding up while the portal stays healthy and backing off when
+    # it throttles
+    if limiter is None:
+        limiter = AdaptiveRateLimiter(rate=1 / 15, floor=1 / 60, ceiling=1, increase=0.01, cooldown=15)
+    session = requests.Session()
+    # Pages are revalidated with conditional requests on later runs instead of being downloaded again
+    cache = PageCache(cache_file)
+    batch = TimeToCloseBatch()
+
+    # Find the requests with lightweight probes, instead of fetching every number
+    discovery = discover_ids(listing + '/', list(prefixes), start=start, limiter=limiter, concurrency=1)
+
+    for request_id in discovered_ids(discovery):
+        url = listing + '/' + request_id
         # rand_proxy = random.randrange(len(PROXIES))
         # proxy = {'http':'http://'+ PROXIES[rand_proxy],'https':'https://'+PROXIES[rand_proxy]}
-        if(j%19 ==0):
-            rand_index = random.randrange(len(randos))
-            requests.get(randos[rand_index])
-        elif(requests.get(url,headers = headers).url != 'https://sandiego.nextrequest.com/requests'):
+        limiter.acquire(url)
+        t0 = time.perf_counter()
+        page = cache.get(session, url, headers=headers)
+        redirected = page.url.rstrip('/') == listing
+        limiter.record(url, status=page.status_code, latency=time.perf_counter() - t0, redirected=redirected,
+                       retry_after=retry_after_seconds(page))
+        if(page.ok and not redirected):
             print(url)
-            req_id, dept, t = get_data(url)
-            ids.append(req_id)
-            depts.append(dept)
-            time_to_close.append(t)
-
-"""
-TODO:
-ids = []
-depts = []
-time_to_close = []
-for url in urls:
-    id, dept, t = get_data(url)
-    ids.append(id)
-    depts.append(dept)
-    time_to_close.append(t)
-result_df = pd.DataFrame(data = {'Request ID': ids,
-                    'Department': depts,
-                    'Time to Close': time_to_close}) 
-
-
-"""
-
-result_df = pd.DataFrame(data = {'Request ID': ids,
-                    'Department': depts,
-                    'Time to Close': time_to_close})
+            batch.append(TimeToCloseRecord(*get_data(url, page=page)))
+    print(cache.report())
+    cache.close()
+
+    return batch.to_pandas()
+
+
+if __name__ == '__main__':
+    result_df = get_time_to_close()
@@ -0,0 +1,67 @@
+"""
+Single-pass parser for the San Diego NextRequest request pages scraped by main.py. The department, every time-quote
+and the request ID are collected in one traversal of the lxml tree, instead of building a BeautifulSoup tree, searching
+it once per field and regex-stripping tags from each element.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from lxml import etree
+from lxml import html as lxml_html
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'steven', 'eda'))
+from nextrequest_time import parse_time
+
+
+# Classes of the elements read from a request page. Checking them while iterating over the tree is about twice as fast
+# as selecting the elements with an XPath class predicate
+FIELD_CLASSES = frozenset(['request-title-text', 'current-department', 'time-quotes'])
+
+
+class SanDiegoRequest(NamedTuple):
+    """
+    Fields of a San Diego request page. Events are listed newest first, so the first time-quote is when the request
+    was closed (or last updated) and the last one when it was opened. time_to_close is None if either time cannot be
+    parsed.
+    """
+    id: str
+    department: str
+    opened: Optional[datetime]
+    closed: Optional[datetime]
+    time_quotes: tuple
+
+    @property
+    def time_to_close(self) -> Optional[timedelta]:
+        if self.opened is None or self.closed is None: return None
+        return self.closed - self.opened
+
+
+def parse_sandiego_page(page, url=''):
+    """
+    Parses a request page, given as HTML bytes or text, into a SanDiegoRequest. The request ID is read from the page
+    title, falling back to the end of url like get_data. Raises ValueError if the page has no department or no
+    time-quotes, e.g. when the portal served another page.
+    """
+    root = lxml_html.fromstring(page)
+    request_id, department, time_quotes = None, None, []
+    for element in root.iter(etree.Element):  # Skips comments and processing instructions
+        classes = element.get('class')
+        if not classes: continue
+        classes = classes.split()
+        if FIELD_CLASSES.isdisjoint(classes): continue
+
+        if 'time-quotes' in classes:
+            time_quotes.append(element.text_content().strip())
+        elif 'current-department' in classes:
+            if department is None: department = element.text_content().strip()
+        elif request_id is None:  # "Request #21-1234"
+            title = element.text_content().split()
+            request_id = title[1].lstrip('#') if len(title) > 1 else None
+
+    if department is None or not time_quotes:
+        raise ValueError('Could not find the department and time-quotes of request page {}'.format(url))
+    return SanDiegoRequest(id=request_id or url[-7:], department=department, opened=parse_time(time_quotes[-1]),
+                           closed=parse_time(time_quotes[0]), time_quotes=tuple(time_quotes))
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of the San Diego page parser against the BeautifulSoup and regex extraction main.py used before, on
+recorded request pages (one <request ID>.html file per request) or on generated mock pages.
+
+Usage: python sandiego_parser_bench.py [--pages DIR] [--requests N] [--repeat N]
+"""
+
+import argparse
+import os
+import re
+import sys
+from timeit import default_timer as timer
+
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'steven', 'eda'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'steven', 'scraper'))
+from nextrequest_time import parse_time
+from nextrequest_bench import load_recorded_pages, make_bench_corpus
+from sandiego_parser import parse_sandiego_page
+
+
+def get_data_bs4(url, content):
+    """
+    The extraction of get_data in main.py before the single-pass parser, kept as the baseline
+    """
+    def cleanhtml(raw_html):
+        cleanr = re.compile('<.*?>')
+        cleantext = re.sub(cleanr, '', raw_html)
+        return cleantext
+
+    ids = url[-7:]
+    soup = BeautifulSoup(content, 'html.parser')
+    dept = soup.find_all(class_="current-department")
+    depts = cleanhtml(str(dept[0])).strip()
+
+    times = soup.find_all(class_="time-quotes")
+
+    creation = cleanhtml(str(times[0])).strip()
+    closing = cleanhtml(str(times[-1])).strip()
+
+    doj_creation = parse_time(creation)
+    doj_closing = parse_time(closing)
+    if doj_creation is None or doj_closing is None:
+        return ids, depts, None
+    return ids, depts, doj_creation - doj_closing
+
+
+def get_data_lxml(url, content):
+    request = parse_sandiego_page(content, url=url)
+    return request.id, request.department, request.time_to_close
+
+
+def bench_parser(parse, pages, repeat=3):
+    """
+    Mean seconds per page to parse every page with parse(url, content), and the results of the last pass
+    """
+    start = timer()
+    for _ in range(repeat):
+        results = [parse(url, content) for url, content in pages]
+    return (timer() - start) / (repeat * len(pages)), results
+
+
+def mismatches(baseline, results):
+    """
+    Pages whose department or time to close differ between the two parsers. Request IDs are compared separately, since
+    the old extraction took the last 7 characters of the URL, which is wrong for IDs of another length.
+    """
+    return [(old, new) for old, new in zip(baseline, results) if old[1:] != new[1:]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the San Diego request page parsers')
+    parser.add_argument('--pages', help='Directory of recorded <request ID>.html pages, instead of generated pages')
+    parser.add_argument('--requests', type=int, default=500, help='Number of generated request pages')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the pages')
+    args = parser.parse_args()
+
+    corpus = load_recorded_pages(args.pages) if args.pages else make_bench_corpus(args.requests)
+    pages = [('https://sandiego.nextrequest.com/requests/' + request_id, html.encode('utf-8'))
+             for request_id, html in corpus.items()]
+
+    old_time, old_results = bench_parser(get_data_bs4, pages, repeat=args.repeat)
+    new_time, new_results = bench_parser(get_data_lxml, pages, repeat=args.repeat)
+    print('{:d} pages, {:.1f}KB on average'.format(len(pages), sum(len(c) for _, c in pages) / len(pages) / 1e3))
+    print('BeautifulSoup + regex: {:.1f}us per page'.format(old_time * 1e6))
+    print('lxml single pass:      {:.1f}us per page ({:.1f}x faster)'.format(new_time * 1e6, old_time / new_time))
+    print('{:d} request IDs differ from the last 7 characters of the URL'.format(
+        sum(old[0] != new[0] for old, new in zip(old_results, new_results))))
+    different = mismatches(old_results, new_results)
+    print('{:d} pages parsed differently{}'.format(len(different), ', e.g. {}'.format(different[:3]) if different
+                                                  else ''))
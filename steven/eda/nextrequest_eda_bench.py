@@ -0,0 +1,148 @@
+"""
+Benchmarks for the NextRequest EDA functions on synthetic data shaped like the scraped requests.
+
+Usage: python nextrequest_eda_bench.py [clean] [times] [--requests N] [--processes 1 2 4] [--functions clean clean_bulk]
+                                      [--times N]
+"""
+
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+from timeit import default_timer as timer
+
+import pandas as pd
+
+from nextrequest_eda_utils import *
+from nextrequest_time import parse_time
+
+
+DEPTS = ['Police Department', 'City Clerk’s Office', 'Code Enforcement', 'Fire Department', 'City Attorney',
+         'Public Works', 'All Other Departments']
+STAFF = ['Dawn Abrahamson, City Clerk', 'Livian Ellis, Secretary', 'Staff']
+
+
+def format_time(t):
+    """
+    Format a datetime like the time strings on NextRequest request pages, e.g. April 8, 2019, 10:36am
+    """
+    return '{} {}, {}, {}:{:02d}{}'.format(t.strftime('%B'), t.day, t.year, (t.hour - 1) % 12 + 1, t.minute,
+                                          'am' if t.hour < 12 else 'pm')
+
+
+def make_synthetic_requests(n, seed=0):
+    """
+    Generate a DataFrame of n requests with the same columns and embedded docs/msgs CSVs as the scraper output
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        opened = datetime(2016, 1, 1) + timedelta(minutes=rng.randrange(6 * 365 * 24 * 60))
+        closed = opened + timedelta(minutes=rng.randrange(60 * 24 * 60))
+        depts = ', '.join(rng.sample(DEPTS, rng.choice([1, 1, 1, 2, 3])))
+        num_docs = rng.choice([0, 0, 1, 2, 5])
+        docs = [('document_{}.pdf'.format(j), 'https://vallejo.nextrequest.com/documents/{}'.format(i * 10 + j))
+                for j in range(num_docs)]
+
+        msgs = [('Request Closed\nPublic', 'Records Request Granted in its Entirety',
+                 format_time(closed) + ' by ' + rng.choice(STAFF))]
+        if docs:
+            msgs.append(('Document(s) Released\nPublic', '\n'.join(title for title, _ in docs),
+                         format_time(closed - timedelta(minutes=5)) + ' by ' + rng.choice(STAFF)))
+        published = format_time(opened + timedelta(hours=1)) + ' by ' + rng.choice(STAFF)
+        msgs += [('Request Published\nPublic', '', published),
+                 ('Department Assignment\nPublic', depts, published),
+                 ('Request Opened\nPublic', 'Request received via web', format_time(opened))]
+
+        rows.append({
+            'id': '{}-{}'.format(opened.year % 100, i + 1),
+            'status': 'CLOSED',
+            'desc': 'Synthetic request {} '.format(i) * rng.randrange(1, 20),
+            'date': '{} {}, {} via web'.format(opened.strftime('%B'), opened.day, opened.year),
+            'depts': depts,
+            'docs': pd.DataFrame(docs, columns=['title', 'link']).to_csv(index=False) if docs else None,
+            'poc': rng.choice(STAFF),
+            'msgs': pd.DataFrame(msgs, columns=['title', 'item', 'time']).to_csv(index=False)
+        })
+    return pd.DataFrame(rows)
+
+
+def bench_clean(num_requests, processes_list, functions=('clean', 'clean_bulk')):
+    """
+    Time nextrequest_df_clean and nextrequest_df_clean_bulk against their parallel versions for several pool sizes.
+    The single-process run is always included, since it is the baseline of the speedup.
+    """
+    df = make_synthetic_requests(num_requests)
+    results = []
+
+    for name in functions:
+        for processes in sorted(set(processes_list) | {1}):
+            start = timer()
+            nextrequest_df_clean_parallel(df.copy(), processes=processes, min_rows=0, bulk=(name == 'clean_bulk'))
+            results.append({'function': name, 'processes': processes, 'seconds': timer() - start})
+
+    results = pd.DataFrame(results)
+    serial = results[results['processes'] == 1].set_index('function')['seconds']
+    results['speedup'] = results['function'].map(serial) / results['seconds']
+    return results
+
+
+def make_synthetic_times(n, seed=0):
+    """
+    Generate n message time strings, e.g. April 8, 2019, 10:36am, with the minute resolution and spread of real scrapes
+    """
+    rng = random.Random(seed)
+    start = datetime(2016, 1, 1)
+    return pd.Series([format_time(start + timedelta(minutes=rng.randrange(6 * 365 * 24 * 60))) for _ in range(n)],
+                     dtype=object)
+
+
+def inferred_to_datetime(times):
+    """
+    The previous conversion: pd.to_datetime with an inferred format, falling back to per-string inference when the
+    inferred format does not fit every string (e.g. am inferred from the first string and pm times later)
+    """
+    try:
+        return pd.to_datetime(times)
+    except (ValueError, TypeError):
+        return pd.to_datetime(times, format='mixed')
+
+
+def bench_times(num_times):
+    """
+    Time the inferred-format pd.to_datetime conversion against parse_times on num_times time strings, with mostly
+    distinct strings and with strings repeated as in the time-quotes of a scrape
+    """
+    distinct = make_synthetic_times(num_times)
+    repeated = distinct.iloc[:num_times // 20].sample(num_times, replace=True, random_state=0).reset_index(drop=True)
+    results = []
+
+    for data, times in [('distinct', distinct), ('repeated', repeated)]:
+        expected = None
+        for name, function in [('inferred', inferred_to_datetime), ('parse_times', parse_times)]:
+            parse_time.cache_clear()
+            start = timer()
+            parsed = function(times)
+            seconds = timer() - start
+            if expected is None: expected = parsed
+            results.append({'data': data, 'function': name, 'seconds': seconds, 'strings/s': len(times) / seconds,
+                            'matches': bool((parsed == expected).all())})
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('benchmarks', nargs='*', default=['clean'])
+    parser.add_argument('--requests', type=int, default=5000, help='Number of synthetic requests')
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}), help='Process pool sizes to compare')
+    parser.add_argument('--functions', nargs='+', default=['clean', 'clean_bulk'], choices=['clean', 'clean_bulk'],
+                        help='Cleaning functions to benchmark')
+    parser.add_argument('--times', type=int, default=1000000, help='Number of time strings')
+    args = parser.parse_args()
+
+    if 'clean' in args.benchmarks:
+        print(bench_clean(args.requests, args.processes, functions=args.functions).to_string(index=False))
+    if 'times' in args.benchmarks:
+        print(bench_times(args.times).to_string(index=False))
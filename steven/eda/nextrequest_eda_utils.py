@@ -1,9 +1,22 @@
 """
 Functions useful for performing EDA on data scraped by the NextRequest webscraper.
 """
+import csv
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 from io import StringIO
 
+from nextrequest_time import parse_times
+
+try:  # Used to report peak memory, not available on Windows
+    import resource
+except ImportError:
+    resource = None
+
 
 def nextrequest_df_clean(df, debug=False):
     """
@@ -40,6 +53,113 @@ def nextrequest_df_clean(df, debug=False):
     return df
 
 
+def nextrequest_df_clean_bulk(df, views=True, debug=False):
+    """
+    Bulk version of nextrequest_df_clean. The docs and msgs CSV columns are parsed in one pass into long-format
+    DataFrames keyed by request ID (see docs_long and msgs_long), and message times are split and converted once over
+    the whole column. Returns the cleaned DataFrame and the long-format docs and msgs DataFrames. If views is set, the
+    per-row docs_df and msgs_df columns of nextrequest_df_clean are also built from the long-format DataFrames.
+    """
+    df = df_fillna(df)
+    if debug: print('fillna complete')
+
+    docs = docs_long(df)
+    if debug: print('docs long format complete')
+
+    msgs = msgs_long(df)
+    if debug: print('msgs long format complete')
+
+    if views:
+        df['docs_df'] = long_to_views(docs, df.index)
+        df['msgs_df'] = long_to_views(msgs, df.index)
+        if debug: print('docs_df and msgs_df views complete')
+
+    df = convert_time_to_dt(extract_time(df, col='date', on='via',
+                                         re=True, pattern=r'([a-zA-Z]* \d{1,2}, \d{,5}) ([a-zA-Z ]*)'),
+                            col='date')
+    if debug: print('date-via split complete')
+
+    return df, docs, msgs
+
+
+def csv_column_to_long(df, col, columns):
+    """
+    Parse a column of CSV strings into one long DataFrame with a row for each CSV row, keyed by the index ('row') and
+    ID of the request it came from
+    """
+    rows, keys, ids = [], [], []
+    for key, request_id, csv_string in zip(df.index, df['id'], df[col]):
+        if not isinstance(csv_string, str) or not csv_string: continue
+        parsed = list(csv.reader(StringIO(csv_string)))[1:]  # Skip the header
+        rows.extend(parsed)
+        keys.extend([key] * len(parsed))
+        ids.extend([request_id] * len(parsed))
+
+    long_df = pd.DataFrame(rows, columns=columns)
+    long_df.insert(0, 'id', pd.array(ids, dtype='string'))
+    long_df.insert(0, 'row', keys)
+    return long_df.astype({column: 'string' for column in columns})
+
+
+def docs_long(df):
+    """
+    Long-format DataFrame of the documents of every request, keyed by request index ('row') and ID
+    """
+    return csv_column_to_long(df, 'docs', ['title', 'link'])
+
+
+def msgs_long(df):
+    """
+    Long-format DataFrame of the messages of every request, keyed by request index ('row') and ID. The time strings
+    are split on ' by ' and converted to datetime once over the whole column.
+    """
+    msgs = csv_column_to_long(df, 'msgs', ['title', 'item', 'time'])
+    time_by = msgs['time'].str.split(' by ', n=1, expand=True).reindex(columns=[0, 1])
+    msgs['time'] = time_by[0].fillna('').astype('string')
+    msgs['by'] = time_by[1].fillna('').astype('string')
+    msgs['time_dt'] = parse_times(msgs['time'])
+    return msgs
+
+
+def long_to_views(long_df, index):
+    """
+    Split a long-format docs or msgs DataFrame back into one DataFrame per request, as in the docs_df and msgs_df
+    columns of nextrequest_df_clean, aligned to the given request index. Requests without rows get a blank string,
+    which is what nextrequest_df_clean's final fillna leaves for them.
+    """
+    long_df = long_df.sort_values('row', kind='stable')
+    keys = long_df['row'].to_numpy()
+    data = long_df.drop(columns=['row', 'id']).reset_index(drop=True)
+
+    # Slice the rows of each request out of the long DataFrame, which is much cheaper than a groupby
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(keys)]
+    views = {keys[start]: data.iloc[start:end].reset_index(drop=True) for start, end in zip(starts, ends)}
+    return pd.Series([views.get(key, '') for key in index], index=index, dtype=object)
+
+
+def nextrequest_df_clean_parallel(df, processes=None, min_rows=2000, bulk=False, debug=False):
+    """
+    Parallel version of nextrequest_df_clean (or of nextrequest_df_clean_bulk if bulk is set). The DataFrame is split
+    into one partition per process, each partition is cleaned in a process pool, and the results are reassembled in
+    the original order. Inputs with fewer than min_rows requests, or a single process, are cleaned serially.
+    """
+    clean = nextrequest_df_clean_bulk if bulk else nextrequest_df_clean
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(df) < min_rows:
+        return clean(df, debug=debug)
+
+    bounds = np.linspace(0, len(df), processes + 1).astype(int)
+    partitions = [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = list(executor.map(clean, partitions))  # map returns results in partition order
+    if debug: print('{} partitions cleaned'.format(len(partitions)))
+
+    if bulk:
+        return tuple(pd.concat([result[i] for result in results], ignore_index=(i > 0)) for i in range(3))
+    return pd.concat(results)
+
+
 def csv_to_df(csv):
     """
     Convert a CSV string into a DataFrame
@@ -83,10 +203,10 @@ def extract_time(df, col='time', on=' by ', re=False, pattern=''):
 
 def convert_time_to_dt(df, col='date'):
     """
-    Convert a column of time strings into datetime
+    Convert a column of time strings into datetime (see nextrequest_time.parse_times)
     """
     if df is None: return None
-    return df.assign(**{col + '_dt': pd.to_datetime(df[col])})
+    return df.assign(**{col + '_dt': parse_times(df[col])})
 
 
 def melt_depts(df):
@@ -107,6 +227,55 @@ def melt_depts(df):
         )
 
 
+def dept_index(df):
+    """
+    Build a compact request -> department mapping of a NextRequest DataFrame: one row for each department of each
+    request, holding only the request index ('row') and the department as a categorical. Unlike melt_depts, none of
+    the other request columns are copied.
+    """
+    depts = df['depts'].fillna('').astype(str).str.split(', ').explode()
+    depts = depts[depts != '']
+    return pd.DataFrame({
+        'row': depts.index.to_numpy(),
+        'dept': pd.Categorical(depts.to_numpy())
+    })
+
+
+def dept_rows(index, dept, search=False):
+    """
+    Indices of the requests assigned to a department. If search is set, dept is a case-insensitive regex matched
+    against the department names instead, e.g. r'police|sheriff'.
+    """
+    categories = index['dept'].cat.categories
+    matches = categories[categories.str.contains(dept, case=False)] if search else [dept]
+    return pd.unique(index.loc[index['dept'].isin(matches), 'row'])
+
+
+def requests_for_dept(df, index, dept, search=False):
+    """
+    Get the requests assigned to a department (see dept_rows)
+    """
+    return df.loc[dept_rows(index, dept, search=search)]
+
+
+def dept_counts(index):
+    """
+    Number of requests assigned to each department
+    """
+    return index['dept'].value_counts()
+
+
+def dept_stats(index, values, stats=('count', 'mean', 'median', 'min', 'max')):
+    """
+    Summary statistics of a per-request Series (e.g. time to close) for each department. values is aligned to the
+    request DataFrame the index was built from.
+    """
+    return pd.DataFrame({
+        'dept': index['dept'],
+        'value': values.reindex(index['row']).to_numpy()
+    }).groupby('dept', observed=True)['value'].agg(list(stats))
+
+
 def get_open_time(msgs):
     """
     Get the request open time from the messages
@@ -130,3 +299,152 @@ def get_close_time(msgs, get_all=False):
     if request_closed.empty: return None
     if get_all: return list(request_closed['time_dt'].to_numpy())
     return request_closed.loc[0]['time_dt']
+
+
+def read_requests_parquet(requests_name, path='data/'):
+    """
+    Read the Parquet tables written by the scraper's ParquetRequestWriter into requests, documents and messages
+    DataFrames. Documents and messages are in long format, keyed by request ID. If a request was scraped more than
+    once, only its latest copy is kept.
+    """
+    requests = pd.read_parquet(path + requests_name + '.parquet')
+    requests = requests[requests['seq'] == requests.groupby('id')['seq'].transform('max')]
+
+    docs = pd.read_parquet(path + requests_name + '_docs.parquet')
+    msgs = pd.read_parquet(path + requests_name + '_msgs.parquet')
+    return tuple(
+        df[df['seq'].isin(requests['seq'])].drop(columns='seq').reset_index(drop=True)
+        for df in (requests, docs, msgs)
+    )
+
+
+def get_request_times(msgs):
+    """
+    Get the open and close times of every request in one pass over a long-format msgs DataFrame (see msgs_long),
+    indexed by request index ('row'). open_time and close_time are the values of get_open_time and get_close_time.
+    Also returns the first and last close times, the publish time, the time to close, the number of times each
+    request was closed and the sorted (event, time) list of all close and reopen cycles.
+    """
+    title = msgs['title']
+    opened = msgs[title.str.contains('Opened')].groupby('row')['time_dt'].min()
+    published = msgs[title.str.contains('Published')].groupby('row')['time_dt'].min()
+    closed = msgs[title.str.contains('Closed')].groupby('row')['time_dt']
+
+    times = pd.DataFrame({
+        'id': msgs.groupby('row')['id'].first(),
+        'opened': opened,
+        'published': published,
+        'first_closed': closed.min(),
+        'last_closed': closed.max(),
+        'num_closed': closed.size()
+    })
+    times['num_closed'] = times['num_closed'].fillna(0).astype(int)
+    times['open_time'] = times['opened'].fillna(times['published'])  # Same fallback as get_open_time
+    times['close_time'] = times['last_closed']
+    times['time_to_close'] = times['close_time'] - times['open_time']
+
+    # Close and reopen events of each request, in chronological order
+    cycles = msgs[title.str.contains('Closed|Reopened')].sort_values(['row', 'time_dt'], kind='stable')
+    cycle_events = pd.Series(np.where(cycles['title'].str.contains('Closed'), 'closed', 'reopened'), index=cycles.index)
+    times['cycles'] = pd.Series(list(zip(cycle_events, cycles['time_dt'])), index=cycles.index).groupby(
+        cycles['row']).agg(list)
+    times['cycles'] = times['cycles'].apply(lambda cycle: cycle if isinstance(cycle, list) else [])
+
+    times.index.name = None
+    return times
+
+
+def check_request_times(df, times):
+    """
+    Compare the open and close times from get_request_times with get_open_time and get_close_time applied to the
+    msgs_df column of a cleaned DataFrame, returning the indices of the requests where they differ
+    """
+    def same(a, b):
+        return (pd.isna(a) and pd.isna(b)) or a == b
+
+    mismatches = []
+    for key, msgs_df in df['msgs_df'].items():
+        if msgs_df is None: continue
+        open_time = times.at[key, 'open_time'] if key in times.index else None
+        close_time = times.at[key, 'close_time'] if key in times.index else None
+        try:
+            expected_open = get_open_time(msgs_df)
+        except KeyError:  # get_open_time fails on requests that were neither opened nor published
+            expected_open = None
+        if not (same(open_time, expected_open) and same(close_time, get_close_time(msgs_df))):
+            mismatches.append(key)
+    return mismatches
+
+
+def iter_requests_zip(filename, chunksize=1000):
+    """
+    Iterate over the requests in a zipped CSV written by the scraper, chunksize requests at a time
+    """
+    with zipfile.ZipFile(filename, 'r') as zf:
+        with zf.open(zf.namelist()[0]) as f:
+            yield from pd.read_csv(f, dtype=str, chunksize=chunksize)
+
+
+def iter_clean_requests_zip(filename, chunksize=1000, debug=False):
+    """
+    Iterate over the requests in a zipped CSV chunk by chunk, cleaning each chunk with nextrequest_df_clean_bulk.
+    Yields the cleaned requests (without the raw docs and msgs columns) and the long-format docs and msgs of each
+    chunk. Request indices ('row') are global across chunks, and kept as a column of the requests so that the docs and
+    msgs can be joined back to them.
+    """
+    for i, chunk in enumerate(iter_requests_zip(filename, chunksize=chunksize)):
+        df, docs, msgs = nextrequest_df_clean_bulk(chunk, views=False)
+        if debug: print('chunk {} cleaned, peak memory {:.0f} MB'.format(i, peak_memory_mb() or 0))
+        yield df.drop(columns=['docs', 'msgs']).rename_axis('row').reset_index(), docs, msgs
+
+
+# Columns of the Parquet tables written by clean_requests_zip, by table suffix. Every chunk is written with these
+# types, rather than the types inferred from the first chunk, since a chunk can have columns that are entirely empty
+CLEAN_COLUMNS = {
+    '': [('row', 'int64'), ('id', 'string'), ('status', 'string'), ('desc', 'string'), ('depts', 'string'),
+         ('poc', 'string'), ('date', 'string'), ('via', 'string'), ('date_dt', 'timestamp')],
+    '_docs': [('row', 'int64'), ('id', 'string'), ('title', 'string'), ('link', 'string')],
+    '_msgs': [('row', 'int64'), ('id', 'string'), ('title', 'string'), ('item', 'string'), ('time', 'string'),
+              ('by', 'string'), ('time_dt', 'timestamp')]
+}
+
+
+def clean_requests_zip(filename, requests_name, path='data/', chunksize=1000, debug=False):
+    """
+    Clean a zipped CSV written by the scraper chunk by chunk, appending the cleaned requests and their long-format docs
+    and msgs to the Parquet tables <path><requests_name>_clean(_docs|_msgs).parquet, so that memory use is bounded by
+    chunksize rather than by the size of the archive. Returns the number of requests cleaned and the peak memory in MB.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {'int64': pa.int64(), 'string': pa.string(), 'timestamp': pa.timestamp('ns')}
+    schemas = {suffix: pa.schema([(name, types[type_name]) for name, type_name in columns])
+               for suffix, columns in CLEAN_COLUMNS.items()}
+    writers = {}
+    num_requests = 0
+    try:
+        for tables in iter_clean_requests_zip(filename, chunksize=chunksize, debug=debug):
+            for suffix, table in zip(['', '_docs', '_msgs'], tables):
+                schema = schemas[suffix]
+                if suffix not in writers:
+                    writers[suffix] = pq.ParquetWriter(path + requests_name + '_clean' + suffix + '.parquet', schema)
+                writers[suffix].write_table(pa.Table.from_pandas(table[schema.names], schema=schema,
+                                                                 preserve_index=False))
+            num_requests += len(tables[0])
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    peak = peak_memory_mb()
+    if debug: print('{} requests cleaned, peak memory {:.0f} MB'.format(num_requests, peak or 0))
+    return num_requests, peak
+
+
+def peak_memory_mb():
+    """
+    Peak resident memory of the current process in MB, or None if it cannot be measured
+    """
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # Bytes on macOS, KB elsewhere
@@ -0,0 +1,75 @@
+"""
+Format-aware parsing of the time strings found on NextRequest pages: request dates such as "April 5, 2016 via web"
+and event time-quotes such as "April 18, 2022, 8:39am by Staff".
+"""
+
+import re
+import warnings
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+MONTHS = {name.lower(): number for number, name in enumerate(
+    ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November',
+     'December'], start=1)}
+MONTHS.update({name[:3]: number for name, number in list(MONTHS.items())})
+MONTHS['sept'] = 9
+
+# Month day, year, optionally followed by a 12-hour time, a timezone suffix (an abbreviation such as PDT or a UTC
+# offset) and the " by <user>" or " via <channel>" part of the string, which is ignored
+TIME_PATTERN = re.compile(r'''
+    \s*(?P<month>[A-Za-z]+)\.?\s+(?P<day>\d{1,2}),?\s+(?P<year>\d{4})
+    (?:,?\s+(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?\s*(?P<ampm>[AaPp])\.?[Mm]\.?)?
+    (?:\s+(?P<tz>[A-Z]{2,5}|[+-]\d{2}:?\d{2}|Z))?
+    (?:\s+(?:by|via)\b.*)?\s*$
+    ''', re.VERBOSE | re.DOTALL)
+
+
+@lru_cache(maxsize=2 ** 16)
+def parse_time(time_string):
+    """
+    Parse a NextRequest date or time-quote string into a naive datetime, or None if it cannot be parsed. Times are
+    the wall-clock times shown on the portal: a timezone suffix is accepted but not applied, since every time on a
+    portal is in the same zone. Results are cached, as the same strings recur across a scrape.
+    """
+    if not isinstance(time_string, str): return None
+    match = TIME_PATTERN.fullmatch(time_string)
+    if match is None: return None
+
+    month = MONTHS.get(match['month'].lower())
+    if month is None: return None
+    hour = minute = second = 0
+    if match['hour'] is not None:
+        hour, minute = int(match['hour']), int(match['minute'])
+        if not 1 <= hour <= 12: return None
+        hour = hour % 12 + (12 if match['ampm'] in 'Pp' else 0)  # 12am is midnight and 12pm is noon
+        second = int(match['second'] or 0)
+    try:
+        return datetime(int(match['year']), month, int(match['day']), hour, minute, second)
+    except ValueError:  # E.g. February 30
+        return None
+
+
+def parse_times(times, unparseable=None):
+    """
+    Convert a column of NextRequest time strings into datetime, parsing each distinct string only once. Strings that
+    cannot be parsed become NaT instead of raising; the distinct non-empty ones are appended to the unparseable list if
+    one is given, and otherwise reported in a warning.
+    """
+    times = pd.Series(times)
+    codes, uniques = pd.factorize(times)
+    parsed = [parse_time(time_string) for time_string in uniques]
+
+    failed = [time_string for time_string, dt in zip(uniques, parsed)
+              if dt is None and isinstance(time_string, str) and time_string.strip()]
+    if unparseable is not None:
+        unparseable.extend(failed)
+    elif failed:
+        warnings.warn('{} time strings could not be parsed, e.g. {}'.format(len(failed), failed[:5]), stacklevel=2)
+
+    values = np.array([np.datetime64(dt, 'ns') if dt is not None else np.datetime64('NaT', 'ns') for dt in parsed]
+                      + [np.datetime64('NaT', 'ns')], dtype='datetime64[ns]')
+    return pd.Series(values[codes], index=times.index, name=times.name)  # Code -1 (missing) picks the trailing NaT
@@ -0,0 +1,239 @@
+"""
+Content-addressed archive of the raw request pages fetched by the NextRequest scraper, so that the extraction can be
+re-run offline after a change instead of re-scraping the portal. Each distinct page is stored once, compressed, under
+the SHA-256 hash of its content, and an index maps every request ID and page URL to the hashes of the versions fetched.
+reparse_archive rebuilds the requests table from the archive using every core.
+
+Usage: python nextrequest_archive.py ARCHIVE_DB [--output REQUESTS_DB] [--processes N]
+"""
+
+import argparse
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+from urllib.parse import urlparse
+
+from nextrequest_scraper_utils import *
+
+try:  # Compresses better and faster than gzip, but is optional
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CODECS = ('zstd', 'gzip')
+
+# Per-session tokens that differ on every fetch of an otherwise unchanged page, removed before hashing
+VOLATILE_RE = re.compile(r'<meta[^>]+name="csrf-(?:token|param)"[^>]*>|'
+                         r'<input[^>]+name="authenticity_token"[^>]*>')
+
+
+def normalize_page(page):
+    """
+    Removes the per-session tokens from a page, so that unchanged pages have the same hash
+    """
+    return VOLATILE_RE.sub('', page)
+
+
+def url_request_id(url):
+    """
+    Request ID of a request page URL, e.g. 21-1234 for https://lacity.nextrequest.com/requests/21-1234?page=2
+    """
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+class PageArchive:
+    """
+    Archive of request pages backed by SQLite. put stores a fetched page, skipping the write if it is the same as the
+    last version archived for its URL; pages with the same content are stored once, whatever their URL. Pages are
+    compressed with zstd if the zstandard package is installed, and gzip otherwise. Safe to share between threads.
+    """
+
+    def __init__(self, filename, compression=None, level=None):
+        compression = compression or ('zstd' if zstandard is not None else 'gzip')
+        if compression not in CODECS:
+            raise ValueError('Unknown compression {}, expected one of {}'.format(compression, CODECS))
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compression requires the zstandard package')
+        self.filename = filename
+        self.compression = compression
+        self.level = level
+        self.lock = threading.Lock()  # The connection is shared between scraper threads
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages (hash TEXT PRIMARY KEY, codec TEXT, size INTEGER, '
+                          'data BLOB)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS page_index (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT, '
+                          'url TEXT, hash TEXT, fetched REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS page_index_id ON page_index (id, url)')
+        self.conn.commit()
+        self.latest = dict(self.query('SELECT url, hash FROM page_index WHERE seq IN '
+                                      '(SELECT MAX(seq) FROM page_index GROUP BY url)'))  # URL -> last hash
+        self.stats = dict.fromkeys(['stored', 'deduplicated', 'unchanged'], 0)
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def compress(self, data):
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level or 3).compress(data)
+        return gzip.compress(data, compresslevel=self.level or 6)
+
+    @staticmethod
+    def decompress(codec, data):
+        if codec == 'zstd':
+            if zstandard is None: raise ImportError('Reading zstd pages requires the zstandard package')
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def put(self, url, page, request_id=None):
+        """
+        Archives the page fetched from url, returning its hash. The request ID is read from the URL if not given.
+        """
+        data = normalize_page(page).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if self.latest.get(url) == digest:
+            self.stats['unchanged'] += 1
+            return digest
+
+        request_id = request_id or url_request_id(url)
+        with self.lock:
+            exists = self.conn.execute('SELECT 1 FROM pages WHERE hash = ?', (digest,)).fetchone()
+            if not exists:  # Compressed under the lock, which is cheap next to fetching the page
+                self.conn.execute('INSERT INTO pages VALUES (?, ?, ?, ?)',
+                                  (digest, self.compression, len(data), self.compress(data)))
+            self.conn.execute('INSERT INTO page_index (id, url, hash, fetched) VALUES (?, ?, ?, ?)',
+                              (request_id, url, digest, time.time()))
+            self.conn.commit()
+            self.latest[url] = digest
+            self.stats['deduplicated' if exists else 'stored'] += 1
+        return digest
+
+    def get(self, digest):
+        """
+        Page with the given hash
+        """
+        rows = self.query('SELECT codec, data FROM pages WHERE hash = ?', (digest,))
+        if not rows: raise KeyError(digest)
+        return self.decompress(*rows[0]).decode('utf-8')
+
+    def request_ids(self):
+        return [row[0] for row in self.query('SELECT DISTINCT id FROM page_index ORDER BY id')]
+
+    def request_pages(self, request_id):
+        """
+        List of (url, page) of the latest version of every page archived for a request: the request page, then the
+        further pages of its document list in page order
+        """
+        from nextrequest_html import page_order
+
+        rows = self.query('SELECT url, hash FROM page_index WHERE seq IN '
+                          '(SELECT MAX(seq) FROM page_index WHERE id = ? GROUP BY url)', (request_id,))
+        rows.sort(key=lambda row: (bool(urlparse(row[0]).query), page_order(row[0])))
+        return [(url, self.get(digest)) for url, digest in rows]
+
+    def summary(self):
+        """
+        Counts of requests, archived page versions and distinct pages, with their raw and compressed sizes in bytes
+        """
+        requests, versions = self.query('SELECT COUNT(DISTINCT id), COUNT(*) FROM page_index')[0]
+        pages, raw, compressed = self.query('SELECT COUNT(*), SUM(size), SUM(LENGTH(data)) FROM pages')[0]
+        return {'requests': requests, 'versions': versions, 'pages': pages, 'raw_bytes': raw or 0,
+                'compressed_bytes': compressed or 0, **self.stats}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_archived_request(pages):
+    """
+    Parses the archived pages of a request, as returned by PageArchive.request_pages, into a row identical to the one
+    appended by NextRequestScraper.scrape_request, with the documents of every archived document list page
+    """
+    # Imported here so that opening an archive, e.g. to store pages or for a summary, does not need lxml or requests
+    from lxml import html as lxml_html
+    from nextrequest_html import parse_request_page, find_element, document_links, unique_documents
+
+    (url, page), *doc_pages = pages
+    root = lxml_html.fromstring(page)
+    row = parse_request_page(root, base_url=url)
+    if doc_pages and row['docs'] is not None:
+        docs = document_links(find_element(root, 'document-list'), base_url=url)
+        for doc_url, doc_page in doc_pages:
+            doc_root = lxml_html.fromstring(doc_page)
+            doc_lists = doc_root.find_class('document-list')
+            docs.extend(document_links(doc_lists[0] if doc_lists else doc_root, base_url=doc_url))
+        docs = unique_documents(docs)
+        row['docs'] = docs_to_csv([title for title, _ in docs], [link for _, link in docs])
+    return row
+
+
+def reparse_chunk(filename, request_ids):
+    """
+    Parses the archived pages of the given request IDs, returning the rows and the IDs that could not be parsed
+    """
+    rows, errors = [], []
+    with PageArchive(filename) as archive:
+        for request_id in request_ids:
+            try:
+                rows.append(parse_archived_request(archive.request_pages(request_id)))
+            except Exception as e:
+                errors.append((request_id, type(e).__name__))
+    return rows, errors
+
+
+def reparse_archive(filename, requests, processes=None, chunksize=500, log=''):
+    """
+    Rebuilds the requests table from the archive at filename, appending a row for every archived request to requests
+    (a list or CheckpointStore) in request ID order. Chunks of requests are parsed in a process pool. Returns the list
+    of (request ID, exception type) of the requests that could not be parsed.
+    """
+    start = timer()
+    with PageArchive(filename) as archive:
+        ids = archive.request_ids()
+    chunks = [ids[i:i + chunksize] for i in range(0, len(ids), chunksize)]
+    processes = processes or os.cpu_count() or 1
+
+    errors = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for rows, chunk_errors in executor.map(reparse_chunk, [filename] * len(chunks), chunks):
+            for row in rows:
+                requests.append(row)
+            errors.extend(chunk_errors)
+
+    log_msg('Reparsed {:d} requests ({:d} errors) in {:.1f}s\n'.format(len(ids) - len(errors), len(errors),
+                                                                       timer() - start), log=log)
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild a NextRequest requests table from a page archive')
+    parser.add_argument('archive', help='Page archive database written by NextRequestScraper')
+    parser.add_argument('--output', help='CheckpointStore database to write the requests to, instead of a summary')
+    parser.add_argument('--processes', type=int, help='Number of parsing processes (default: all cores)')
+    args = parser.parse_args()
+
+    with PageArchive(args.archive) as archive:
+        print(archive.summary())
+    if args.output:
+        from nextrequest_checkpoint import CheckpointStore
+
+        store = CheckpointStore(args.output)
+        try:
+            reparse_archive(args.archive, store, processes=args.processes)
+        finally:
+            store.close()
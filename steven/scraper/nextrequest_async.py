@@ -0,0 +1,158 @@
+"""
+Concurrent scraping of NextRequest request pages by ID. Pages are fetched by a bounded pool of asyncio workers sharing
+one HTTP connection pool, with a per-host token bucket in place of fixed sleeps between requests.
+"""
+
+import asyncio
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+from lxml import html as lxml_html
+
+from nextrequest_scraper_utils import *
+from nextrequest_html import fetch_request_page, parse_request_page, parse_request_summary, parse_time_quotes
+from nextrequest_rate import HostRateLimiter
+from nextrequest_incremental import incremental_action, is_closed, INCREMENTAL_ACTIONS
+from nextrequest_timing import TimingLog
+
+
+def request_ids(prefix, start, end):
+    """
+    Generates the request IDs prefix-start, ..., prefix-end, e.g. request_ids('21', 1, 3) gives 21-1, 21-2, 21-3
+    """
+    for number in range(start, end + 1):
+        yield '{}-{}'.format(prefix, number)
+
+
+def expand_id_ranges(ranges):
+    """
+    Generates the request IDs of a list of (prefix, start, end) ranges, e.g. one range per year
+    """
+    for prefix, start, end in ranges:
+        yield from request_ids(prefix, start, end)
+
+
+def run_async(coro):
+    """
+    Runs a coroutine to completion. Jupyter already runs an event loop in the main thread, in which case the
+    coroutine is run on its own loop in a separate thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    result = {}
+
+    def target():
+        try:
+            result['value'] = asyncio.run(coro)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if 'error' in result: raise result['error']
+    return result['value']
+
+
+async def scrape_ids_async(requests, url, ids, session, concurrency=10, limiter=None, progress=100, debug=0,
+                           log='', previous=None, timings=None, retry_queue=None, archive=None, cache=None):
+    """
+    Scrapes the given request IDs from the portal at url with at most `concurrency` requests in flight, appending each
+    scraped row to the given list. IDs that redirect to the request listing are counted as missing. If previous is
+    given (see load_previous_requests), requests closed in it are not fetched and unchanged requests are not fully
+    parsed. Returns a dict of run statistics, including the throughput in requests per second. Per-request timings of
+    the fetch ('navigation') and parse phases are recorded to timings, if given a TimingLog. Requests that fail are
+    pushed to retry_queue, if given a RetryQueue, and marked done there once scraped or found missing. Fetched pages
+    are stored in archive, if given a PageArchive. If given a PageCache, pages are fetched with conditional requests
+    and the rows of unmodified pages are reused without parsing them.
+    """
+    limiter = limiter if limiter is not None else HostRateLimiter(0)
+    timings = timings if timings is not None else TimingLog()
+    loop = asyncio.get_running_loop()
+    ids = iter(ids)  # Shared between workers. Safe, since workers only advance it from the event loop thread
+    stats = {'scraped': 0, 'missing': 0, 'errors': 0, **dict.fromkeys(INCREMENTAL_ACTIONS, 0)}
+    start = timer()
+
+    def fetch_and_parse(request_url, previous_row, timing):
+        """
+        Fetches and parses a request page, returning the incremental action taken (None if not incremental) and the
+        row, or None if the request does not exist
+        """
+        with timing.phase('navigation'):
+            page = fetch_request_page(session, request_url, limiter=limiter, cache=cache)
+        if page is None: return None
+        cached_row = cache.result(request_url) if cache is not None else None
+        if archive is not None:
+            with timing.phase('archive'):
+                archive.put(request_url, page)
+
+        if previous is None and cached_row is not None:  # Unmodified page, not parsed again
+            return None, cached_row
+
+        with timing.phase('parse'):
+            root = lxml_html.fromstring(page)
+            if previous is None:
+                return None, parse_row(root, request_url)
+
+            _, status = parse_request_summary(root)
+            action = incremental_action(previous_row, status, lambda: parse_time_quotes(root))
+            return action, previous_row if action == 'skipped' else cached_row or parse_row(root, request_url)
+
+    def parse_row(root, request_url):
+        row = parse_request_page(root, base_url=request_url, session=session, limiter=limiter, archive=archive)
+        if cache is not None: cache.set_result(request_url, row)
+        return row
+
+    async def worker():
+        for request_id in ids:
+            request_url = url + request_id
+            previous_row = previous.get(request_id) if previous is not None else None
+            if is_closed(previous_row):  # Closed requests do not change, so they are not fetched again
+                requests.append(previous_row)
+                stats['skipped'] += 1
+                if retry_queue is not None: retry_queue.done(request_id)  # Otherwise it stays due forever
+                continue
+
+            delay = limiter.reserve(request_url)
+            if delay > 0: await asyncio.sleep(delay)
+
+            timing = timings.request(request_id)
+            try:
+                result = await loop.run_in_executor(executor, fetch_and_parse, request_url, previous_row, timing)
+            except Exception as e:
+                timing.set_error(type(e))
+                timing.finish()
+                stats['errors'] += 1
+                if retry_queue is not None: retry_queue.push(request_id, e)
+                log_msg('Exception occurred while scraping request ID {}\n{}\n'.format(request_id,
+                                                                                     traceback.format_exc()), log=log)
+                continue
+
+            timing.finish(outcome='missing' if result is None else (result[0] or 'scraped'))
+            if retry_queue is not None: retry_queue.done(request_id)
+            if result is None:
+                stats['missing'] += 1
+                if debug: log_msg('{} not found\n'.format(request_id), log=log)
+                continue
+
+            action, row = result
+            if action: stats[action] += 1
+            requests.append(row)
+            stats['scraped'] += 1
+            if debug: log_msg('{} scraped\n'.format(request_id), log=log)
+            if progress and (stats['scraped'] % progress == 0):
+                log_msg(scraper_throughput(stats['scraped'], start, end=timer()), log=log)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    stats['runtime'] = timer() - start
+    stats['throughput'] = stats['scraped'] / stats['runtime'] if stats['runtime'] else 0.0
+    if progress:
+        log_msg(scraper_throughput_final(stats), log=log)
+    return stats
@@ -0,0 +1,257 @@
+"""
+Benchmark harness for the NextRequest scraper. A corpus of request pages, either recorded from a portal or generated,
+is served by a local MockPortal with injected latency, and each backend is measured on it: throughput in requests per
+second, per-request latency percentiles and the time spent extracting each field. Results are saved as JSON so that
+runs can be compared with each other.
+
+Usage: python nextrequest_bench.py [--pages DIR] [--requests N] [--latency S] [--backends html selenium]
+                                   [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+from datetime import datetime
+from timeit import default_timer as timer
+
+import numpy as np
+from lxml import html as lxml_html
+
+from nextrequest_scraper_utils import *
+from nextrequest_html import make_session, find_element, element_text, parse_document_list, parse_events, \
+    parse_request_summary
+from nextrequest_mock_portal import MockPortal, render_request_page
+
+
+# Extractors timed by field_timings, each taking a parsed request page
+FIELD_EXTRACTORS = {
+    'summary': parse_request_summary,
+    'desc': lambda root: element_text(find_element(root, 'request-text').get_element_by_id('request-text', None)),
+    'date': lambda root: element_text(find_element(root, 'request_date')),
+    'depts': lambda root: element_text(find_element(root, 'current-department')),
+    'docs': parse_document_list,
+    'poc': lambda root: element_text(find_element(root, 'request-detail')),
+    'msgs': parse_events
+}
+
+# Metrics compared between runs, with whether higher is better
+COMPARED_METRICS = {'throughput': True, 'p50': False, 'p95': False, 'mean': False}
+
+
+def load_recorded_pages(path):
+    """
+    Loads request pages saved from a portal, one <request ID>.html file per request, into a dict of request ID -> HTML.
+    The pages are served as they were recorded, so their js-next-request links should point to other recorded pages.
+    """
+    pages = {}
+    for filename in sorted(glob.glob(os.path.join(path, '*.html'))):
+        with open(filename, encoding='utf-8') as f:
+            pages[os.path.splitext(os.path.basename(filename))[0]] = f.read()
+    return pages
+
+
+def make_bench_corpus(n, seed=0):
+    """
+    Generates n request pages whose shape varies like a real portal: from a single event to long message histories,
+    no documents to many documents in folders, and short descriptions to long ones collapsed behind "Read more"
+    """
+    rng = random.Random(seed)
+    ids = ['{}-{}'.format(19 + i % 3, i + 1) for i in range(n)]
+    pages = {}
+    for i, request_id in enumerate(ids):
+        num_events = rng.choice([1, 2, 3, 4, 5, 8, 12, 25, 60])
+        events = [('Request Closed', 'Request completed.', 'April 8, 2019, 10:36am by Staff')]
+        events += [('Note', 'Note number {}\nSecond line of the note'.format(j),
+                    'April 7, 2019, {}:{:02d}pm by Staff'.format(1 + j % 11, j % 60))
+                   for j in range(max(num_events - 2, 0))]
+        events += [('Request Opened', 'Request received via web', 'April 6, 2019, 8:59am')]
+
+        num_docs = rng.choice([0, 0, 0, 1, 2, 5, 20])
+        docs = [('document_{}.pdf'.format(j), '/documents/{}-{}'.format(i, j)) for j in range(num_docs)]
+        folders = []
+        if num_docs and rng.random() < 0.3:  # Move some documents into folders
+            folders = [('Folder {}'.format(k), docs[k::3]) for k in range(min(3, num_docs))]
+            docs = []
+
+        read_more = rng.random() < 0.25
+        desc = 'Request {} description. '.format(request_id) * (rng.randrange(40, 200) if read_more else
+                                                              rng.randrange(1, 10))
+        pages[request_id] = render_request_page(request_id, status=rng.choice(['Closed', 'Closed', 'Open']),
+                                                desc=desc, date='April 6, 2019 via web', depts='Police Department',
+                                                docs=docs, folders=folders, read_more=read_more,
+                                                events=events[:num_events],
+                                                next_id=ids[i + 1] if i + 1 < len(ids) else None)
+    return pages
+
+
+def latency_stats(latencies):
+    """
+    Summary statistics of per-request latencies in seconds
+    """
+    if not len(latencies): return {'count': 0}
+    latencies = np.asarray(latencies)
+    return {'count': int(len(latencies)), 'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)), 'p95': float(np.percentile(latencies, 95)),
+            'max': float(latencies.max())}
+
+
+def field_timings(pages, repeat=3):
+    """
+    Mean time in seconds to extract each field from a request page with the HTML backend, including parsing the HTML
+    """
+    totals = dict.fromkeys(['parse'] + list(FIELD_EXTRACTORS), 0.0)
+    for _ in range(repeat):
+        for page in pages.values():
+            start = timer()
+            root = lxml_html.fromstring(page)
+            totals['parse'] += timer() - start
+            for field, extract in FIELD_EXTRACTORS.items():
+                start = timer()
+                extract(root)
+                totals[field] += timer() - start
+    return {field: total / (repeat * len(pages)) for field, total in totals.items()}
+
+
+def bench_sequential(scraper, ids):
+    """
+    Scrapes the IDs one at a time with a scraper, returning the throughput and the latency of every request, from
+    loading the page to appending its row
+    """
+    requests = []
+    latencies = []
+    start = timer()
+    for request_id in ids:
+        request_start = timer()
+        scraper.get(request_id)
+        scraper.scrape_request(requests)
+        latencies.append(timer() - request_start)
+    runtime = timer() - start
+    return {'mode': 'sequential', 'scraped': len(requests), 'runtime': runtime,
+            'throughput': len(requests) / runtime if runtime else 0.0, **latency_stats(latencies)}
+
+
+def bench_concurrent(scraper, ids, concurrency=10, pool=None):
+    """
+    Scrapes the IDs concurrently with NextRequestScraper.scrape_ids, returning its run statistics
+    """
+    stats = scraper.scrape_ids([], ids, concurrency=concurrency, progress=0, pool=pool)
+    return {'mode': 'concurrent', 'concurrency': pool.size if pool is not None else concurrency,
+            **{key: stats[key] for key in ['scraped', 'missing', 'errors', 'runtime', 'throughput']}}
+
+
+def bench_backend(backend, portal, ids, concurrency=10, log=''):
+    """
+    Benchmarks one backend against a running MockPortal, returning a list of results
+    """
+    from nextrequest_scraper import NextRequestScraper  # Imported here so that field timings do not need selenium
+
+    driver, pool = None, None
+    try:
+        if backend == 'selenium':
+            from nextrequest_driver_pool import DriverPool, make_headless_firefox
+            driver = make_headless_firefox()
+            pool = DriverPool(size=concurrency, log=log)
+        scraper = NextRequestScraper(driver, portal.url, backend=backend, session=make_session(pool_size=concurrency))
+        results = [bench_sequential(scraper, ids), bench_concurrent(scraper, ids, concurrency=concurrency, pool=pool)]
+    finally:
+        if pool is not None: pool.close()
+        if driver is not None: driver.quit()
+    return [{'backend': backend, **result} for result in results]
+
+
+def run_benchmarks(pages, latency=0.05, backends=('html',), concurrency=10, log=''):
+    """
+    Runs every benchmark on a corpus of request pages, returning the results as a JSON-serializable dict. Backends
+    that cannot run here (e.g. selenium without a browser) are recorded with their error instead.
+    """
+    ids = list(pages)
+    results = {
+        'time': str(datetime.now()),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'settings': {'requests': len(ids), 'latency': latency, 'concurrency': concurrency},
+        'fields': field_timings(pages),
+        'backends': []
+    }
+
+    with MockPortal(pages, latency=latency) as portal:
+        for backend in backends:
+            try:
+                results['backends'].extend(bench_backend(backend, portal, ids, concurrency=concurrency, log=log))
+            except Exception as e:
+                log_msg('Could not benchmark the {} backend: {!r}\n'.format(backend, e), log=log)
+                results['backends'].append({'backend': backend, 'error': repr(e)})
+    return results
+
+
+def results_key(result):
+    return result['backend'], result.get('mode')
+
+
+def compare_results(baseline, results):
+    """
+    String comparing the metrics of two benchmark runs, with the relative change of each metric and whether it got
+    better or worse
+    """
+    lines = []
+    baseline_runs = {results_key(result): result for result in baseline['backends']}
+    for result in results['backends']:
+        old = baseline_runs.get(results_key(result))
+        if old is None: continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not (old.get(metric) and metric in result): continue
+            change = result[metric] / old[metric] - 1
+            better = (change > 0) == higher_is_better
+            lines.append('{} {} {}: {:.4g} -> {:.4g} ({:+.1%}, {})'.format(
+                result['backend'], result['mode'], metric, old[metric], result[metric], change,
+                'better' if better else 'worse'))
+    for field, seconds in results['fields'].items():
+        old = baseline['fields'].get(field)
+        if old:
+            lines.append('field {}: {:.1f}us -> {:.1f}us ({:+.1%})'.format(field, old * 1e6, seconds * 1e6,
+                                                                           seconds / old - 1))
+    return '\n'.join(lines) + '\n'
+
+
+def results_summary(results):
+    """
+    String displaying the results of a benchmark run
+    """
+    lines = ['{} requests, {}s latency, concurrency {}'.format(*results['settings'].values())]
+    for result in results['backends']:
+        if 'error' in result:
+            lines.append('{}: {}'.format(result['backend'], result['error']))
+            continue
+        line = '{} {}: {:.2f} req/s'.format(result['backend'], result['mode'], result['throughput'])
+        if 'p50' in result:
+            line += ', p50 {:.1f}ms, p95 {:.1f}ms'.format(result['p50'] * 1e3, result['p95'] * 1e3)
+        lines.append(line)
+    lines.append('Field extraction (us per page): ' + ', '.join('{} {:.1f}'.format(field, seconds * 1e6)
+                                                               for field, seconds in results['fields'].items()))
+    return '\n'.join(lines) + '\n'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', help='Directory of recorded <request ID>.html pages, instead of generated pages')
+    parser.add_argument('--requests', type=int, default=500, help='Number of generated request pages')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every mock portal response')
+    parser.add_argument('--concurrency', type=int, default=10, help='Concurrent requests (or browsers)')
+    parser.add_argument('--backends', nargs='+', default=['html'], choices=['html', 'selenium'])
+    parser.add_argument('--output', default='bench_results.json', help='JSON file the results are saved to')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare the results with')
+    args = parser.parse_args()
+
+    pages = load_recorded_pages(args.pages) if args.pages else make_bench_corpus(args.requests)
+    results = run_benchmarks(pages, latency=args.latency, backends=args.backends, concurrency=args.concurrency)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(results_summary(results))
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare_results(json.load(f), results))
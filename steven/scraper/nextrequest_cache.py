@@ -0,0 +1,190 @@
+"""
+Conditional GET cache for NextRequest request pages. Page bodies are kept on disk with the ETag and Last-Modified
+validators the portal sent, re-fetches are sent as conditional requests, and a 304 Not Modified response is answered
+from the cache, along with the row parsed from the page the last time, so that an unchanged page is neither downloaded
+nor parsed again. The cache is bounded in size, evicting the least recently used pages.
+
+Usage: python nextrequest_cache.py CACHE_DB
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+
+
+class PageCache:
+    """
+    Size-bounded LRU cache of pages backed by SQLite, so that it persists across runs. Only pages served with a
+    validator (ETag or Last-Modified) are cached, since they are the only ones that can be revalidated. max_bytes
+    bounds the total size of the cached bodies and parse results. Safe to share between threads.
+    """
+
+    def __init__(self, filename=':memory:', max_bytes=512 * 2 ** 20):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()  # The connection is shared between scraper threads
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        if filename != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                          'body BLOB, result TEXT, size INTEGER, last_used REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_lru ON pages (last_used)')
+        self.conn.commit()
+        self.total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        self.revalidated = set()  # URLs whose last fetch was answered with 304, whose parse result can be reused
+        self.stats = dict.fromkeys(['hits', 'misses', 'uncacheable', 'bytes_saved', 'results_reused', 'evictions'], 0)
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def conditional_headers(self, url):
+        """
+        Headers making a request for url conditional on the cached version, empty if the page is not cached
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT etag, last_modified FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None: return {}
+        headers = {}
+        if row[0]: headers['If-None-Match'] = row[0]
+        if row[1]: headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def get(self, session, url, **kwargs):
+        """
+        GETs url with session, conditionally if the page is cached. A 304 response is returned as a 200 response with
+        the cached body (and from_cache set), so that callers can treat it like a normal response. If the page was
+        evicted while the request was in flight, it is requested again unconditionally. Other responses are stored in
+        the cache if they carry a validator.
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        response = session.get(url, headers={**headers, **self.conditional_headers(url)}, **kwargs)
+        response.from_cache = False
+
+        if response.status_code == 304:
+            body = self.hit(url)
+            if body is not None:
+                response.status_code = 200
+                response._content = body
+                response.encoding = 'utf-8'
+                response.from_cache = True
+                return response
+            # Evicted since the request was sent: a 304 has no body, so the page is fetched again in full
+            response = session.get(url, headers=headers, **kwargs)
+            response.from_cache = False
+
+        if response.status_code == 200 and not response.history:  # Redirects are not cached
+            self.store(url, response.content, etag=response.headers.get('ETag'),
+                       last_modified=response.headers.get('Last-Modified'))
+        return response
+
+    def hit(self, url):
+        """
+        Returns the cached body of a page the portal reported as not modified, marking it as recently used
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT body FROM pages WHERE url = ?', (url,)).fetchone()
+            if row is None: return None  # Evicted since the request was sent
+            self.conn.execute('UPDATE pages SET last_used = ? WHERE url = ?', (time.time(), url))
+            self.conn.commit()
+            self.revalidated.add(url)
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += len(row[0])
+        return row[0]
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """
+        Caches the body of a page fetched in full, evicting the least recently used pages if the cache is full
+        """
+        with self.lock:
+            self.revalidated.discard(url)
+            if not (etag or last_modified) or len(body) > self.max_bytes:
+                self.stats['uncacheable'] += 1
+                self.remove(url)
+            else:
+                self.stats['misses'] += 1
+                self.remove(url)
+                self.conn.execute('INSERT INTO pages VALUES (?, ?, ?, ?, NULL, ?, ?)',
+                                  (url, etag, last_modified, body, len(body), time.time()))
+                self.total += len(body)
+                self.evict()
+            self.conn.commit()
+
+    def result(self, url):
+        """
+        Row parsed from the page at url, if the page was just reported as not modified and its row was stored with
+        set_result, and None otherwise
+        """
+        if url not in self.revalidated: return None
+        with self.lock:
+            row = self.conn.execute('SELECT result FROM pages WHERE url = ?', (url,)).fetchone()
+            if row is None or row[0] is None: return None
+            self.stats['results_reused'] += 1
+        return json.loads(row[0])
+
+    def set_result(self, url, result):
+        """
+        Stores the row parsed from the cached page at url, to be reused while the page is not modified
+        """
+        data = json.dumps(result)
+        with self.lock:
+            row = self.conn.execute('SELECT result FROM pages WHERE url = ?', (url,)).fetchone()
+            if row is None: return  # Uncacheable or evicted page
+            self.conn.execute('UPDATE pages SET result = ?, size = size + ? WHERE url = ?',
+                              (data, len(data) - len(row[0] or ''), url))
+            self.total += len(data) - len(row[0] or '')
+            self.evict()
+            self.conn.commit()
+
+    def remove(self, url):
+        row = self.conn.execute('SELECT size FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is not None:
+            self.conn.execute('DELETE FROM pages WHERE url = ?', (url,))
+            self.total -= row[0]
+
+    def evict(self):
+        """
+        Removes the least recently used pages until the cache fits in max_bytes. Called with the lock held
+        """
+        while self.total > self.max_bytes:
+            url, size = self.conn.execute('SELECT url, size FROM pages ORDER BY last_used LIMIT 1').fetchone()
+            self.conn.execute('DELETE FROM pages WHERE url = ?', (url,))
+            self.revalidated.discard(url)
+            self.total -= size
+            self.stats['evictions'] += 1
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def report(self):
+        """
+        String displaying the cache counters and size
+        """
+        stats = self.stats
+        requests = stats['hits'] + stats['misses'] + stats['uncacheable']
+        return ('Cache hits: {:d}/{:d} ({:.1%})\tParse results reused: {:d}\tBytes saved: {:,d}\tEvictions: {:d}\t'
+                'Size: {:d} pages, {:,d}/{:,d} bytes\n').format(
+            stats['hits'], requests, stats['hits'] / requests if requests else 0.0, stats['results_reused'],
+            stats['bytes_saved'], stats['evictions'], len(self), self.total, self.max_bytes)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Display the size of a NextRequest page cache')
+    parser.add_argument('cache', help='Page cache database')
+    args = parser.parse_args()
+
+    with PageCache(args.cache, max_bytes=float('inf')) as cache:
+        print('{:d} pages, {:,d} bytes'.format(len(cache), cache.total))
@@ -0,0 +1,137 @@
+"""
+Durable checkpointing of scraped NextRequest requests, so that a crashed or interrupted scrape can be resumed from disk.
+"""
+
+import io
+import sqlite3
+import threading
+import zipfile
+
+from nextrequest_scraper_utils import *
+
+
+COLUMNS = ', '.join('"{}"'.format(field) for field in REQUEST_FIELDS)  # Quoted, since desc is an SQL keyword
+
+
+class CheckpointStore:
+    """
+    Append-only store of scraped requests backed by SQLite. Each request is committed as soon as it is appended, so
+    nothing is lost if the scraper crashes, and memory use stays flat regardless of the size of the database.
+
+    The store supports the parts of the list interface used by NextRequestScraper (append, pop, [-1], len and
+    iteration), so it can be passed to NextRequestScraper.scrape in place of the requests list. Passing a store that
+    already holds requests resumes the scrape from the last request in it.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()  # The connection is shared between scraper threads
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')  # Durable across process crashes, cheap enough to commit per row
+        self.conn.execute('CREATE TABLE IF NOT EXISTS requests (seq INTEGER PRIMARY KEY AUTOINCREMENT, {})'.format(
+            ', '.join('"{}" TEXT'.format(field) for field in REQUEST_FIELDS)))
+        self.conn.execute('CREATE INDEX IF NOT EXISTS requests_id ON requests (id)')
+        self.conn.commit()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def append(self, request):
+        """
+        Appends a scraped request and commits it to disk
+        """
+        with self.lock:
+            self.conn.execute('INSERT INTO requests ({}) VALUES ({})'.format(COLUMNS, ', '.join('?' * len(REQUEST_FIELDS))),
+                              [request.get(field) for field in REQUEST_FIELDS])
+            self.conn.commit()
+
+    def pop(self):
+        """
+        Removes and returns the last appended request
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT seq, {} FROM requests ORDER BY seq DESC LIMIT 1'.format(COLUMNS)).fetchone()
+            if row is None: raise IndexError('pop from empty CheckpointStore')
+            self.conn.execute('DELETE FROM requests WHERE seq = ?', (row[0],))
+            self.conn.commit()
+        return dict(zip(REQUEST_FIELDS, row[1:]))
+
+    def __getitem__(self, index):
+        if not isinstance(index, int): raise TypeError('CheckpointStore indices must be integers')
+        order, offset = ('DESC', -index - 1) if index < 0 else ('ASC', index)
+        rows = self.query('SELECT {} FROM requests ORDER BY seq {} LIMIT 1 OFFSET ?'.format(COLUMNS, order),
+                          (offset,))
+        if not rows: raise IndexError('CheckpointStore index out of range')
+        return dict(zip(REQUEST_FIELDS, rows[0]))
+
+    def __len__(self):
+        return self.query('SELECT COUNT(*) FROM requests')[0][0]
+
+    def __iter__(self):
+        return self.iter_requests()
+
+    def iter_requests(self, complete=False, chunksize=1000):
+        """
+        Iterates over the stored requests in the order they were appended, reading chunksize rows from disk at a
+        time. If complete is set, only the latest copy of each request that was scraped with a status is returned.
+        """
+        where = ('WHERE seq IN (SELECT MAX(seq) FROM requests WHERE status IS NOT NULL GROUP BY id) '
+                 if complete else '')
+        last_seq = 0
+        while True:
+            rows = self.query('SELECT seq, {} FROM requests {} {} seq > ? ORDER BY seq LIMIT ?'.format(
+                COLUMNS, where, 'AND' if where else 'WHERE'), (last_seq, chunksize))
+            if not rows: return
+            for row in rows:
+                yield dict(zip(REQUEST_FIELDS, row[1:]))
+            last_seq = rows[-1][0]
+
+    def get(self, request_id):
+        """
+        Gets the latest stored copy of a request, or None if it has not been scraped
+        """
+        rows = self.query('SELECT {} FROM requests WHERE id = ? ORDER BY seq DESC LIMIT 1'.format(COLUMNS),
+                          (request_id,))
+        return dict(zip(REQUEST_FIELDS, rows[0])) if rows else None
+
+    def last_id(self):
+        """
+        ID of the last request appended, or None if the store is empty
+        """
+        rows = self.query('SELECT id FROM requests ORDER BY seq DESC LIMIT 1')
+        return rows[0][0] if rows else None
+
+    def scraped_ids(self):
+        """
+        Set of IDs of all requests that have been scraped with a status
+        """
+        return {row[0] for row in self.query('SELECT DISTINCT id FROM requests WHERE status IS NOT NULL')}
+
+    def export(self, requests_name, path='data/', chunksize=1000, log=''):
+        """
+        Writes the latest copy of every complete request to a zipped CSV file, in the same format as
+        convert_requests_to_csv, streaming chunksize requests at a time.
+        """
+        import pandas as pd
+
+        try:
+            with zipfile.ZipFile(path + requests_name + '.zip', 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                with io.TextIOWrapper(zf.open(requests_name + '.csv', 'w'), encoding='utf-8', newline='') as f:
+                    chunk = []
+                    header = True
+                    for request in self.iter_requests(complete=True, chunksize=chunksize):
+                        chunk.append(request)
+                        if len(chunk) == chunksize:
+                            pd.DataFrame(chunk, columns=REQUEST_FIELDS).to_csv(f, index=False, header=header)
+                            chunk, header = [], False
+                    if chunk or header:
+                        pd.DataFrame(chunk, columns=REQUEST_FIELDS).to_csv(f, index=False, header=header)
+            log_msg('Successfully converted requests into CSV\n\n', log=log)
+        except FileNotFoundError:
+            log_msg('Unable to convert requests into CSV\n\n', log=log)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,220 @@
+"""
+Discovery of the request IDs that exist on a NextRequest portal, so that the scraping stage only fetches real requests.
+For each year prefix (the 21 of 21-1234) the last request number is found by exponential and binary probing with
+lightweight HEAD requests, and the numbers up to it are then checked concurrently, recording the gaps. The result is a
+compact list of (prefix, start, end) ranges of existing IDs, which expand_id_ranges turns back into IDs for scrape_ids.
+
+Usage: python nextrequest_discovery.py URL PREFIX [PREFIX ...] [--output FILE]
+"""
+
+import argparse
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from nextrequest_scraper_utils import *
+from nextrequest_html import make_session, is_listing_url
+from nextrequest_rate import HostRateLimiter, retry_after_seconds
+from nextrequest_async import expand_id_ranges
+
+
+def request_exists(session, url, timeout=30, limiter=None):
+    """
+    Checks whether a request page exists without downloading it: nonexistent requests redirect to the request
+    listing. Uses HEAD, falling back to a GET whose body is not read if the portal does not allow HEAD.
+    """
+    if limiter is not None: limiter.acquire(url)
+    response = session.head(url, timeout=timeout, allow_redirects=False)
+    if response.status_code == 405:
+        response = session.get(url, timeout=timeout, allow_redirects=False, stream=True)
+        response.close()
+    if limiter is not None:
+        limiter.record(url, status=response.status_code, retry_after=retry_after_seconds(response)
+                       if response.status_code in (429, 503) else None)
+
+    if response.is_redirect:
+        return not is_listing_url(requests.compat.urljoin(url, response.headers.get('Location', '')))
+    response.raise_for_status()
+    return True
+
+
+def id_ranges(prefix, numbers):
+    """
+    Compacts a sorted list of request numbers into (prefix, start, end) ranges of consecutive numbers
+    """
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][2] + 1:
+            ranges[-1][2] = number
+        else:
+            ranges.append([prefix, number, number])
+    return [tuple(r) for r in ranges]
+
+
+def number_gaps(numbers, first, last):
+    """
+    (start, end) runs of missing numbers between first and last, given the sorted existing numbers
+    """
+    gaps = []
+    expected = first
+    for number in numbers:
+        if number > expected:
+            gaps.append((expected, number - 1))
+        expected = number + 1
+    if expected <= last:
+        gaps.append((expected, last))
+    return gaps
+
+
+class IdProber:
+    """
+    Probes the request numbers of one year prefix on a portal, caching every answer so that no number is probed twice
+    """
+
+    def __init__(self, session, url, prefix, timeout=30, limiter=None):
+        self.session = session
+        self.url = url
+        self.prefix = prefix
+        self.timeout = timeout
+        self.limiter = limiter
+        self.known = {}  # Request number -> whether it exists
+        self.lock = threading.Lock()
+
+    def exists(self, number):
+        if number not in self.known:
+            found = request_exists(self.session, '{}{}-{}'.format(self.url, self.prefix, number),
+                                   timeout=self.timeout, limiter=self.limiter)
+            with self.lock:
+                self.known[number] = found
+        return self.known[number]
+
+    def exists_near(self, number, window):
+        """
+        Checks whether any of the `window` numbers starting at number exists, so that probing is not fooled by a
+        deleted request
+        """
+        return any(self.exists(n) for n in range(number, number + window))
+
+    def find_last(self, start=1, window=5, max_gap=50):
+        """
+        Finds the last request number at or after start, or None if no request exists near start. Bisection can stop
+        at a run of deleted requests longer than window, so the max_gap numbers after the candidate are checked too,
+        and probing resumes past any request found there.
+        """
+        if not self.exists_near(start, window): return None
+        while True:
+            last = self.bisect_last(start, window)
+            beyond = [n for n in range(last + 1, last + max_gap + 1) if self.exists(n)]
+            if not beyond: return last
+            start = beyond[-1]
+
+    def bisect_last(self, start, window):
+        """
+        Doubles the distance from start until a window of missing numbers is hit, then bisects between the last window
+        with a request and the first without one
+        """
+        low, step = start, 1
+        while self.exists_near(start + step, window):  # Exponential probing for an upper bound
+            low = start + step
+            step *= 2
+        high = start + step
+        while high - low > 1:  # Bisection: a request exists near low but not near high
+            middle = (low + high) // 2
+            if self.exists_near(middle, window):
+                low = middle
+            else:
+                high = middle
+        return max(n for n in range(low, low + window) if self.known.get(n))
+
+    @property
+    def probes(self):
+        return len(self.known)
+
+
+def discover_prefix(session, url, prefix, start=1, window=5, max_gap=50, enumerate_ids=True, concurrency=10,
+                    timeout=30, limiter=None, log=''):
+    """
+    Discovers the existing requests of one year prefix from start onwards. Returns a dict with the first and last
+    request numbers, the compact ranges of existing IDs, the gaps between them and the number of probes sent. If
+    enumerate_ids is not set, the numbers between first and last are not checked individually and the range is
+    assumed to be dense.
+    """
+    prober = IdProber(session, url, prefix, timeout=timeout, limiter=limiter)
+    last = prober.find_last(start=start, window=window, max_gap=max_gap)
+    result = {'prefix': prefix, 'first': None, 'last': last, 'ranges': [], 'gaps': [], 'probes': prober.probes}
+    if last is None:
+        log_msg('No requests found for prefix {} from {}\n'.format(prefix, start), log=log)
+        return result
+
+    if enumerate_ids:
+        unknown = [n for n in range(start, last + 1) if n not in prober.known]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(prober.exists, unknown))
+        numbers = sorted(n for n in range(start, last + 1) if prober.known[n])
+    else:
+        numbers = list(range(start, last + 1))
+
+    result.update(first=numbers[0], ranges=id_ranges(prefix, numbers), gaps=number_gaps(numbers, numbers[0], last),
+                  probes=prober.probes)
+    log_msg('Prefix {}: {:d} requests from {}-{} to {}-{}, {:d} gaps, {:d} probes\n'.format(
+        prefix, len(numbers), prefix, numbers[0], prefix, last, len(result['gaps']), prober.probes), log=log)
+    return result
+
+
+def discover_ids(url, prefixes, session=None, start=1, window=5, max_gap=50, enumerate_ids=True, concurrency=10,
+                 rate=0, burst=1, limiter=None, timeout=30, log=''):
+    """
+    Discovers the existing requests of every year prefix of the portal at url (the request URL prefix, e.g.
+    https://lacity.nextrequest.com/requests/), returning one result per prefix as described in discover_prefix.
+    Probes are rate limited like scrape_ids.
+    """
+    session = session if session is not None else make_session(pool_size=concurrency)
+    limiter = limiter if limiter is not None else HostRateLimiter(rate, capacity=burst)
+    return [discover_prefix(session, url, str(prefix), start=start, window=window, max_gap=max_gap,
+                            enumerate_ids=enumerate_ids, concurrency=concurrency, timeout=timeout, limiter=limiter,
+                            log=log)
+            for prefix in prefixes]
+
+
+def discovered_ids(results):
+    """
+    Generates the discovered request IDs of discover_ids results, e.g. to pass to NextRequestScraper.scrape_ids
+    """
+    return expand_id_ranges(r for result in results for r in result['ranges'])
+
+
+def save_discovery(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_discovery(filename):
+    """
+    Loads discover_ids results saved by save_discovery
+    """
+    with open(filename) as f:
+        results = json.load(f)
+    for result in results:  # JSON turns tuples into lists
+        result['ranges'] = [tuple(r) for r in result['ranges']]
+        result['gaps'] = [tuple(gap) for gap in result['gaps']]
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Discover the request IDs of a NextRequest portal')
+    parser.add_argument('url', help='Request URL prefix of the portal, e.g. https://lacity.nextrequest.com/requests/')
+    parser.add_argument('prefixes', nargs='+', help='Year prefixes of the request IDs, e.g. 19 20 21')
+    parser.add_argument('--start', type=int, default=1, help='First request number to consider')
+    parser.add_argument('--window', type=int, default=5, help='Consecutive numbers probed to bridge deleted requests')
+    parser.add_argument('--max-gap', type=int, default=50, help='Longest run of deleted requests to look past')
+    parser.add_argument('--dense', action='store_true', help='Assume every number up to the last one exists')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=2, help='Probes per second')
+    parser.add_argument('--output', default='discovered_ids.json')
+    args = parser.parse_args()
+
+    results = discover_ids(args.url, args.prefixes, start=args.start, window=args.window, max_gap=args.max_gap,
+                           enumerate_ids=not args.dense, concurrency=args.concurrency, rate=args.rate)
+    save_discovery(results, args.output)
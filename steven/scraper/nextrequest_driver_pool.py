@@ -0,0 +1,220 @@
+"""
+Pool of warm headless browsers for the Selenium backend of the NextRequest scraper. Browsers are handed out to
+concurrent workers, recycled once they have served a number of pages or grown too large, and replaced if they crash.
+"""
+
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+from selenium import webdriver
+
+from nextrequest_scraper_utils import *
+from nextrequest_html import is_listing_url
+
+try:  # Only needed to recycle browsers by memory use
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def make_headless_firefox(wait_time=0.1):
+    """
+    Starts a headless Firefox driver with the same implicit wait as NextRequestScraper
+    """
+    options = webdriver.FirefoxOptions()
+    options.add_argument('-headless')
+    driver = webdriver.Firefox(options=options)
+    driver.implicitly_wait(wait_time)
+    return driver
+
+
+def driver_rss_mb(driver):
+    """
+    Resident memory of a browser and all of its child processes in MB, or None if it cannot be measured
+    """
+    if psutil is None: return None
+    try:
+        process = psutil.Process(driver.service.process.pid)
+        processes = [process] + process.children(recursive=True)
+        return sum(p.memory_info().rss for p in processes) / 2 ** 20
+    except (AttributeError, psutil.Error):
+        return None
+
+
+def driver_alive(driver):
+    """
+    Checks whether a browser still responds, i.e. it has not crashed or lost its session
+    """
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+class PooledDriver:
+    """
+    A browser in a DriverPool, with the number of pages it has served. driver is None if the browser could not be
+    started, in which case starting it is retried the next time it is borrowed.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class DriverPool:
+    """
+    Keeps `size` browsers warm and hands them out to concurrent workers. A browser is recycled after max_pages page
+    loads or once its resident memory exceeds max_rss_mb (requires psutil), and replaced transparently if it crashes.
+    Browsers are created with factory, which defaults to a headless Firefox. If a replacement browser fails to start,
+    its slot stays in the pool and the start is retried when the slot is next borrowed, so the pool never shrinks.
+    """
+
+    def __init__(self, size=4, factory=make_headless_firefox, max_pages=1000, max_rss_mb=None, rss_check_every=50,
+                 log=''):
+        self.size = size
+        self.factory = factory
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.rss_check_every = rss_check_every
+        self.log = log
+        self.stats = {'recycled': 0, 'crashed': 0, 'failed_starts': 0}
+        self.lock = threading.Lock()
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(PooledDriver(factory()))
+
+    @contextmanager
+    def driver(self):
+        """
+        Borrows a browser from the pool for one page, returning it (or a replacement) to the pool afterwards
+        """
+        pooled = self.idle.get()
+        if pooled.driver is None:  # The last replacement failed to start
+            pooled = self.replace()
+            if pooled.driver is None:
+                self.idle.put(pooled)
+                raise RuntimeError('Could not start a browser for the pool')
+        try:
+            yield pooled.driver
+        finally:
+            pooled.pages += 1
+            self.idle.put(self.check(pooled))
+
+    def check(self, pooled):
+        """
+        Returns the browser if it can keep serving pages, or a fresh replacement otherwise
+        """
+        reason = None
+        if not driver_alive(pooled.driver):
+            reason = 'crashed'
+        elif self.max_pages and pooled.pages >= self.max_pages:
+            reason = 'recycled'
+        elif self.max_rss_mb and (pooled.pages % self.rss_check_every == 0):
+            rss = driver_rss_mb(pooled.driver)
+            if rss is not None and rss > self.max_rss_mb:
+                reason = 'recycled'
+        if reason is None: return pooled
+
+        with self.lock:
+            self.stats[reason] += 1
+        log_msg('Browser {} after {} pages, starting a new one\n'.format(reason, pooled.pages), log=self.log)
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+        return self.replace()
+
+    def replace(self):
+        """
+        Starts a new browser, returning an empty slot to be retried later if it fails to start
+        """
+        try:
+            return PooledDriver(self.factory())
+        except Exception:
+            with self.lock:
+                self.stats['failed_starts'] += 1
+            log_msg('Could not start a new browser, retrying when it is next needed\n{}\n'.format(
+                traceback.format_exc()), log=self.log)
+            return PooledDriver(None)
+
+    def close(self):
+        """
+        Quits all idle browsers
+        """
+        while not self.idle.empty():
+            pooled = self.idle.get_nowait()
+            if pooled.driver is None: continue
+            try:
+                pooled.driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def scrape_ids_pooled(scraper, requests, ids, pool, limiter=None, progress=100, debug=0, log=''):
+    """
+    Scrapes the given request IDs with the Selenium backend, one worker thread per browser in the pool, optionally
+    rate limited by a HostRateLimiter. IDs that redirect to the request listing are counted as missing. Returns a dict
+    of run statistics, including the throughput in requests per second.
+    """
+    ids = iter(ids)
+    lock = threading.Lock()  # Guards the shared ID iterator and the statistics
+    stats = {'scraped': 0, 'missing': 0, 'errors': 0}
+    start = timer()
+
+    def worker():
+        while True:
+            with lock:
+                request_id = next(ids, None)
+            if request_id is None: return
+
+            if limiter is not None: limiter.acquire(scraper.url)
+            try:
+                with pool.driver() as driver:
+                    navigation_start = timer()
+                    driver.get(scraper.url + request_id)
+                    redirected = is_listing_url(driver.current_url)
+                    if limiter is not None:
+                        limiter.record(scraper.url, latency=timer() - navigation_start, redirected=redirected)
+                    if redirected:
+                        with lock:
+                            stats['missing'] += 1
+                        if scraper.retry_queue is not None: scraper.retry_queue.done(request_id)
+                        continue
+                    scraped = scraper.scrape_request(requests, debug=debug, log=log, driver=driver,
+                                                     navigation=timer() - navigation_start)
+            except Exception as e:
+                with lock:
+                    stats['errors'] += 1
+                if scraper.retry_queue is not None: scraper.retry_queue.push(request_id, e)
+                log_msg('Exception occurred while scraping request ID {}\n{}\n'.format(request_id,
+                                                                                     traceback.format_exc()), log=log)
+                continue
+
+            with lock:  # scrape_request handles its own errors, without appending a row if it failed
+                stats['scraped' if scraped else 'errors'] += 1
+                counter = stats['scraped']
+            if progress and scraped and (counter % progress == 0):
+                log_msg(scraper_throughput(counter, start, end=timer()), log=log)
+
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        for future in [executor.submit(worker) for _ in range(pool.size)]:
+            future.result()
+
+    stats['runtime'] = timer() - start
+    stats['throughput'] = stats['scraped'] / stats['runtime'] if stats['runtime'] else 0.0
+    stats.update(pool.stats)
+    if progress:
+        log_msg(scraper_throughput_final(stats), log=log)
+    return stats
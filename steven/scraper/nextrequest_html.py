@@ -0,0 +1,290 @@
+"""
+HTML-only backend for the NextRequest scraper. Request pages are fetched with a pooled HTTP session and parsed from raw
+HTML with lxml, producing the same rows as the Selenium path without driving a browser.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+from urllib.parse import urljoin, urlparse, urldefrag, parse_qsl
+
+import requests
+from lxml import etree
+from lxml import html as lxml_html
+from requests.adapters import HTTPAdapter
+
+from nextrequest_scraper_utils import *
+from nextrequest_rate import retry_after_seconds
+
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0',
+}
+
+# Tags rendered as their own line by the browser, used to approximate Selenium's WebElement.text
+BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'dd', 'div', 'dl', 'dt', 'fieldset', 'figcaption',
+              'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav',
+              'ol', 'p', 'pre', 'section', 'table', 'tr', 'ul'}
+SKIP_TAGS = {'script', 'style', 'template', 'noscript'}
+
+# Precompiled selectors. Events are selected in document order, same as the CSS selector used by the Selenium path
+EVENT_XPATH = etree.XPath(
+    "descendant::*[contains(concat(' ', normalize-space(@class), ' '), ' generic-event ') or "
+    "contains(concat(' ', normalize-space(@class), ' '), ' note-event ')]"
+)
+
+LINE_BREAK = '\x00'  # Placeholder for rendered line breaks, so they survive whitespace collapsing
+WHITESPACE_RE = re.compile(r'[ \t\r\n\f\v]+')
+NEWLINE_SPACE_RE = re.compile(r' *\n[ \n]*')
+DIGITS_RE = re.compile(r'(\d+)')
+
+
+class MissingElementException(Exception):
+    """
+    Raised when a required element cannot be found on a request page. Counterpart of Selenium's NoSuchElementException
+    for the HTML backend
+    """
+    pass
+
+
+def make_session(pool_size=10, max_retries=0):
+    """
+    Create an HTTP session with a connection pool large enough to be shared by pool_size concurrent fetches.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def is_listing_url(url):
+    """
+    Checks whether a URL points to the request listing, which is where the portal redirects nonexistent requests.
+    """
+    return urlparse(url).path.rstrip('/').endswith('/requests')
+
+
+def fetch_request_page(session, url, timeout=30, limiter=None, cache=None):
+    """
+    Fetches the HTML of a request page, returning None if the portal redirected to the request listing. How the portal
+    responded is reported to the given rate limiter, if any. If a PageCache is given, the page is revalidated with a
+    conditional request and read from the cache if it has not been modified.
+    """
+    start = timer()
+    try:
+        response = cache.get(session, url, timeout=timeout) if cache is not None else session.get(url, timeout=timeout)
+    except requests.RequestException:
+        if limiter is not None: limiter.record(url, failed=True)
+        raise
+    redirected = is_listing_url(response.url)
+    if limiter is not None:
+        limiter.record(url, status=response.status_code, latency=timer() - start, redirected=redirected,
+                       retry_after=retry_after_seconds(response) if response.status_code in (429, 503) else None)
+    response.raise_for_status()
+    if redirected: return None
+    return response.text
+
+
+def element_text(element):
+    """
+    Gets the rendered text of an lxml element, approximating Selenium's WebElement.text: whitespace is collapsed,
+    block elements and line breaks start new lines, and leading/trailing whitespace is stripped.
+    """
+    if element is None: return ''
+    parts = []
+
+    def walk(el):
+        tag = el.tag if isinstance(el.tag, str) else ''
+        if tag in SKIP_TAGS:
+            return
+        if tag == 'br' or tag in BLOCK_TAGS:
+            parts.append(LINE_BREAK)
+        if el.text and tag:
+            parts.append(el.text)
+        for child in el:
+            walk(child)
+            if child.tail: parts.append(child.tail)
+        if tag in BLOCK_TAGS:
+            parts.append(LINE_BREAK)
+
+    walk(element)
+    text = WHITESPACE_RE.sub(' ', ''.join(parts).replace('\xa0', ' ')).replace(LINE_BREAK, '\n')
+    return NEWLINE_SPACE_RE.sub('\n', text).strip()
+
+
+def find_element(root, class_name):
+    """
+    Finds the first element with the given class, raising MissingElementException if there is none.
+    """
+    elements = root.find_class(class_name)
+    if not elements:
+        raise MissingElementException('Could not find element with class {}'.format(class_name))
+    return elements[0]
+
+
+def document_links(doc_list, base_url=''):
+    """
+    Gets the (title, absolute link) pairs of the documents shown in a document list
+    """
+    docs_all = doc_list.find_class('document-link')
+    return list(zip([element_text(doc) for doc in docs_all],
+                    remove_download_from_urls([urljoin(base_url, doc.get('href', '')) for doc in docs_all])))
+
+
+def pagination_links(doc_list, base_url=''):
+    """
+    Gets the absolute links of the pagy-nav pages of a document list, including those of folders
+    """
+    links = set()
+    for nav in doc_list.find_class('pagy-nav'):
+        for a in nav.iter('a'):
+            href = a.get('href')
+            if href and not href.startswith(('#', 'javascript:')):
+                links.add(urldefrag(urljoin(base_url, href))[0])
+    return links
+
+
+def is_first_page(url):
+    """
+    Whether a pagy-nav link points at page 1 (e.g. ?documents_page=1), which is the page the links were found on or
+    the request page already loaded
+    """
+    return any(key.endswith('page') and value == '1' for key, value in parse_qsl(urlparse(url).query))
+
+
+def page_order(url):
+    """
+    Sort key putting page URLs in numeric order, e.g. page=2 before page=10
+    """
+    return [int(part) if part.isdigit() else part for part in DIGITS_RE.split(url)]
+
+
+def fetch_document_pages(session, links, seen, concurrency=4, limiter=None, timeout=30, archive=None):
+    """
+    Fetches the document list pages at the given links concurrently, following the pagination links found on them
+    (pagy-nav only shows a window of pages) until every page has been fetched. Paging starts at 2: links to page 1
+    are skipped, since it is the request page the links were found on. seen is the set of page URLs already fetched
+    and is updated. Returns the (title, link) pairs of the documents on the fetched pages, in page order. The pages
+    are also stored in archive, if given a PageArchive.
+    """
+    def fetch(url):
+        if limiter is not None: limiter.acquire(url)
+        page = fetch_request_page(session, url, timeout=timeout, limiter=limiter)
+        if archive is not None and page is not None: archive.put(url, page)
+        return url, page
+
+    def unfetched(links):
+        return sorted((link for link in links if link not in seen and not is_first_page(link)), key=page_order)
+
+    docs = []
+    frontier = unfetched(links)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while frontier:
+            seen.update(frontier)
+            new_links = set()
+            for url, page in executor.map(fetch, frontier):
+                if page is None: continue
+                root = lxml_html.fromstring(page)
+                doc_lists = root.find_class('document-list')
+                doc_list = doc_lists[0] if doc_lists else root  # The page may be just the document list
+                docs.extend(document_links(doc_list, base_url=url))
+                new_links |= pagination_links(doc_list, base_url=url)
+            frontier = unfetched(new_links)
+    return docs
+
+
+def unique_documents(docs):
+    """
+    Removes repeated documents (e.g. a document listed both loose and in a folder) by link, keeping the first
+    """
+    seen = set()
+    return [(title, link) for title, link in docs if not (link in seen or seen.add(link))]
+
+
+def parse_document_list(root, base_url='', session=None, concurrency=4, limiter=None, archive=None):
+    """
+    Gets the titles and absolute links of all documents on a request page, or None if there are no documents. If a
+    session is given, the remaining pages of a paginated document list (and of its folders) are fetched with it
+    concurrently; otherwise only the documents on the page itself are returned.
+    """
+    doc_list = find_element(root, 'document-list')  # Box containing documents
+    if '(none)' in element_text(doc_list): return None
+
+    docs = document_links(doc_list, base_url=base_url)
+    links = pagination_links(doc_list, base_url=base_url)
+    if session is not None and links:
+        docs += fetch_document_pages(session, links, {urldefrag(base_url)[0]}, concurrency=concurrency,
+                                     limiter=limiter, archive=archive)
+    docs = unique_documents(docs)
+    return docs_to_csv([title for title, _ in docs], [link for _, link in docs])
+
+
+def parse_events(root):
+    """
+    Gets the title, item(s) and time string of every message on a request page
+    """
+    event_history = EVENT_XPATH(root)
+    event_titles = [None] * len(event_history)
+    event_items = [None] * len(event_history)
+    time_quotes = [None] * len(event_history)
+
+    for i, event in enumerate(event_history):
+        event_titles[i] = element_text(find_element(event, 'event-title'))
+        event_items[i] = '\n'.join([element_text(item) for item in event.find_class('event-item')])
+        time_quotes[i] = element_text(find_element(event, 'time-quotes'))
+
+    return events_to_csv(event_titles, event_items, time_quotes)
+
+
+def parse_request_summary(root):
+    """
+    Gets only the ID and status of a request page, which is enough to decide whether it needs to be fully parsed
+    """
+    request_id = element_text(find_element(root, 'request-title-text')).split()[1][1:]
+    return request_id, element_text(find_element(root, 'request-status-label')).upper()
+
+
+def parse_time_quotes(root):
+    """
+    Gets the time strings of all messages on a request page
+    """
+    return [element_text(time_quote) for time_quote in root.find_class('time-quotes')]
+
+
+def parse_request_page(page, base_url='', session=None, limiter=None, archive=None):
+    """
+    Parses a request page into a row identical to the one appended by NextRequestScraper.scrape_request. The page
+    can be given as an HTML string or as an already parsed lxml element. Relative document links are resolved
+    against base_url. If a session is given, every page of a paginated document list is scraped (see
+    parse_document_list).
+    """
+    root = lxml_html.fromstring(page) if isinstance(page, (str, bytes)) else page
+
+    request_id, status = parse_request_summary(root)  # Status label is upper-cased by CSS, so do the same here
+
+    # The full description is present in the HTML even when the page collapses it behind "Read more"
+    desc_row = find_element(root, 'request-text')
+    desc_text = desc_row.get_element_by_id('request-text', None)
+    if desc_text is None:
+        raise MissingElementException('Could not find element with ID request-text')
+
+    return {
+        'id': request_id,
+        'status': status,
+        'desc': element_text(desc_text),
+        'date': element_text(find_element(root, 'request_date')),
+        'depts': element_text(find_element(root, 'current-department')),
+        'docs': parse_document_list(root, base_url=base_url, session=session, limiter=limiter, archive=archive),
+        'poc': element_text(find_element(root, 'request-detail')),
+        'msgs': parse_events(root)
+    }
+
+
+def parse_request_file(filename, base_url=''):
+    """
+    Parses a request page saved to disk, e.g. an offline fixture
+    """
+    with open(filename, 'rb') as f:
+        return parse_request_page(f.read(), base_url=base_url)
@@ -0,0 +1,81 @@
+"""
+Incremental re-scraping: decides from a previous scrape which requests have to be scraped again.
+"""
+
+import csv
+import zipfile
+from io import StringIO
+
+from nextrequest_scraper_utils import *
+from nextrequest_checkpoint import CheckpointStore
+
+
+TERMINAL_STATUSES = {'CLOSED'}
+INCREMENTAL_ACTIONS = ('skipped', 'refreshed', 'new')
+
+
+def load_previous_requests(source):
+    """
+    Loads the output of a previous scrape for incremental re-scraping. The source can be the zipped CSV written by
+    convert_requests_to_csv, the filename of a CheckpointStore database, a CheckpointStore or a RequestBatch. The
+    result maps request IDs to rows through its get method.
+    """
+    from nextrequest_records import RequestBatch  # Imports pandas, which the other sources may not need
+
+    if isinstance(source, (CheckpointStore, RequestBatch, dict)):
+        return source
+    if not source.endswith('.zip'):
+        return CheckpointStore(source)
+
+    import pandas as pd
+
+    with zipfile.ZipFile(source, 'r') as zf:
+        df = pd.read_csv(zf.open(zf.namelist()[0]), dtype=str)
+    df = df.astype(object).where(df.notna(), None)
+    return {row['id']: row for row in df.to_dict('records')}
+
+
+def msgs_time_quotes(msgs):
+    """
+    Gets the time strings of all messages in a scraped msgs CSV string
+    """
+    if not msgs: return []
+    return [row['time'] for row in csv.DictReader(StringIO(msgs))]
+
+
+def is_closed(row):
+    """
+    Checks whether a scraped request is in a terminal status, so that it will not change anymore
+    """
+    return bool(row and row.get('status') and row['status'].upper() in TERMINAL_STATUSES)
+
+
+def request_fingerprint(status, time_quotes):
+    """
+    Cheap summary of a request page used to detect changes: the status label, the number of events and the time of
+    the newest event (events are listed newest first)
+    """
+    return (status or '').upper(), len(time_quotes), time_quotes[0] if time_quotes else ''
+
+
+def incremental_action(previous_row, status, get_time_quotes):
+    """
+    Decides what to do with a request in incremental mode: 'new' if it was not scraped before, 'skipped' if it was
+    already closed or its fingerprint is unchanged, and 'refreshed' otherwise. get_time_quotes is only called when
+    the fingerprint has to be compared, so that closed requests cost nothing.
+    """
+    if previous_row is None or not previous_row.get('status'):
+        return 'new'
+    if is_closed(previous_row):
+        return 'skipped'
+    previous = request_fingerprint(previous_row['status'], msgs_time_quotes(previous_row.get('msgs')))
+    if status is not None and request_fingerprint(status, get_time_quotes()) == previous:
+        return 'skipped'
+    return 'refreshed'
+
+
+def incremental_summary(stats):
+    """
+    String displaying how many requests an incremental scrape skipped, refreshed and newly discovered
+    """
+    return 'Skipped: {:d}\tRefreshed: {:d}\tNew: {:d}\n\n'.format(stats['skipped'], stats['refreshed'], stats['new'])
@@ -0,0 +1,99 @@
+"""
+Batch extraction of a request page for the Selenium backend: a single injected script expands the page and collects
+every field, replacing the WebDriver round trip per element of the element-by-element path.
+"""
+
+from urllib.parse import urldefrag
+
+from nextrequest_scraper_utils import *
+from nextrequest_html import fetch_document_pages, unique_documents
+
+
+# Expands "Read more", folders and "Details" like the element-by-element path, then collects every field. Text is read
+# with innerText, which is what Selenium's WebElement.text is based on
+SCRAPE_REQUEST_JS = r'''
+const first = (root, className) => {
+    const element = root.getElementsByClassName(className)[0];
+    if (!element) throw new Error('Could not find element with class ' + className);
+    return element;
+};
+const text = (element) => (element.innerText || '').replace(/\u00a0/g, ' ').trim();
+const withLinkText = (root, linkText) => Array.from(root.getElementsByTagName('a'))
+    .filter((a) => (a.innerText || '').includes(linkText));
+
+const descRow = first(document, 'request-text');
+withLinkText(descRow, 'Read more').forEach((a) => a.click());
+const desc = descRow.querySelector('#request-text');
+if (!desc) throw new Error('Could not find element with ID request-text');
+
+const docList = first(document, 'document-list');
+const docListText = text(docList);
+let docs = null;
+let pages = [];
+if (!docListText.includes('(none)')) {
+    Array.from(docList.getElementsByClassName('folder-toggle')).forEach((folder) => folder.click());
+    docs = Array.from(docList.getElementsByClassName('document-link'))
+        .map((doc) => ({title: text(doc), link: doc.href}));
+    pages = Array.from(docList.querySelectorAll('.pagy-nav a')).map((a) => a.href)
+        .filter((href) => href && !href.startsWith('javascript:'));
+}
+
+const events = Array.from(document.querySelectorAll('.generic-event,.note-event')).map((event) => {
+    const title = text(first(event, 'event-title'));
+    withLinkText(event, 'Details').forEach((a) => a.click());
+    return {
+        title: title,
+        item: Array.from(event.getElementsByClassName('event-item')).map(text).join('\n'),
+        time: text(first(event, 'time-quotes'))
+    };
+});
+
+return {
+    title: text(first(document, 'request-title-text')),
+    status: text(first(document, 'request-status-label')),
+    desc: text(desc),
+    date: text(first(document, 'request_date')),
+    depts: text(first(document, 'current-department')),
+    poc: text(first(document, 'request-detail')),
+    docs: docs,
+    pages: pages,
+    url: window.location.href,
+    events: events
+};
+'''
+
+
+def js_result_to_row(result, session=None, limiter=None, archive=None):
+    """
+    Converts the structure returned by SCRAPE_REQUEST_JS into a row identical to the element-by-element path. If a
+    session is given, the remaining pages of a paginated document list are fetched with it.
+    """
+    docs = result['docs']
+    if docs is not None:
+        # Stripped like document_links strips the fetched pages' links, so that documents repeated across pages match
+        docs = list(zip([doc['title'] for doc in docs], remove_download_from_urls([doc['link'] for doc in docs])))
+        if session is not None and result.get('pages'):
+            docs += fetch_document_pages(session, {urldefrag(page)[0] for page in result['pages']},
+                                         {urldefrag(result.get('url', ''))[0]}, limiter=limiter, archive=archive)
+        docs = unique_documents(docs)
+    events = result['events']
+    return {
+        'id': result['title'].split()[1][1:],
+        'status': result['status'].strip(),
+        'desc': result['desc'],
+        'date': result['date'],
+        'depts': result['depts'],
+        'docs': docs_to_csv([title for title, _ in docs], [link for _, link in docs]) if docs is not None else None,
+        'poc': result['poc'],
+        'msgs': events_to_csv([event['title'] for event in events], [event['item'] for event in events],
+                              [event['time'] for event in events])
+    }
+
+
+def scrape_request_js(driver, session=None, limiter=None, archive=None):
+    """
+    Scrapes the request page loaded in a driver with a single script call, returning the row. Further pages of the
+    document list are fetched with session, if given.
+    """
+    return js_result_to_row(driver.execute_script(SCRAPE_REQUEST_JS), session=session, limiter=limiter,
+                            archive=archive)
@@ -0,0 +1,263 @@
+"""
+Local stand-in for a NextRequest portal, serving request pages over HTTP so that the scrapers can be exercised offline.
+"""
+
+import hashlib
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+
+from nextrequest_rate import TokenBucket
+
+
+def render_doc_links(docs):
+    """
+    Renders a list of (title, link) document pairs as download links
+    """
+    return ''.join('<li><a class="document-link" href="{}/download">{}</a></li>'.format(escape(link), escape(title))
+                   for title, link in docs)
+
+
+def render_pagy_nav(request_id, page, num_pages, window=2):
+    """
+    Renders a pagy-nav bar for page (1-based) of num_pages document list pages, showing like the portal only the pages
+    within window of the current one, so that the last pages are reached by following the bar
+    """
+    def link(number, text):
+        return '<a href="/requests/{}?documents_page={:d}">{}</a>'.format(escape(request_id), number, text)
+
+    items = [link(page - 1, '&lsaquo; Prev') if page > 1 else '<span class="page prev disabled">&lsaquo; Prev</span>']
+    for number in range(max(1, page - window), min(num_pages, page + window) + 1):
+        items.append('<span class="page active">{:d}</span>'.format(number) if number == page else link(number, number))
+    items.append(link(page + 1, 'Next &rsaquo;') if page < num_pages else
+                 '<span class="page next disabled">Next &rsaquo;</span>')
+    return '<nav class="pagy-nav pagination">{}</nav>'.format(''.join(items))
+
+
+def render_request_page(request_id, status='Closed', desc='', date='', depts='', poc='Staff', docs=(), events=(),
+                        next_id=None, folders=(), read_more=False, pagy_nav=''):
+    """
+    Renders the HTML of a request page with the same structure as a NextRequest portal. docs is a list of
+    (title, link) pairs and events a list of (title, item, time) triples, newest first. folders is a list of
+    (folder name, docs) pairs listed after the loose documents, and read_more collapses the description behind a
+    "Read more" link. pagy_nav is the pagination bar shown under the document list, if any.
+    """
+    if docs or folders:
+        doc_list = render_doc_links(docs) + ''.join(
+            '<li class="folder"><a class="folder-toggle" href="#">{}</a><ul>{}</ul></li>'.format(
+                escape(name), render_doc_links(folder_docs))
+            for name, folder_docs in folders)
+    else:
+        doc_list = '<p>(none)</p>'
+
+    event_list = ''.join(
+        '<div class="event generic-event"><div class="event-title">{}<div class="event-visibility">Public</div></div>'
+        '<div class="event-item">{}</div><div class="time-quotes">{}</div></div>'.format(escape(title), escape(item),
+                                                                                       escape(time))
+        for title, item, time in events
+    )
+    next_link = '<a class="js-next-request" href="/requests/{}">Next</a>'.format(next_id) if next_id else ''
+    read_more_link = '<a href="#" class="read-more">Read more</a>' if read_more else ''
+
+    return (
+        '<html><head><title>Request {id}</title></head><body>'
+        '<h1 class="request-title-text">Request #{id}</h1>'
+        '<span class="request-status-label">{status}</span>{next_link}'
+        '<div class="request-text"><div id="request-text">{desc}</div>{read_more_link}</div>'
+        '<p class="request_date">{date}</p>'
+        '<div class="current-department">{depts}</div>'
+        '<div class="request-detail">{poc}</div>'
+        '<div class="document-list"><ul>{doc_list}</ul>{pagy_nav}</div>'
+        '<section class="event-history">{event_list}</section>'
+        '</body></html>'
+    ).format(id=escape(request_id), status=escape(status), next_link=next_link, desc=escape(desc),
+             read_more_link=read_more_link, date=escape(date), depts=escape(depts), poc=escape(poc), doc_list=doc_list,
+             pagy_nav=pagy_nav, event_list=event_list)
+
+
+def make_mock_pages(ids, num_events=4, num_docs=1, docs_per_page=None):
+    """
+    Generates a dict of request ID -> request page for the given IDs, each page linking to the next one. If
+    docs_per_page is set, the document list is split into pages of that many documents, and the request is served as a
+    dict of query string -> page with one entry per documents_page (see MockPortal).
+    """
+    ids = list(ids)
+    pages = {}
+    for i, request_id in enumerate(ids):
+        events = [('Request Closed', 'Request completed.', 'April 8, 2019, 10:36am by Staff')]
+        events += [('Note', 'Note number {}'.format(j), 'April 7, 2019, 9:{:02d}am by Staff'.format(j % 60))
+                   for j in range(max(num_events - 2, 0))]
+        events += [('Request Opened', 'Request received via web', 'April 6, 2019, 8:59am')]
+        docs = [('document_{}.pdf'.format(j), '/documents/{}-{}'.format(i, j)) for j in range(num_docs)]
+
+        def render(page_docs, pagy_nav=''):
+            return render_request_page(request_id, status='Closed', desc='Request {} description'.format(request_id),
+                                       date='April 6, 2019 via web', depts='Police Department', docs=page_docs,
+                                       events=events[:num_events], next_id=ids[i + 1] if i + 1 < len(ids) else None,
+                                       pagy_nav=pagy_nav)
+
+        if docs_per_page and num_docs > docs_per_page:
+            num_pages = -(-num_docs // docs_per_page)
+            pages[request_id] = {
+                ('documents_page={:d}'.format(page) if page > 1 else ''): render(
+                    docs[(page - 1) * docs_per_page:page * docs_per_page], render_pagy_nav(request_id, page, num_pages))
+                for page in range(1, num_pages + 1)}
+            pages[request_id]['documents_page=1'] = pages[request_id]['']
+        else:
+            pages[request_id] = render(docs)
+    return pages
+
+
+class MockPortalHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for MockPortal. The portal instance is attached as a class attribute by MockPortal.start
+    """
+    portal = None
+
+    def do_GET(self):
+        self.respond()
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def respond(self, head=False):
+        portal = self.portal
+        if portal.latency: sleep(portal.latency)
+
+        with portal.lock:
+            portal.hits += 1
+            if head: portal.heads += 1
+        if portal.throttle is not None and not portal.throttle.try_acquire():
+            with portal.lock:
+                portal.throttled += 1
+            self.send_response(429)
+            self.send_header('Retry-After', str(portal.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        path, _, query = self.path.partition('?')
+        request_id = path[len('/requests/'):] if path.startswith('/requests/') else None
+        page = portal.pages.get(request_id)
+        if isinstance(page, dict):  # Paginated request, with a page per query string
+            page = page.get(query)
+        if page is not None:
+            if portal.conditional and self.not_modified(page):
+                with portal.lock:
+                    portal.not_modified += 1
+                self.send_response(304)
+                self.send_validators(page)
+                self.end_headers()
+                return
+            self.send_page(200, page, head=head)
+        elif path.rstrip('/') == '/requests':
+            self.send_page(200, '<html><body>Requests</body></html>', head=head)
+        else:  # Nonexistent requests redirect to the request listing
+            self.send_response(302)
+            self.send_header('Location', '/requests')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def not_modified(self, page):
+        """
+        Checks the conditional headers of the request against a page. If-None-Match takes precedence, as in RFC 9110
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            etags = [etag.strip().removeprefix('W/') for etag in if_none_match.split(',')]
+            return '*' in etags or self.portal.etag(page) in etags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= int(self.portal.modified)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def send_validators(self, page):
+        self.send_header('ETag', self.portal.etag(page))
+        self.send_header('Last-Modified', formatdate(self.portal.modified, usegmt=True))
+
+    def send_page(self, code, page, head=False):
+        body = page.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.portal.conditional: self.send_validators(page)
+        self.end_headers()
+        if not head: self.wfile.write(body)
+
+    def log_message(self, format, *args):  # Silence the default per-request logging to stderr
+        pass
+
+
+class MockPortal:
+    """
+    Local HTTP server imitating a NextRequest portal, serving request pages from a dict of request ID -> HTML.
+    A request can also be given as a dict of query string -> HTML, e.g. to serve the pages of a paginated document
+    list. Unknown IDs redirect to the request listing like the real portal, and `latency` seconds are added to every
+    response. If throttle_rate is set, requests beyond throttle_rate per second (with bursts of throttle_burst) are
+    answered with HTTP 429 and a Retry-After of retry_after seconds. If conditional is set, pages are served with an
+    ETag and a Last-Modified time (when the portal started, or set_modified was last called) and conditional requests
+    for unchanged pages are answered with 304 Not Modified. Can be used as a context manager.
+    """
+
+    def __init__(self, pages, latency=0, host='127.0.0.1', port=0, throttle_rate=None, throttle_burst=1,
+                 retry_after=1, conditional=False):
+        self.pages = pages
+        self.latency = latency
+        self.throttle = TokenBucket(throttle_rate, capacity=throttle_burst) if throttle_rate else None
+        self.retry_after = retry_after
+        self.conditional = conditional
+        self.modified = time.time()
+        self.not_modified = 0  # Number of requests answered with 304
+        self.hits = 0  # Number of requests served
+        self.heads = 0  # Number of HEAD requests among them
+        self.throttled = 0  # Number of requests answered with 429
+        self.lock = threading.Lock()
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    @staticmethod
+    def etag(page):
+        return '"{}"'.format(hashlib.sha1(page.encode('utf-8')).hexdigest())
+
+    def set_modified(self, request_id, page):
+        """
+        Replaces the page of a request, as if it was updated on the portal
+        """
+        self.pages[request_id] = page
+        self.modified = time.time()
+
+    @property
+    def url(self):
+        """
+        Request URL prefix of the portal, to be passed to NextRequestScraper
+        """
+        return 'http://{}:{}/requests/'.format(self.host, self.port)
+
+    def start(self):
+        handler = type('Handler', (MockPortalHandler,), {'portal': self})
+        self.server = ThreadingHTTPServer((self.host, self.port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,190 @@
+"""
+Scrapes several NextRequest portals in parallel, one worker process per city, with progress aggregated in the parent.
+"""
+
+import multiprocessing
+import queue
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from timeit import default_timer as timer
+
+from nextrequest_scraper_utils import *
+from nextrequest_checkpoint import CheckpointStore
+from nextrequest_rate import HostRateLimiter, AdaptiveRateLimiter
+
+
+class ReportingRequests:
+    """
+    Wraps the requests list or CheckpointStore of a scraper, reporting the number of requests appended to a progress
+    queue every `progress` requests, under the given key (the portal URL)
+    """
+
+    def __init__(self, requests, key, progress_queue, progress=100):
+        self.requests = requests
+        self.key = key
+        self.progress_queue = progress_queue
+        self.progress = progress
+        self.counter = 0
+        self.start = timer()
+
+    def append(self, request):
+        self.requests.append(request)
+        self.counter += 1
+        if self.progress and (self.counter % self.progress == 0):
+            self.report()
+
+    def report(self, done=False):
+        self.progress_queue.put((self.key, self.counter, timer() - self.start, done))
+
+    def pop(self):
+        return self.requests.pop()
+
+    def __getitem__(self, index):
+        return self.requests[index]
+
+    def __len__(self):
+        return len(self.requests)
+
+    def __iter__(self):
+        return iter(self.requests)
+
+    def __getattr__(self, name):  # Everything else, e.g. CheckpointStore.scraped_ids, goes to the wrapped requests
+        return getattr(self.requests, name)
+
+
+def scrape_portal(portal, path, progress_queue, backend='html', rate=1, burst=1, concurrency=4, timeout=10,
+                  progress=100, adaptive=False):
+    """
+    Scrapes a single portal in a worker process. portal is a dict with the request URL prefix under 'url', and either
+    an 'earliest_id' to walk the database from or a list of 'ids' to scrape concurrently, and optionally a 'name' (see
+    portal_name). Any of the keyword arguments can be overridden per portal. Requests are checkpointed to
+    <path><name>_requests.db and exported to <path><name>_requests.zip, with the log written next to them. If adaptive is set, rate is only the starting rate,
+    which is then adapted to how the portal responds (see AdaptiveRateLimiter). With the selenium backend, a list of ids
+    is scraped by a DriverPool of `concurrency` browsers.
+    """
+    settings = dict(backend=backend, rate=rate, burst=burst, concurrency=concurrency, timeout=timeout,
+                    adaptive=adaptive)
+    settings.update({key: value for key, value in portal.items() if key in settings})
+
+    # Imported here so that the parent process does not need selenium
+    from nextrequest_scraper import NextRequestScraper
+    from nextrequest_html import make_session
+
+    requests_name = portal_name(portal) + '_requests'
+    log = path + requests_name + '.log'
+    store = CheckpointStore(path + requests_name + '.db')
+    requests = ReportingRequests(store, portal['url'], progress_queue, progress=progress)
+    if settings['adaptive']:
+        limiter = AdaptiveRateLimiter(settings['rate'], capacity=settings['burst'])  # Politeness is per city
+    else:
+        limiter = HostRateLimiter(settings['rate'], capacity=settings['burst'])
+
+    driver, pool = None, None
+    try:
+        if settings['backend'] == 'selenium':
+            from nextrequest_driver_pool import DriverPool, make_headless_firefox
+            if 'ids' in portal:  # Concurrent scraping by ID needs one browser per worker
+                pool = DriverPool(size=settings['concurrency'])
+            else:
+                driver = make_headless_firefox()
+        scraper = NextRequestScraper(driver, portal['url'], backend=settings['backend'],
+                                     session=make_session(pool_size=settings['concurrency']), limiter=limiter)
+
+        if 'ids' in portal:
+            scraper.scrape_ids(requests, portal['ids'], concurrency=settings['concurrency'], progress=0, log=log,
+                               previous=portal.get('previous'), pool=pool)
+            store.export(requests_name, path=path, log=log)
+        else:
+            scraper.scrape(requests, portal['earliest_id'], requests_name=requests_name, path=path,
+                           timeout=settings['timeout'], progress=progress, log=log, previous=portal.get('previous'))
+    finally:
+        requests.report(done=True)
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        if pool is not None: pool.close()
+        store.close()
+
+    return portal['url'], requests.counter
+
+
+def portal_name(portal):
+    """
+    Name of a portal's output files: its 'name', if given, and otherwise the city name from its URL
+    """
+    return portal.get('name') or get_city_from_url(portal['url'])
+
+
+def check_portal_names(portals):
+    """
+    Raises ValueError if two portals would write to the same output files (or the same portal is given twice), e.g.
+    portals on different ports or paths of one host, which have to be told apart with a 'name'
+    """
+    names = {}
+    for portal in portals:
+        names.setdefault(portal_name(portal), []).append(portal['url'])
+    duplicates = {name: urls for name, urls in names.items() if len(urls) > 1}
+    if duplicates:
+        raise ValueError('Portals with the same output name, give them distinct names: {}'.format(
+            '; '.join('{} ({})'.format(name, ', '.join(urls)) for name, urls in sorted(duplicates.items()))))
+
+
+def portals_progress(counts, names=None):
+    """
+    String displaying the aggregate progress of a multi-city scrape, with the throughput of each portal. counts is
+    keyed by portal URL, and names maps the URLs to the names displayed (by default their host names).
+    """
+    names = names or {}
+    total = sum(count for count, _, _ in counts.values())
+    cities = '\t'.join('{}: {:d} ({:.2f} req/s{})'.format(names.get(url) or urlparse(url).hostname, count,
+                                                          count / elapsed if elapsed else 0.0, ', done' if done else '')
+                       for url, (count, elapsed, done) in sorted(counts.items()))
+    return 'Total requests scraped: {:d}\t{}\n'.format(total, cities)
+
+
+def scrape_portals(portals, path='data/', processes=None, report_interval=60, log='', **kwargs):
+    """
+    Scrapes several NextRequest portals in parallel, each in its own worker process with its own session (or
+    browser) and rate limiter. portals is a list of dicts as described in scrape_portal, and the remaining keyword
+    arguments are passed on to it. Aggregate progress and per-city throughput are logged every report_interval
+    seconds. Returns a dict of portal URL -> number of requests scraped. Raises ValueError before scraping if two
+    portals would share output files (see check_portal_names).
+    """
+    check_portal_names(portals)
+    names = {portal['url']: portal_name(portal) for portal in portals}
+    counts = {portal['url']: (0, 0.0, False) for portal in portals}
+    results = {}
+    start = timer()
+    log_msg('Start time: {}\tPortals: {}\n\n'.format(str(datetime.now()), ', '.join(counts)), log=log)
+
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=processes or len(portals)) as executor:
+        progress_queue = manager.Queue()
+        futures = {executor.submit(scrape_portal, portal, path, progress_queue, **kwargs):
+                   portal['url'] for portal in portals}
+
+        last_report = timer()
+        while any(not future.done() for future in futures) or not progress_queue.empty():
+            try:
+                url, count, elapsed, done = progress_queue.get(timeout=1)
+                counts[url] = (count, elapsed, done)
+            except queue.Empty:
+                pass
+            if timer() - last_report >= report_interval:
+                log_msg(portals_progress(counts, names), log=log)
+                last_report = timer()
+
+        for future, url in futures.items():
+            try:
+                results[url] = future.result()[1]
+            except Exception:
+                log_msg('Exception occurred while scraping {}\n{}\n'.format(url, traceback.format_exc()), log=log)
+                results[url] = counts[url][0]
+
+    log_msg(portals_progress(counts, names), log=log)
+    log_msg('Total runtime: {:.1f}s\n\nEnd time: {}\n\n{}\n\n'.format(timer() - start, str(datetime.now()), '*' * 25),
+            log=log)
+    return results
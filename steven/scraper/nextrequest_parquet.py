@@ -0,0 +1,120 @@
+"""
+Columnar Parquet output for the NextRequest scraper. Requests are stored as one table, with their documents and
+messages normalized into child tables keyed by request ID, so that analysis needs no per-row CSV parsing.
+"""
+
+import zipfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from nextrequest_scraper_utils import *
+
+
+# seq numbers the requests in the order they were appended. A request re-scraped after a restart appears twice, and
+# readers keep the copy with the highest seq together with the documents and messages of that copy
+REQUESTS_SCHEMA = pa.schema([('seq', pa.int64())] + [(field, pa.string()) for field in REQUEST_FIELDS
+                                                     if field not in ('docs', 'msgs')])
+DOCS_SCHEMA = pa.schema([('seq', pa.int64()), ('id', pa.string()), ('n', pa.int32()), ('title', pa.string()),
+                         ('link', pa.string())])
+MSGS_SCHEMA = pa.schema([('seq', pa.int64()), ('id', pa.string()), ('n', pa.int32()), ('title', pa.string()),
+                         ('item', pa.string()), ('time', pa.string())])
+
+
+def parquet_filenames(requests_name, path='data/'):
+    """
+    Filenames of the requests, documents and messages tables of a Parquet output
+    """
+    return {table: path + requests_name + suffix + '.parquet'
+            for table, suffix in [('requests', ''), ('docs', '_docs'), ('msgs', '_msgs')]}
+
+
+class ParquetRequestWriter:
+    """
+    Writes scraped requests to Parquet as the scrape proceeds, flushing a row group every row_group_size requests.
+    The writer wraps the requests list or CheckpointStore passed to NextRequestScraper, so it can be passed to the
+    scraper in its place; everything appended also goes to the wrapped requests. Use as a context manager, or call
+    close, to flush the last row group.
+    """
+
+    def __init__(self, requests, requests_name, path='data/', row_group_size=1000):
+        self.requests = requests
+        self.row_group_size = row_group_size
+        self.seq = 0
+        filenames = parquet_filenames(requests_name, path=path)
+        self.writers = {
+            'requests': pq.ParquetWriter(filenames['requests'], REQUESTS_SCHEMA),
+            'docs': pq.ParquetWriter(filenames['docs'], DOCS_SCHEMA),
+            'msgs': pq.ParquetWriter(filenames['msgs'], MSGS_SCHEMA)
+        }
+        self.schemas = {'requests': REQUESTS_SCHEMA, 'docs': DOCS_SCHEMA, 'msgs': MSGS_SCHEMA}
+        self.buffers = {table: [] for table in self.writers}
+        self.buffered = 0  # Requests in the current row group
+
+    def append(self, request):
+        self.requests.append(request)
+        if not (request and request.get('status')): return  # Incomplete requests are not exported, as with CSV
+
+        self.seq += 1
+        request_id = request['id']
+        self.buffers['requests'].append({'seq': self.seq, **{field: request.get(field) for field in
+                                                            ['id', 'status', 'desc', 'date', 'depts', 'poc']}})
+        self.buffers['docs'].extend({'seq': self.seq, 'id': request_id, 'n': n, 'title': row[0], 'link': row[1]}
+                                    for n, row in enumerate(csv_rows(request.get('docs'))))
+        self.buffers['msgs'].extend({'seq': self.seq, 'id': request_id, 'n': n, 'title': row[0], 'item': row[1],
+                                     'time': row[2]}
+                                    for n, row in enumerate(csv_rows(request.get('msgs'))))
+
+        self.buffered += 1
+        if self.buffered >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered requests as one row group of each table
+        """
+        for table, writer in self.writers.items():
+            if self.buffers[table]:
+                writer.write_table(pa.Table.from_pylist(self.buffers[table], schema=self.schemas[table]))
+            self.buffers[table] = []
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def pop(self):
+        return self.requests.pop()
+
+    def __getitem__(self, index):
+        return self.requests[index]
+
+    def __len__(self):
+        return len(self.requests)
+
+    def __iter__(self):
+        return iter(self.requests)
+
+    def __getattr__(self, name):  # Everything else, e.g. CheckpointStore.export, goes to the wrapped requests
+        return getattr(self.requests, name)
+
+
+def convert_zip_to_parquet(filename, requests_name, path='data/', chunksize=10000, row_group_size=10000):
+    """
+    Converts a zipped CSV written by convert_requests_to_csv (e.g. vallejo_requests.zip) into Parquet tables
+    """
+    with zipfile.ZipFile(filename, 'r') as zf, \
+            ParquetRequestWriter([], requests_name, path=path, row_group_size=row_group_size) as writer:
+        for chunk in pd.read_csv(zf.open(zf.namelist()[0]), dtype=str, chunksize=chunksize):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for request in chunk.to_dict('records'):
+                writer.append(request)
+            writer.requests.clear()  # Nothing needs to be kept in memory
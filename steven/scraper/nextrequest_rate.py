@@ -0,0 +1,237 @@
+"""
+Rate limiting used by the NextRequest scrapers, so that politeness is enforced per portal host rather than with fixed
+sleeps between requests. AdaptiveRateLimiter additionally adjusts each host's rate to how the portal responds.
+"""
+
+import threading
+from time import sleep
+from timeit import default_timer as timer
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second on average, with bursts of up to `capacity` requests. A
+    non-positive rate disables limiting.
+    """
+
+    def __init__(self, rate, capacity=1, clock=timer, sleep=sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def reserve(self):
+        """
+        Takes a token, returning the number of seconds the caller has to wait before using it. Tokens may be reserved
+        ahead of time, in which case later callers wait correspondingly longer.
+        """
+        if not self.rate or self.rate <= 0: return 0
+
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available right now, without reserving one ahead of time
+        """
+        if not self.rate or self.rate <= 0: return True
+
+        with self.lock:
+            self.refill()
+            if self.tokens < 1: return False
+            self.tokens -= 1
+            return True
+
+    def set_rate(self, rate):
+        """
+        Changes the rate, keeping the tokens accumulated at the old rate
+        """
+        with self.lock:
+            self.refill()
+            self.rate = rate
+
+    def pause(self, seconds):
+        """
+        Withholds tokens for the given number of seconds, e.g. as requested by a Retry-After header
+        """
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def acquire(self):
+        """
+        Blocks until a token is available
+        """
+        delay = self.reserve()
+        if delay > 0: self.sleep(delay)
+
+
+class HostRateLimiter:
+    """
+    Keeps an independent token bucket for each host, so that several portals can be scraped at their own pace.
+    """
+
+    def __init__(self, rate, capacity=1, clock=timer, sleep=sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        """
+        Gets the token bucket of the host of a URL, creating it if necessary
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, capacity=self.capacity, clock=self.clock,
+                                                 sleep=self.sleep)
+            return self.buckets[host]
+
+    def reserve(self, url):
+        """
+        Takes a token for the host of a URL, returning the number of seconds to wait before using it
+        """
+        return self.bucket(url).reserve()
+
+    def acquire(self, url):
+        """
+        Blocks until a token is available for the host of a URL
+        """
+        self.bucket(url).acquire()
+
+    def record(self, url, status=None, latency=None, redirected=False, retry_after=None, failed=False):
+        """
+        Reports how the portal responded to a request. A fixed rate ignores it, see AdaptiveRateLimiter.
+        """
+        pass
+
+
+class AdaptiveRateLimiter(HostRateLimiter):
+    """
+    Host rate limiter that adapts each host's rate to how the portal responds, additive-increase/multiplicative-
+    decrease style. Every healthy response raises the rate by `increase` requests per second, up to `ceiling`. The rate
+    is multiplied by `decrease`, down to `floor`, on throttling (HTTP 429) and server errors (5xx), on failed requests,
+    on responses slower than target_latency seconds, and on a run of `redirect_run` consecutive redirects to the
+    request listing, which is how a portal may turn away a scraper (isolated redirects are just missing IDs). Decreases
+    are applied at most once per `cooldown` seconds, so that a burst of concurrent failures counts once. A Retry-After
+    header pauses the host for the requested time.
+
+    Time is read from clock and waited with sleep, which can be replaced by a SimulatedClock.
+    """
+
+    def __init__(self, rate=1, floor=0.05, ceiling=10, increase=0.05, decrease=0.5, target_latency=None,
+                 redirect_run=5, cooldown=1.0, capacity=1, clock=timer, sleep=sleep):
+        super().__init__(rate, capacity=capacity, clock=clock, sleep=sleep)
+        self.floor = floor
+        self.ceiling = ceiling
+        self.increase = increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.redirect_run = redirect_run
+        self.cooldown = cooldown
+        self.state = {}  # Host -> consecutive redirects, time of the last decrease and response counts
+
+    def host_state(self, host):
+        if host not in self.state:
+            self.state[host] = {'redirects': 0, 'last_decrease': None, 'healthy': 0, 'throttled': 0, 'errors': 0,
+                                'slow': 0, 'decreases': 0}
+        return self.state[host]
+
+    def record(self, url, status=None, latency=None, redirected=False, retry_after=None, failed=False):
+        """
+        Reports how the portal responded to a request: its HTTP status, its latency in seconds, whether it redirected
+        to the request listing, the Retry-After header in seconds, or that it failed without a response
+        """
+        bucket = self.bucket(url)
+        with self.lock:
+            state = self.host_state(urlparse(url).netloc)
+            if status == 429:
+                state['throttled'] += 1
+                congested = True
+            elif failed or (status is not None and status >= 500):
+                state['errors'] += 1
+                congested = True
+            elif self.target_latency and latency is not None and latency > self.target_latency:
+                state['slow'] += 1
+                congested = True
+            else:
+                congested = False
+
+            state['redirects'] = state['redirects'] + 1 if redirected else 0
+            if self.redirect_run and state['redirects'] >= self.redirect_run:
+                state['redirects'] = 0
+                congested = True
+
+            now = self.clock()
+            if congested:
+                if state['last_decrease'] is None or now - state['last_decrease'] >= self.cooldown:
+                    state['last_decrease'] = now
+                    state['decreases'] += 1
+                    bucket.set_rate(max(self.floor, bucket.rate * self.decrease))
+            elif not redirected:  # Redirects only count in runs, so they neither slow down nor speed up
+                state['healthy'] += 1
+                bucket.set_rate(min(self.ceiling, bucket.rate + self.increase))
+
+        if retry_after:
+            bucket.pause(retry_after)
+
+    def rates(self):
+        """
+        Current rate of each host in requests per second
+        """
+        with self.lock:
+            return {host: bucket.rate for host, bucket in self.buckets.items()}
+
+    def stats(self):
+        """
+        Current rate and response counts of each host
+        """
+        rates = self.rates()
+        with self.lock:
+            return {host: {'rate': rates.get(host), **state} for host, state in self.state.items()}
+
+
+class SimulatedClock:
+    """
+    Clock for running rate limiters in simulated time: sleeping advances the clock instantly. Pass the instance as
+    clock and its sleep method as sleep.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now += max(seconds, 0)
+
+    def advance(self, seconds):
+        self.sleep(seconds)
+
+
+def retry_after_seconds(response):
+    """
+    Seconds to wait requested by the Retry-After header of a response, or None. HTTP dates are not supported.
+    """
+    value = response.headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
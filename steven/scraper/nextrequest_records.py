@@ -0,0 +1,329 @@
+"""
+Compact in-memory representation of scraped NextRequest requests. Rows are held as slotted records instead of dicts,
+repeated values such as statuses and department names are interned, and a RequestBatch flushes its records into
+columnar Arrow tables (or pandas DataFrames without pyarrow) in bulk, keeping only the latest copy of each request on
+export.
+"""
+
+import zipfile
+from dataclasses import dataclass, fields
+from datetime import timedelta
+from io import TextIOWrapper
+
+import numpy as np
+import pandas as pd
+
+from nextrequest_scraper_utils import *
+
+try:  # Flushed chunks are kept as Arrow tables if available, and as pandas DataFrames otherwise
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+INTERNED_FIELDS = ['status', 'date', 'depts', 'poc']  # Fields that repeat across requests
+
+
+@dataclass(slots=True)
+class DocumentRecord:
+    request_id: str
+    n: int
+    title: str
+    link: str
+
+
+@dataclass(slots=True)
+class EventRecord:
+    request_id: str
+    n: int
+    title: str
+    item: str
+    time: str
+
+
+@dataclass(slots=True)
+class RequestRecord:
+    """
+    A scraped request, with the same fields as the row dicts appended by NextRequestScraper. Supports read access by
+    key (record['id'], record.get('docs')), so it can be used wherever a row dict is read.
+    """
+    id: str = None
+    status: str = None
+    desc: str = None
+    date: str = None
+    depts: str = None
+    docs: str = None
+    poc: str = None
+    msgs: str = None
+
+    @classmethod
+    def from_dict(cls, row):
+        return cls(*(row.get(field) for field in REQUEST_FIELDS))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in REQUEST_FIELDS}
+
+    def __getitem__(self, key):
+        if key not in REQUEST_FIELDS: raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in REQUEST_FIELDS else default
+
+    def documents(self):
+        """
+        The documents of the request, parsed from its docs CSV
+        """
+        return [DocumentRecord(self.id, n, *row[:2]) for n, row in enumerate(csv_rows(self.docs))]
+
+    def events(self):
+        """
+        The messages of the request, parsed from its msgs CSV
+        """
+        return [EventRecord(self.id, n, *row[:3]) for n, row in enumerate(csv_rows(self.msgs))]
+
+
+@dataclass(slots=True)
+class TimeToCloseRecord:
+    """
+    Department and time to close of a request, as collected by the San Diego scraper (sai/main.py)
+    """
+    request_id: str
+    department: str
+    time_to_close: timedelta = None
+
+
+class TimeToCloseBatch:
+    """
+    Container of TimeToCloseRecords with the department names interned, converted to a DataFrame in bulk
+    """
+    COLUMNS = ['Request ID', 'Department', 'Time to Close']
+
+    def __init__(self):
+        self.records = []
+        self.values = {}  # Interned department names
+
+    def append(self, record):
+        if not isinstance(record, TimeToCloseRecord): record = TimeToCloseRecord(*record)
+        if record.department is not None:
+            record.department = self.values.setdefault(record.department, record.department)
+        self.records.append(record)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def to_pandas(self):
+        """
+        DataFrame with one row per request and the department as a category
+        """
+        return pd.DataFrame({
+            'Request ID': [record.request_id for record in self.records],
+            'Department': pd.Series([record.department for record in self.records], dtype='category'),
+            'Time to Close': pd.to_timedelta(pd.Series([record.time_to_close for record in self.records],
+                                                       dtype=object))
+        }, columns=self.COLUMNS)
+
+
+class RequestBatch:
+    """
+    Container of scraped requests supporting the parts of the list interface used by NextRequestScraper (append, pop,
+    [-1], len and iteration), so it can be passed to NextRequestScraper.scrape or scrape_ids in place of the requests
+    list. Appended rows are stored as RequestRecords with their repeated values interned; every flush_size requests the
+    buffered records are converted in bulk into a columnar chunk (an Arrow table with dictionary-encoded repeated
+    fields, or a pandas DataFrame with categorical ones without pyarrow), which holds strings far more compactly than
+    Python objects.
+
+    The batch records the latest copy of each request ID, so to_pandas, to_arrow and export return every complete
+    request once, without drop_duplicates.
+    """
+
+    def __init__(self, flush_size=10000):
+        self.flush_size = flush_size
+        self.buffer = []  # Records appended since the last flush
+        self.buffer_seqs = []
+        self.chunks = []  # (first seq, chunk) of the flushed records, in order
+        self.seq = 0  # Sequence number of the last record appended
+        self.latest = {}  # Request ID -> seq of its latest complete copy
+        self.superseded = {}  # Seq of a re-scraped copy -> seq of the copy it replaced, to restore it on pop
+        self.popped = set()  # Seqs of flushed records that were popped
+        self.values = {}  # Interned values of the repeated fields
+
+    def intern(self, value):
+        if value is None: return None
+        return self.values.setdefault(value, value)
+
+    def append(self, row):
+        record = row if isinstance(row, RequestRecord) else RequestRecord.from_dict(row)
+        for field in INTERNED_FIELDS:
+            setattr(record, field, self.intern(getattr(record, field)))
+        self.seq += 1
+        self.buffer.append(record)
+        self.buffer_seqs.append(self.seq)
+        if record.status:  # Incomplete rows are not exported, as with convert_requests_to_csv
+            if record.id in self.latest: self.superseded[self.seq] = self.latest[record.id]
+            self.latest[record.id] = self.seq
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def flush(self):
+        """
+        Converts the buffered records into a columnar chunk
+        """
+        if not self.buffer: return
+        columns = {field: [getattr(record, field) for record in self.buffer] for field in REQUEST_FIELDS}
+        if pa is not None:
+            chunk = pa.table({field: pa.array(values, type=pa.string()).dictionary_encode()
+                              if field in INTERNED_FIELDS else pa.array(values, type=pa.string())
+                              for field, values in columns.items()})
+        else:
+            chunk = pd.DataFrame(columns)
+            for field in INTERNED_FIELDS:
+                chunk[field] = chunk[field].astype('category')
+        self.chunks.append((self.buffer_seqs[0], chunk))
+        self.buffer, self.buffer_seqs = [], []
+
+    @staticmethod
+    def chunk_record(chunk, i):
+        """
+        The i-th record of a flushed chunk
+        """
+        if pa is not None and isinstance(chunk, pa.Table):
+            return RequestRecord.from_dict(chunk.slice(i, 1).to_pylist()[0])
+        return RequestRecord(*(None if pd.isna(value) else value for value in chunk[REQUEST_FIELDS].iloc[i]))
+
+    @staticmethod
+    def chunk_records(chunk):
+        """
+        Generates the records of a flushed chunk
+        """
+        if pa is not None and isinstance(chunk, pa.Table):
+            for batch in chunk.to_batches():
+                yield from (RequestRecord.from_dict(row) for row in batch.to_pylist())
+        else:
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            yield from (RequestRecord(*row) for row in chunk[REQUEST_FIELDS].itertuples(index=False))
+
+    def iter_seqs(self):
+        """
+        Generates the (seq, record) of every stored record, in the order they were appended
+        """
+        for first_seq, chunk in self.chunks:
+            for seq, record in enumerate(self.chunk_records(chunk), start=first_seq):
+                if seq not in self.popped: yield seq, record
+        yield from zip(self.buffer_seqs, self.buffer)
+
+    def __iter__(self):
+        return (record for _, record in self.iter_seqs())
+
+    def __len__(self):
+        return sum(len(chunk) for _, chunk in self.chunks) - len(self.popped) + len(self.buffer)
+
+    def last(self):
+        """
+        (seq, record) of the last stored record, reading back into the flushed chunks if the buffer is empty
+        """
+        if self.buffer: return self.buffer_seqs[-1], self.buffer[-1]
+        for first_seq, chunk in reversed(self.chunks):
+            for i in reversed(range(len(chunk))):
+                if first_seq + i not in self.popped: return first_seq + i, self.chunk_record(chunk, i)
+        raise IndexError('RequestBatch is empty')
+
+    def record(self, seq):
+        """
+        The record with the given seq
+        """
+        if self.buffer_seqs and seq >= self.buffer_seqs[0]:
+            return self.buffer[seq - self.buffer_seqs[0]]
+        for first_seq, chunk in self.chunks:
+            if first_seq <= seq < first_seq + len(chunk): return self.chunk_record(chunk, seq - first_seq)
+        raise KeyError(seq)
+
+    def __getitem__(self, index):
+        if index != -1: raise IndexError('RequestBatch only supports reading the last request')
+        return self.last()[1]
+
+    def pop(self):
+        """
+        Removes and returns the last appended request
+        """
+        if self.buffer:
+            seq, record = self.buffer_seqs.pop(), self.buffer.pop()
+        else:
+            seq, record = self.last()
+            self.popped.add(seq)
+        if self.latest.get(record.id) == seq:  # Restore the copy it replaced, if any
+            earlier = self.superseded.pop(seq, None)
+            if earlier is None:
+                del self.latest[record.id]
+            else:
+                self.latest[record.id] = earlier
+        return record
+
+    def get(self, request_id):
+        """
+        Gets the latest complete copy of a request, or None if it has not been scraped
+        """
+        seq = self.latest.get(request_id)
+        return self.record(seq) if seq is not None else None
+
+    def to_arrow(self):
+        """
+        Arrow table of the latest complete copy of every request, in the order they were appended
+        """
+        if pa is None: raise ImportError('to_arrow requires pyarrow')
+        keep = np.fromiter(self.latest.values(), dtype=np.int64, count=len(self.latest))
+        self.flush()
+        tables = []
+        for first_seq, chunk in self.chunks:
+            mask = np.isin(np.arange(first_seq, first_seq + len(chunk)), keep)
+            tables.append(chunk.filter(mask).cast(pa.schema([(field, pa.string()) for field in REQUEST_FIELDS])))
+        return pa.concat_tables(tables) if tables else pa.table({field: pa.array([], pa.string())
+                                                                 for field in REQUEST_FIELDS})
+
+    def to_pandas(self):
+        """
+        DataFrame of the latest complete copy of every request, in the order they were appended
+        """
+        if pa is not None:
+            return self.to_arrow().to_pandas()
+        keep = set(self.latest.values())
+        return pd.DataFrame([record.to_dict() for seq, record in self.iter_seqs() if seq in keep],
+                            columns=REQUEST_FIELDS)
+
+    def documents(self):
+        """
+        DataFrame of the documents of every request, one row per document
+        """
+        return pd.DataFrame([document for record in self.iter_latest() for document in record.documents()],
+                            columns=[field.name for field in fields(DocumentRecord)])
+
+    def events(self):
+        """
+        DataFrame of the messages of every request, one row per message
+        """
+        return pd.DataFrame([event for record in self.iter_latest() for event in record.events()],
+                            columns=[field.name for field in fields(EventRecord)])
+
+    def iter_latest(self):
+        keep = set(self.latest.values())
+        return (record for seq, record in self.iter_seqs() if seq in keep)
+
+    def export(self, requests_name, path='data/', log=''):
+        """
+        Writes the latest copy of every complete request to a zipped CSV file, in the same format as
+        convert_requests_to_csv
+        """
+        try:
+            with zipfile.ZipFile(path + requests_name + '.zip', 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                with TextIOWrapper(zf.open(requests_name + '.csv', 'w'), encoding='utf-8', newline='') as f:
+                    self.to_pandas().to_csv(f, index=False)
+            log_msg('Successfully converted requests into CSV\n\n', log=log)
+        except FileNotFoundError:
+            log_msg('Unable to convert requests into CSV\n\n', log=log)
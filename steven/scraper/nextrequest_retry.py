@@ -0,0 +1,148 @@
+"""
+Persistent retry queue for NextRequest requests that failed or were only partially scraped, so that they are re-tried
+with backoff instead of being stored with None fields and dropped on export.
+
+A separate worker can drain the queue of a running or finished scrape:
+Usage: python nextrequest_retry.py QUEUE_DB URL REQUESTS_DB
+"""
+
+import argparse
+import sqlite3
+import threading
+import time
+
+from nextrequest_scraper_utils import *
+
+
+class RetryQueue:
+    """
+    Queue of request IDs to re-scrape, backed by SQLite so that it survives crashes and can be shared with a separate
+    retry worker. Every failure of a request increments its attempt count and records the exception type; the request
+    is retried after base_delay * 2 ** (attempts - 1) seconds (at most max_delay), and given up on as permanently
+    failed after max_attempts attempts. Times are read from clock, wall-clock time by default.
+    """
+
+    def __init__(self, filename=':memory:', max_attempts=4, base_delay=30, max_delay=600, clock=time.time):
+        self.filename = filename
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.lock = threading.Lock()  # The connection is shared between scraper threads
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        if filename != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS retries (id TEXT PRIMARY KEY, attempts INTEGER, error TEXT, '
+                          'state TEXT, next_attempt REAL, updated REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS retries_due ON retries (state, next_attempt)')
+        self.conn.commit()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def backoff(self, attempts):
+        """
+        Seconds to wait before the next attempt of a request that failed `attempts` times
+        """
+        return min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+
+    def push(self, request_id, error=None):
+        """
+        Records a failed attempt at a request, with the exception (or exception type) that caused it. Returns True if
+        the request will be retried, and False if it has now failed permanently.
+        """
+        error = error.__name__ if isinstance(error, type) else type(error).__name__ if isinstance(error, BaseException) \
+            else error
+        now = self.clock()
+        with self.lock:
+            row = self.conn.execute('SELECT attempts FROM retries WHERE id = ?', (request_id,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            state = 'pending' if attempts < self.max_attempts else 'failed'
+            self.conn.execute('INSERT OR REPLACE INTO retries VALUES (?, ?, ?, ?, ?, ?)',
+                              (request_id, attempts, error, state, now + self.backoff(attempts), now))
+            self.conn.commit()
+        return state == 'pending'
+
+    def done(self, request_id):
+        """
+        Marks a queued request as successfully scraped. The database is checked rather than the requests pushed in this
+        process, since the request may have been queued by another scrape sharing the queue. Requests that are not
+        pending are left unchanged.
+        """
+        with self.lock:
+            cursor = self.conn.execute("UPDATE retries SET state = 'done', updated = ? WHERE id = ? AND state = 'pending'",
+                                       (self.clock(), request_id))
+            if cursor.rowcount: self.conn.commit()
+
+    def due(self, limit=None):
+        """
+        IDs of the pending requests whose backoff has elapsed, in the order they are due
+        """
+        rows = self.query("SELECT id FROM retries WHERE state = 'pending' AND next_attempt <= ? ORDER BY next_attempt"
+                          + (' LIMIT {:d}'.format(limit) if limit else ''), (self.clock(),))
+        return [row[0] for row in rows]
+
+    def next_due_in(self):
+        """
+        Seconds until the next pending request is due (0 if one is due already), or None if nothing is pending
+        """
+        next_attempt = self.query("SELECT MIN(next_attempt) FROM retries WHERE state = 'pending'")[0][0]
+        return None if next_attempt is None else max(0.0, next_attempt - self.clock())
+
+    def pending(self):
+        return self.query("SELECT COUNT(*) FROM retries WHERE state = 'pending'")[0][0]
+
+    def failed(self):
+        """
+        List of (id, attempts, exception type) of the requests that failed permanently
+        """
+        return self.query("SELECT id, attempts, error FROM retries WHERE state = 'failed' ORDER BY id")
+
+    def counts(self):
+        """
+        Number of queued requests in each state (pending, done, failed)
+        """
+        return dict(self.query('SELECT state, COUNT(*) FROM retries GROUP BY state'))
+
+    def report(self):
+        """
+        String displaying the retry counts and listing the permanently failed request IDs
+        """
+        counts = self.counts()
+        failed = self.failed()
+        msg = 'Retried requests recovered: {:d}\tPending: {:d}\tPermanently failed: {:d}\n'.format(
+            counts.get('done', 0), counts.get('pending', 0), counts.get('failed', 0))
+        if failed:
+            msg += 'Permanently failed requests:\n' + ''.join('{}\t{} attempts\t{}\n'.format(*row) for row in failed)
+        return msg + '\n'
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Retry the failed requests of a NextRequest scrape')
+    parser.add_argument('queue', help='Retry queue database of the scrape')
+    parser.add_argument('url', help='Request URL prefix of the portal, e.g. https://lacity.nextrequest.com/requests/')
+    parser.add_argument('requests', help='CheckpointStore database the retried requests are appended to')
+    parser.add_argument('--log', default='', help='Log file')
+    args = parser.parse_args()
+
+    from nextrequest_scraper import NextRequestScraper
+    from nextrequest_checkpoint import CheckpointStore
+
+    with RetryQueue(args.queue) as retry_queue:
+        store = CheckpointStore(args.requests)
+        try:
+            scraper = NextRequestScraper(None, args.url, backend='html', retry_queue=retry_queue)
+            scraper.retry_failed(store, log=args.log)
+        finally:
+            store.close()
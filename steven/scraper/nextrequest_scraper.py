@@ -2,40 +2,171 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import NoSuchElementException, TimeoutException, StaleElementReferenceException
 
+import sys
 import traceback
 from timeit import default_timer as timer
 from time import sleep
 from datetime import datetime
+from urllib.parse import urljoin, urldefrag
+
+from lxml import html as lxml_html
 
 from nextrequest_scraper_utils import *
+from nextrequest_html import make_session, fetch_request_page, parse_request_page, parse_request_summary, \
+    parse_time_quotes, is_listing_url, fetch_document_pages, unique_documents, MissingElementException
+from nextrequest_async import scrape_ids_async, run_async
+from nextrequest_rate import HostRateLimiter
+from nextrequest_driver_pool import scrape_ids_pooled
+from nextrequest_js import scrape_request_js
+from nextrequest_incremental import load_previous_requests, incremental_action, incremental_summary, \
+    msgs_time_quotes, INCREMENTAL_ACTIONS
+from nextrequest_timing import TimingLog
+from nextrequest_archive import PageArchive
+
+
+BACKENDS = ('selenium', 'html')
+EXTRACTIONS = ('elements', 'js')
 
 
 class NextRequestScraper:
     """
-    Scraper scripts for NextRequest request databases. Currently does not scrape all possible documents from each
-    request due to difficulties with navigation bars, but the number of such documents can be recovered from the
-    messages.
+    Scraper scripts for NextRequest request databases. Every page of a paginated document list is scraped, with
+    further pages fetched over HTTP; check_document_counts compares the result with the released document counts
+    recorded in the messages.
+
+    Two backends are available: 'selenium' drives a browser, while 'html' fetches request pages with a pooled HTTP
+    session and parses them with lxml, which is much faster but relies on the page HTML containing every field.
+
+    The Selenium backend reads pages either element by element ('elements' extraction) or with a single injected
+    script per page ('js' extraction), falling back to the element-by-element path if the script fails.
+
+    If a timing log is given, every scraped request is recorded there with the time spent in each phase (see
+    nextrequest_timing), which can be summarized with python nextrequest_timing.py <timing log>.
+
+    If a page archive is given, the HTML of every request page is kept (see nextrequest_archive), so that the
+    requests can later be re-parsed offline with reparse_archive instead of being scraped again.
     """
 
-    def __init__(self, driver, url, wait_time=0.1):
+    def __init__(self, driver, url, wait_time=0.1, backend='selenium', session=None, limiter=None,
+                 extraction='elements', timing_log='', retry_queue=None, archive=None, cache=None):
         """
-        Constructor for NextRequestScraper
+        Constructor for NextRequestScraper. url is the request URL prefix of the portal, e.g.
+        https://lacity.nextrequest.com/requests/, limiter an optional HostRateLimiter applied to every page load (an
+        AdaptiveRateLimiter also adapts to the portal's responses), timing_log an optional filename (or TimingLog) to
+        record per-request timings to, retry_queue an optional RetryQueue that failed requests are pushed to instead
+        of being stored incomplete, archive an optional filename (or PageArchive) to store the fetched pages in and
+        cache an optional PageCache through which the HTML backend revalidates pages instead of downloading them again.
         """
-        self.driver = driver if 'webdriver' in str(type(driver)) else webdriver.Firefox()
-        self.driver.implicitly_wait(wait_time)
-        self.url = url if ((type(url) == str) and ('nextrequest.com' in url) and ('requests/' in url)) \
-            else 'https://lacity.nextrequest.com/requests/'
-        
+        if not ((type(url) == str) and url.startswith(('http://', 'https://')) and url.endswith('requests/')):
+            raise ValueError('Invalid NextRequest URL {}, expected e.g. https://lacity.nextrequest.com/requests/'.format(url))
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend {}, expected one of {}'.format(backend, BACKENDS))
+        if extraction not in EXTRACTIONS:
+            raise ValueError('Unknown extraction {}, expected one of {}'.format(extraction, EXTRACTIONS))
+        self.backend = backend
+        self.extraction = extraction
+
+        if backend == 'selenium':
+            self.driver = driver if 'webdriver' in str(type(driver)) else webdriver.Firefox()
+            self.driver.implicitly_wait(wait_time)
+        else:
+            self.driver = None
+            self.page = None  # Parsed HTML of the current request page
+            self.page_url = None  # URL of the current request page
+        self.session = session if session is not None else make_session()  # Also fetches document list pages
+        self.url = url
+        self.limiter = limiter
+
+        self.previous = None  # Previous scrape consulted in incremental mode
+        self.incremental_stats = dict.fromkeys(INCREMENTAL_ACTIONS, 0)
+
+        self.timings = timing_log if isinstance(timing_log, TimingLog) else TimingLog(timing_log)
+        self.retry_queue = retry_queue
+        self.archive = PageArchive(archive) if isinstance(archive, str) else archive
+        self.cache = cache
+        self.navigation = 0.0  # Time spent navigating to the current request page, recorded with its timings
+
+    def get(self, request_id):
+        """
+        Navigates to the page of the given request ID
+        """
+        start = timer()
+        if self.backend == 'html':
+            self.load_page(self.url + request_id)
+        else:
+            if self.limiter is not None: self.limiter.acquire(self.url)
+            self.driver.get(self.url + request_id)
+            if self.limiter is not None:
+                self.limiter.record(self.url, latency=timer() - start,
+                                    redirected=is_listing_url(self.driver.current_url))
+        self.navigation = timer() - start
+
+    def load_page(self, url):
+        """
+        Fetches and parses a request page for the HTML backend
+        """
+        if self.limiter is not None: self.limiter.acquire(url)
+        page = fetch_request_page(self.session, url, limiter=self.limiter, cache=self.cache)
+        if page is None:
+            raise MissingElementException('Request page {} redirected to the request listing'.format(url))
+        if self.archive is not None: self.archive.put(url, page)
+        self.page = lxml_html.fromstring(page)
+        self.page_url = url
+
+    def current_request_id(self, driver=None):
+        """
+        ID of the request page currently loaded, read from its URL, or None if it cannot be determined
+        """
+        try:
+            url = self.page_url if self.backend == 'html' else (driver or self.driver).current_url
+        except Exception:  # E.g. the browser crashed
+            return None
+        if not (url and url.startswith(self.url)): return None
+        return url[len(self.url):].split('?')[0].split('#')[0].strip('/') or None
+
+    def find_next_request(self):
+        """
+        Finds the link to the request after the current one, raising NoSuchElementException if there is none
+        """
+        if self.backend == 'html':
+            links = [link.get('href') for link in self.page.find_class('js-next-request') if link.get('href')]
+            if not links:
+                raise NoSuchElementException('Could not find js-next-request link')
+            return urljoin(self.page_url, links[0])
+        return self.driver.find_element(By.CLASS_NAME, 'js-next-request')
+
+    def next_request(self):
+        """
+        Navigates to the request after the current one
+        """
+        start = timer()
+        next_request = self.find_next_request()
+        if self.backend == 'html':
+            self.load_page(next_request)
+        else:
+            if self.limiter is not None: self.limiter.acquire(self.url)
+            next_request.click()
+            if self.limiter is not None: self.limiter.record(self.url, latency=timer() - start)
+        self.navigation = timer() - start
 
     def scrape(self, requests, earliest_id, requests_name='requests', path='data/',
-               num_requests=-1, timeout=10, progress=100, debug=0, log=''):
+               num_requests=-1, timeout=10, progress=100, debug=0, log='', previous=None):
         """
         Main scraper routine
         TODO: Add better documentation
+
+        requests can be a list, a CheckpointStore or a RequestBatch. With a CheckpointStore every request is written to
+        disk as soon as it is scraped, and a store left behind by an earlier run resumes from its last request. A
+        RequestBatch keeps the requests compactly in memory (see nextrequest_records).
+
+        If previous is given (see load_previous_requests), the scrape is incremental: requests that were closed in the
+        previous scrape, or whose status, event count and newest event time are unchanged, keep their previous row
+        instead of having their documents and messages scraped again.
         """
         num_its = 1  # Keeps track of how many times the scraper has been (re-)run
         it_num_line = ''  # For warning suppression purposes
         if log == -1: log = path + requests_name + '.log'  # If no directory is specified, use parameters to generate default
+        self.set_previous(previous)
 
         # Initialize the current ID to be either the earliest ID possible if the requests list is empty, or the last ID
         # in the list
@@ -46,7 +177,7 @@ class NextRequestScraper:
             current_id = earliest_id
 
         # Get the initial request URL
-        self.driver.get(self.url + current_id)
+        self.get(current_id)
 
         # Initial log message
         log_msg('Start time: {}\n\n'.format(str(datetime.now())), log=log)
@@ -68,12 +199,13 @@ class NextRequestScraper:
                 # Stop scraping if number of requests reached
                 if not num_requests: break
 
+                # The iteration ended early, so slow down before restarting the driver if the rate is adaptive
+                if self.limiter is not None: self.limiter.record(self.url, failed=True)
                 sleep(timeout)  # Wait for the specified amount of time before restarting the driver
 
                 current_id = requests[-1]['id']  # Restart the driver at the last request scraped
-                self.driver.get(self.url + current_id)  # Get the request URL
-                self.driver.find_element(By.CLASS_NAME,
-                                         'js-next-request')  # Check if there are more requests after the current one
+                self.get(current_id)  # Get the request URL
+                self.find_next_request()  # Check if there are more requests after the current one
 
                 requests.pop()
                 num_requests += 1  # Since the last request will be re-scraped, increase # of requests left to scrape by 1
@@ -93,10 +225,126 @@ class NextRequestScraper:
                 log_msg('Exception occurred between scraper iterations\n{}\n{}\n\n'.format(traceback.format_exc(), it_num_line), log=log)
                 break
 
-        convert_requests_to_csv(requests, requests_name, path=path, log=log)
+        if self.retry_queue is not None:  # Finish the failed requests before exporting
+            self.retry_failed(requests, debug=debug, log=log)
+
+        if hasattr(requests, 'export'):  # CheckpointStore, possibly wrapped
+            requests.export(requests_name, path=path, log=log)
+        else:
+            convert_requests_to_csv(requests, requests_name, path=path, log=log)
+        self.timings.flush()
+        if self.previous is not None:
+            log_msg(incremental_summary(self.incremental_stats), log=log)
+        if self.cache is not None:
+            log_msg(self.cache.report(), log=log)
         log_msg('End time: {}\n\n{}\n\n'.format(str(datetime.now()), '*'*25), log=log)
         return len(requests)
 
+    def scrape_ids(self, requests, ids, concurrency=10, rate=0, burst=1, limiter=None, progress=100, debug=0, log='',
+                   previous=None, pool=None):
+        """
+        Scrapes the given request IDs concurrently with the HTML backend instead of walking the database one request
+        at a time, appending each scraped request to the given list, CheckpointStore (skipping IDs already in the
+        store) or RequestBatch. At most `concurrency` pages are fetched at once, and the portal is sent at most `rate` requests per
+        second (unlimited if non-positive) with bursts of up to `burst` requests, unless a limiter is given here or to
+        the constructor. For best results the session should be created with make_session(pool_size=concurrency).
+        Returns a dict of run statistics, including the throughput in requests per second.
+
+        If previous is given, the scrape is incremental as in scrape, and requests closed in the previous scrape are
+        not fetched at all.
+
+        With the Selenium backend, pages are loaded concurrently by the browsers of the given DriverPool instead, one
+        worker per browser, and concurrency is ignored.
+
+        With a retry queue, failed requests are retried at the end of the run (see retry_failed), and the statistics
+        include the number of requests recovered and permanently failed.
+        """
+        if self.backend != 'html' and pool is None:
+            raise ValueError('Concurrent scraping with the selenium backend requires a DriverPool')
+        if hasattr(requests, 'scraped_ids'):  # Resume by skipping requests already scraped into a CheckpointStore
+            scraped_ids = requests.scraped_ids()
+            ids = (request_id for request_id in ids if request_id not in scraped_ids)
+        if limiter is None:
+            limiter = self.limiter if self.limiter is not None else HostRateLimiter(rate, capacity=burst)
+        self.set_previous(previous)
+        if self.backend == 'selenium':
+            stats = scrape_ids_pooled(self, requests, ids, pool, limiter=limiter, progress=progress, debug=debug,
+                                      log=log)
+            stats.update(self.incremental_stats)
+        else:
+            stats = run_async(scrape_ids_async(requests, self.url, ids, self.session, concurrency=concurrency,
+                                               limiter=limiter, progress=progress, debug=debug, log=log,
+                                               previous=self.previous, timings=self.timings,
+                                               retry_queue=self.retry_queue, archive=self.archive,
+                                               cache=self.cache))
+        if self.retry_queue is not None:
+            counts = self.retry_failed(requests, concurrency=concurrency, limiter=limiter, pool=pool, debug=debug,
+                                       log=log)
+            stats.update(recovered=counts.get('done', 0), failed=counts.get('failed', 0))
+        self.timings.flush()
+        if self.previous is not None:
+            log_msg(incremental_summary(stats), log=log)
+        if self.cache is not None:
+            log_msg(self.cache.report(), log=log)
+        return stats
+
+    def retry_failed(self, requests, concurrency=10, limiter=None, pool=None, wait=True, debug=0, log=''):
+        """
+        Re-scrapes the requests in the retry queue as their backoff elapses, appending them to requests once they
+        succeed, until every queued request has been scraped or has failed permanently (or, if wait is not set, until
+        no queued request is due). Uses the same concurrent paths as scrape_ids, or navigates to each request in turn
+        with the scraper's own browser if there is no DriverPool. Logs the final report, which lists the permanently
+        failed requests, and returns the number of queued requests in each state.
+        """
+        limiter = limiter if limiter is not None else self.limiter
+        while True:
+            ids = self.retry_queue.due()
+            if not ids:
+                wait_time = self.retry_queue.next_due_in()
+                if wait_time is None or not wait: break
+                sleep(wait_time)
+                continue
+
+            if debug: log_msg('Retrying {:d} failed requests\n'.format(len(ids)), log=log)
+            if self.backend == 'html':
+                run_async(scrape_ids_async(requests, self.url, ids, self.session, concurrency=concurrency,
+                                           limiter=limiter, progress=0, log=log, previous=self.previous,
+                                           timings=self.timings, retry_queue=self.retry_queue,
+                                           archive=self.archive, cache=self.cache))
+            elif pool is not None:
+                scrape_ids_pooled(self, requests, ids, pool, limiter=limiter, progress=0, log=log)
+            else:
+                for request_id in ids:
+                    try:
+                        self.get(request_id)
+                    except Exception as e:
+                        self.retry_queue.push(request_id, e)
+                        continue
+                    if is_listing_url(self.driver.current_url):  # The request no longer exists
+                        self.retry_queue.done(request_id)
+                        continue
+                    self.scrape_request(requests, log=log)
+
+        log_msg(self.retry_queue.report(), log=log)
+        return self.retry_queue.counts()
+
+    def set_previous(self, previous):
+        """
+        Sets the previous scrape consulted in incremental mode, resetting the incremental statistics
+        """
+        self.previous = load_previous_requests(previous) if previous is not None else None
+        self.incremental_stats = dict.fromkeys(INCREMENTAL_ACTIONS, 0)
+
+    def check_previous(self, request_id, status, get_time_quotes):
+        """
+        In incremental mode, returns the previously scraped row of a request if it can be reused, or None if the
+        request has to be fully scraped
+        """
+        previous_row = self.previous.get(request_id)
+        action = incremental_action(previous_row, status, get_time_quotes)
+        self.incremental_stats[action] += 1
+        return previous_row if action == 'skipped' else None
+
     def scrape_requests_sequential(self, requests, start_id, num_requests=-1, progress=0, debug=0, log=''):
         """
         Scrapes all records on a NextRequest request database starting from the ID URL passed into the driver and
@@ -107,6 +355,9 @@ class NextRequestScraper:
         start = timer()  # Timer for progress checking purposes
         counter = 0  # Keeps track of how many requests have been scraped
 
+        def final_progress(count):  # requests is empty if every request so far went to the retry queue
+            return scraper_progress_final(count, start, end=timer(), last_request=requests[-1]['id'] if requests else None)
+
         # Show the starting ID, if desired
         if progress: log_msg('Starting request: {}\n\n'.format(start_id), log=log)
 
@@ -118,18 +369,18 @@ class NextRequestScraper:
         # Scrape until it is not possible to navigate to the next request, either due to the scraper reaching the end of the database or because of a timeout
         while True:
             try:
-                counter += self.scrape_request(requests, counter=counter, debug=debug, log=log)
+                scraped = self.scrape_request(requests, counter=counter, debug=debug, log=log)
+                counter += scraped
 
                 # Exit the loop if the number of requests is reached
                 if counter == num_requests:
                     break
 
                 # Show scraper progress if desired
-                if progress and (counter % progress == 0):
+                if progress and scraped and (counter % progress == 0):
                     log_msg(scraper_progress(counter, start, end=timer()), log=log)
 
-                self.driver.find_element(By.CLASS_NAME,
-                                         'js-next-request').click()  # If possible, navigate to the next request
+                self.next_request()  # If possible, navigate to the next request
             except NoSuchElementException:  # Exit the loop if the js-next-request element cannot be found
                 log_msg('Webdriver could not find js-next-request element after count {}\n'.format(counter), log=log)
                 break
@@ -138,12 +389,12 @@ class NextRequestScraper:
                 break
             except InterruptScrapeException:  # Handling for any exception thrown while a request was being scraped
                 if progress:
-                    log_msg(scraper_progress_final(counter + 1, start, end=timer(), last_request=requests[-1]['id']), log=log)
+                    log_msg(final_progress(counter + 1), log=log)
                 raise InterruptScrapeException
             except KeyboardInterrupt:  # Handling for any exception thrown in between scraping requests
                 log_msg('User interruption occurred after count {}\n'.format(counter), log=log)
                 if progress:
-                    log_msg(scraper_progress_final(counter, start, end=timer(), last_request=requests[-1]['id']), log=log)
+                    log_msg(final_progress(counter), log=log)
                 raise InterruptScrapeException
             except:
                 log_msg('Exception occurred after count {}\n{}\n'.format(counter, traceback.format_exc()), log=log)
@@ -151,40 +402,106 @@ class NextRequestScraper:
 
         # Show scraper progress if desired
         if progress:
-            log_msg(scraper_progress_final(counter, start, end=timer(), last_request=requests[-1]['id']), log=log)
+            log_msg(final_progress(counter), log=log)
 
         # Return the number of requests scraped
         return counter
 
-    def scrape_request(self, requests, counter=-1, debug=0, log=''):
+    def scrape_request(self, requests, counter=-1, debug=0, log='', driver=None, navigation=None):
         """
         Scrapes data about a given request on a NextRequest request database, appending the result
-        to the given list.
+        to the given list. With the Selenium backend, the page is read from the given driver (e.g. one borrowed from a
+        DriverPool) or from the scraper's own driver. navigation is the time it took to load the page, if it was not
+        loaded by the scraper itself.
         """
+        driver = driver if driver is not None else self.driver
+        timing = self.timings.request()
+        timing.add_external('navigation', navigation if navigation is not None else self.navigation)
+        self.navigation = 0.0
         request_id, status, desc, date, depts, poc, events, docs = [None] * 8  # Initialize variables
+        row = None  # Complete row, when it is obtained at once rather than field by field
+        appended = False  # Whether a row was appended, rather than the request going to the retry queue
         err_msg = (' while scraping count {}'.format(counter + 1) if counter >= 0 else '') + '\n'  # Error message snippet
 
         try:  # Attempt to scrape relevant data
-            request_id = self.driver.find_element(By.CLASS_NAME, 'request-title-text').text.split()[1][1:]  # Request ID
-            err_msg = (' while scraping request ID {}'.format(request_id) if counter >= 0 else '') + '\n'  # Update error message snippet to display request ID
-            
-            status = self.driver.find_element(By.CLASS_NAME, 'request-status-label').text.strip()  # Request status
-
-            desc_row = self.driver.find_element(By.CLASS_NAME, 'request-text')  # Box containing request description
-            for desc_read_more in desc_row.find_elements(By.PARTIAL_LINK_TEXT,
-                                                         'Read more'):  # Expand description if necessary
-                desc_read_more.click()
-            desc = desc_row.find_element(By.ID, 'request-text').text  # Full request description
-
-            date = self.driver.find_element(By.CLASS_NAME, 'request_date').text  # Request date
-            depts = self.driver.find_element(By.CLASS_NAME,
-                                             'current-department').text  # Department(s) assigned to the request
-            poc = self.driver.find_element(By.CLASS_NAME, 'request-detail').text  # Point of contact
+            if self.backend == 'html':
+                if self.previous is not None:
+                    with timing.phase('incremental'):
+                        request_id, status = parse_request_summary(self.page)
+                        row = self.check_previous(request_id, status, lambda: parse_time_quotes(self.page))
+                if row is None and self.cache is not None:  # Reuse the row of a page that was not modified
+                    row = self.cache.result(self.page_url)
+                if row is None:
+                    with timing.phase('parse'):
+                        row = parse_request_page(self.page, base_url=self.page_url, session=self.session,
+                                                 limiter=self.limiter, archive=self.archive)
+                    if self.cache is not None: self.cache.set_result(self.page_url, row)
+                if debug:
+                    log_msg('{} scraped\n'.format(row['id']), log=log)
+                return 1
+
+            if self.archive is not None:  # Page source as loaded, before folders and "Read more" are expanded
+                with timing.phase('archive'):
+                    self.archive.put(urldefrag(driver.current_url)[0], driver.page_source)
+
+            if self.extraction == 'js':
+                try:
+                    with timing.phase('script'):
+                        row = scrape_request_js(driver, session=self.session, limiter=self.limiter,
+                                                archive=self.archive)
+                except KeyboardInterrupt:
+                    raise
+                except Exception:  # Fall back to scraping element by element
+                    timing.fallback = True
+                    log_msg('Script extraction failed{}\n{}\n'.format(err_msg, traceback.format_exc()), log=log)
+                    # The script may already have expanded folders, which the fallback would click closed again, so
+                    # it starts from a freshly loaded page
+                    with timing.phase('navigation'):
+                        if self.limiter is not None: self.limiter.acquire(self.url)
+                        driver.refresh()
+                else:
+                    if self.previous is not None:
+                        with timing.phase('incremental'):
+                            row = self.check_previous(row['id'], row['status'],
+                                                      lambda: msgs_time_quotes(row['msgs'])) or row
+                    if debug:
+                        log_msg('{} scraped\n'.format(row['id']), log=log)
+                    return 1
+
+            with timing.phase('summary'):
+                request_id = driver.find_element(By.CLASS_NAME, 'request-title-text').text.split()[1][1:]  # Request ID
+                err_msg = (' while scraping request ID {}'.format(request_id) if counter >= 0 else '') + '\n'  # Update error message snippet to display request ID
+
+                status = driver.find_element(By.CLASS_NAME, 'request-status-label').text.strip()  # Request status
+
+            # In incremental mode, reuse the previous row if the request has not changed
+            if self.previous is not None:
+                with timing.phase('incremental'):
+                    row = self.check_previous(request_id, status, lambda: get_webelement_text(
+                        driver.find_elements(By.CLASS_NAME, 'time-quotes')))
+                if row is not None:
+                    if debug:
+                        log_msg('{} skipped\n'.format(request_id), log=log)
+                    return 1
+
+            with timing.phase('description'):
+                desc_row = driver.find_element(By.CLASS_NAME, 'request-text')  # Box containing request description
+                for desc_read_more in desc_row.find_elements(By.PARTIAL_LINK_TEXT,
+                                                             'Read more'):  # Expand description if necessary
+                    desc_read_more.click()
+                desc = desc_row.find_element(By.ID, 'request-text').text  # Full request description
+
+            with timing.phase('fields'):
+                date = driver.find_element(By.CLASS_NAME, 'request_date').text  # Request date
+                depts = driver.find_element(By.CLASS_NAME,
+                                                 'current-department').text  # Department(s) assigned to the request
+                poc = driver.find_element(By.CLASS_NAME, 'request-detail').text  # Point of contact
 
             '''
             Documents attached to the request, if there are any
             '''
-            doc_list = self.driver.find_element(By.CLASS_NAME, 'document-list')  # Box containing documents
+            documents_start = timer()
+            doc_list = driver.find_element(By.CLASS_NAME, 'document-list')  # Box containing documents
             if '(none)' not in doc_list.text:  # Check for the presence of documents
                 # Expand folders, if there are any
                 folders = doc_list.find_elements(By.CLASS_NAME, 'folder-toggle')
@@ -192,30 +509,32 @@ class NextRequestScraper:
                     folder.click()
 
                 docs_all = doc_list.find_elements(By.CLASS_NAME, 'document-link')
-
-                # TODO: Figure out how to scrape all documents from a request whose folders also have navigation bars
-                #             # If there are many documents, then there will be navigation bar(s)
-                #             pag_navs = doc_list.find_elements_by_class_name('pagy-nav')
-                #             if pag_navs:
-                #                 pag_nav = pag_navs[-1]
-                #                 while not pag_nav.find_elements_by_class_name('page.next.disable'):
-                #                     pag_nav.find_element_by_partial_link_text('Next').click()
-                #                     doc_list = driver.find_element_by_class_name('document-list')
-                #                     doc_titles.extend(get_webelement_text(doc_list.find_elements_by_class_name('document-link')))
-                #                     doc_links.extend(remove_download_from_urls(get_webelement_link(doc_list.find_elements_by_class_name('document-link'))))=
-                #             doc_titles = list(set(doc_titles))
-                #             doc_links = list(set(doc_links))
+                doc_pairs = list(zip(get_webelement_text(docs_all),
+                                     remove_download_from_urls(get_webelement_link(docs_all))))
+
+                # If there are many documents, the list (and each folder) has a pagy-nav bar: fetch the other pages
+                # over HTTP rather than clicking through them
+                page_links = {urldefrag(link)[0] for link in get_webelement_link(doc_list.find_elements(
+                    By.CSS_SELECTOR, '.pagy-nav a')) if link and not link.startswith('javascript:')}
+                if page_links:
+                    doc_pairs += fetch_document_pages(self.session, page_links, {urldefrag(driver.current_url)[0]},
+                                                      limiter=self.limiter, archive=self.archive)
+                doc_pairs = unique_documents(doc_pairs)
 
                 # DataFrame-converted-to-CSV consisting of all documents
-                docs = pd.DataFrame({
-                    'title': get_webelement_text(docs_all),
-                    'link': remove_download_from_urls(get_webelement_link(docs_all))
-                }).to_csv(index=False)
+                doc_titles = [title for title, _ in doc_pairs]
+                doc_links = [link for _, link in doc_pairs]
+                timing.add('documents', timer() - documents_start)
+                with timing.phase('serialization'):
+                    docs = docs_to_csv(doc_titles, doc_links)
+            else:
+                timing.add('documents', timer() - documents_start)
 
             '''
             Messages recorded on the request page, if there are any
             '''
-            event_history = self.driver.find_elements(By.CSS_SELECTOR, '.generic-event,.note-event')  # All message blocks. TODO: This isn't working, need help with getting all possible message blocks
+            events_start = timer()
+            event_history = driver.find_elements(By.CSS_SELECTOR, '.generic-event,.note-event')  # All message blocks. TODO: This isn't working, need help with getting all possible message blocks
             num_events = len(event_history)
 
             # Titles, descriptions, and time strings for each message
@@ -239,12 +558,11 @@ class NextRequestScraper:
                 event_items[i] = event_item
                 time_quotes[i] = time_quote
 
+            timing.add('events', timer() - events_start)
+
             # DataFrame, converted to CSV, consisting of all messages
-            events = pd.DataFrame({
-                'title': event_titles,
-                'item': event_items,
-                'time': time_quotes
-            }).to_csv(index=False)
+            with timing.phase('serialization'):
+                events = events_to_csv(event_titles, event_items, time_quotes)
 
             # For testing purposes, print a message whenever a request is successfully scraped
             if debug:
@@ -253,29 +571,47 @@ class NextRequestScraper:
         # Exception handling for the most common Selenium exceptions: print short message describing which
         # request generated the exception, then print the stack trace
         except StaleElementReferenceException:
+            timing.set_error(StaleElementReferenceException)
             log_msg('Stale element referenced{}\n{}\n'.format(err_msg, traceback.format_exc()), log=log)
-        except NoSuchElementException:
+        except (NoSuchElementException, MissingElementException):
+            timing.set_error(sys.exc_info()[0])
             log_msg('Webdriver could not find element{}\n{}\n'.format(err_msg, traceback.format_exc()), log=log)
         except TimeoutException:
+            timing.set_error(TimeoutException)
             log_msg('Webdriver timed out{}\n{}\n'.format(err_msg, traceback.format_exc()), log=log)
         except KeyboardInterrupt:  # Raise a special exception if an interruption occurs while a request is being scraped
+            timing.set_error(KeyboardInterrupt)
             log_msg('User interruption occurred{}'.format(err_msg), log=log)
             raise InterruptScrapeException
         except:  # All other unforeseen exceptions are handled here
+            timing.set_error(sys.exc_info()[0])
             log_msg('Exception occurred{}\n{}\n'.format(err_msg, traceback.format_exc()), log=log)
-        finally:  # Always append the scraped request data to the list regardless of completeness
-            requests.append({
-                'id': request_id,
-                'status': status,
-                'desc': desc,
-                'date': date,
-                'depts': depts,
-                'docs': docs,
-                'poc': poc,
-                'msgs': events
-            })
+        finally:
+            if request_id is None and row is None: request_id = self.current_request_id(driver)
+            if timing.error is not None and self.retry_queue is not None:
+                # Failed requests are retried later instead of being stored incomplete
+                if request_id is not None:
+                    self.retry_queue.push(request_id, timing.error)
+                else:
+                    log_msg('Request ID unknown, so the request cannot be retried; skipping it{}'.format(err_msg),
+                            log=log)
+            else:  # Without a retry queue, append the scraped request data to the list regardless of completeness
+                requests.append(row if row is not None else {
+                    'id': request_id,
+                    'status': status,
+                    'desc': desc,
+                    'date': date,
+                    'depts': depts,
+                    'docs': docs,
+                    'poc': poc,
+                    'msgs': events
+                })
+                appended = True
+                if self.retry_queue is not None and timing.error is None:
+                    self.retry_queue.done(row['id'] if row is not None else request_id)
+            timing.finish(request_id=row['id'] if row is not None else request_id)
         
-        return 1  # For keeping count of the number of requests scraped for other functions
+        return 1 if appended else 0  # For keeping count of the number of requests scraped for other functions
 
 
 class InterruptScrapeException(Exception):
@@ -2,8 +2,13 @@
 Utility functions used for the NextRequest scraper
 """
 
-import re
-import pandas as pd
+import csv
+import io
+from urllib.parse import urlparse
+
+
+# Fields of a scraped request, in the column order of the exported CSV and of every other output of the scraper
+REQUEST_FIELDS = ['id', 'status', 'desc', 'date', 'depts', 'docs', 'poc', 'msgs']
 
 
 def log_msg(msg, log=''):
@@ -14,6 +19,8 @@ def log_msg(msg, log=''):
         
 
 def convert_requests_to_csv(requests, requests_name, path='data/', log=''):
+    import pandas as pd  # Imported when needed, so that modules only using the helpers here start quickly
+
     # Convert to DataFrame
     requests = [request for request in requests if (request and request['status'])]
     requests_df = pd.DataFrame(requests).drop_duplicates()
@@ -27,6 +34,14 @@ def convert_requests_to_csv(requests, requests_name, path='data/', log=''):
         log_msg('Unable to convert requests into CSV\n\n', log=log)
 
 
+def csv_rows(csv_string):
+    """
+    Parses a CSV string embedded in a scraped request (docs or msgs) into a list of rows, without the header
+    """
+    if not csv_string or not isinstance(csv_string, str): return []
+    return list(csv.reader(io.StringIO(csv_string)))[1:]
+
+
 def scraper_progress(counter, start, end):
     """
     String displaying scraper progress
@@ -38,14 +53,30 @@ def scraper_progress_final(counter, start, end, last_request):
     """
     String displaying final scraper progress
     """
-    return 'Total requests scraped: {:d}\tAvg runtime: {:.2f}s\tTotal runtime: {:.1f}s\n\nLast request scraped: {}\n'.format(counter, (end - start) / counter, end - start, last_request)
+    return 'Total requests scraped: {:d}\tAvg runtime: {:.2f}s\tTotal runtime: {:.1f}s\n\nLast request scraped: {}\n'.format(counter, (end - start) / counter if counter else 0.0, end - start, last_request)
+
+
+def scraper_throughput(counter, start, end):
+    """
+    String displaying the progress of a concurrent scrape
+    """
+    return 'Requests scraped: {:d}\tThroughput: {:.2f} req/s\tTotal runtime: {:.1f}s\n'.format(counter, counter / (end - start), end - start)
+
+
+def scraper_throughput_final(stats):
+    """
+    String displaying the final statistics of a concurrent scrape
+    """
+    return 'Total requests scraped: {:d}\tMissing: {:d}\tErrors: {:d}\tThroughput: {:.2f} req/s\tTotal runtime: {:.1f}s\n\n'.format(stats['scraped'], stats['missing'], stats['errors'], stats['throughput'], stats['runtime'])
 
 
 def get_city_from_url(url):
     """
-    Finds the city name from the NextRequest URL.
+    Finds the city name from the NextRequest URL, e.g. lacity for https://lacity.nextrequest.com/requests/ and cabq for
+    https://nextrequest.cabq.gov/requests/.
     """
-    return re.match(r'(?<=https://)[a-zA-Z]*', url)[0]
+    labels = urlparse(url).hostname.split('.')
+    return labels[1] if (labels[0] == 'nextrequest' and len(labels) > 2) else labels[0]
 
 
 def get_webelement_text(webelement):
@@ -64,6 +95,60 @@ def get_webelement_link(webelement):
 
 def remove_download_from_urls(urls):
     """
-    Removes '/download' from the end of a list of URLs, if the list exists.
+    Removes '/download' (and anything after it) from the end of a list of URLs, if the list exists.
+    """
+    return [url.rsplit('/download', 1)[0] for url in urls] if urls else []
+
+
+def released_document_count(msgs):
+    """
+    Number of documents released according to the messages of a request (a msgs CSV string): each "Document(s)
+    Released" message lists the released document titles, one per line. Documents released only to the requester are
+    not listed publicly, so they are not counted.
+    """
+    count = 0
+    for title, item, _ in csv_rows(msgs):
+        if title.startswith('Document(s) Released') and not title.startswith('Document(s) Released to Requester'):
+            count += sum(1 for line in item.split('\n') if line.strip())
+    return count
+
+
+def check_document_counts(requests):
     """
-    return list(map(lambda url: re.match(r'.*(?=/download)', url)[0], urls)) if urls else []
+    DataFrame comparing the number of documents scraped for each request with the number released according to its
+    messages, for the requests where fewer documents were scraped. Documents can also be removed after release, so a
+    shortfall is worth checking rather than necessarily an error.
+    """
+    import pandas as pd
+
+    counts = [(request['id'],
+               len(csv_rows(request.get('docs'))),
+               released_document_count(request.get('msgs')))
+              for request in requests if request and request.get('status')]
+    counts = pd.DataFrame(counts, columns=['id', 'scraped', 'released'])
+    return counts[counts['scraped'] < counts['released']].reset_index(drop=True)
+
+
+def docs_to_csv(titles, links):
+    """
+    DataFrame-converted-to-CSV consisting of all documents of a request
+    """
+    import pandas as pd
+
+    return pd.DataFrame({
+        'title': titles,
+        'link': links
+    }).to_csv(index=False)
+
+
+def events_to_csv(titles, items, times):
+    """
+    DataFrame-converted-to-CSV consisting of all messages of a request
+    """
+    import pandas as pd
+
+    return pd.DataFrame({
+        'title': titles,
+        'item': items,
+        'time': times
+    }).to_csv(index=False)
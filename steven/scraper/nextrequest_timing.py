@@ -0,0 +1,206 @@
+"""
+Structured timing instrumentation for the NextRequest scraper. Every scraped request produces one JSON record with the
+time spent in each phase (navigation, description, documents, events, serialization, ...), the exception type if it
+failed and its attempt number, written as JSON lines through a buffered log. The summary tool aggregates these
+records into per-phase statistics and histograms.
+
+Usage: python nextrequest_timing.py TIMING_LOG [TIMING_LOG ...] [--bins N]
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+
+class TimingLog:
+    """
+    Buffered JSON-lines log of per-request timings. Records are written to filename every buffer_size records and on
+    close, rather than opening the file once per message like log_msg. With an empty filename nothing is recorded, so
+    a disabled TimingLog can be used unconditionally. Safe to share between threads.
+    """
+
+    def __init__(self, filename='', buffer_size=1000):
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.attempts = Counter()  # Number of records per request ID, so that retries can be told apart
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.filename)
+
+    def request(self, request_id=None):
+        """
+        Starts timing a request
+        """
+        return RequestTiming(self, request_id)
+
+    def write(self, record):
+        """
+        Adds a record to the log, numbering the attempts at each request ID
+        """
+        if not self.enabled: return
+        with self.lock:
+            if record.get('id') is not None:
+                self.attempts[record['id']] += 1
+                record['attempt'] = self.attempts[record['id']]
+            self.buffer.append(json.dumps(record))
+            if len(self.buffer) >= self.buffer_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            with open(self.filename, 'a') as f:
+                f.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RequestTiming:
+    """
+    Timings of a single request, written to its TimingLog by finish. Time is accumulated per phase, so a phase can be
+    entered several times (e.g. serialization of documents and of messages).
+    """
+
+    def __init__(self, log, request_id=None):
+        self.log = log
+        self.request_id = request_id
+        self.phases = {}
+        self.error = None
+        self.fallback = False
+        self.external = 0.0  # Time measured before the request was timed, e.g. navigation to the page
+        self.start = timer()
+
+    @contextmanager
+    def phase(self, name):
+        start = timer()
+        try:
+            yield
+        finally:
+            self.add(name, timer() - start)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_external(self, name, seconds):
+        """
+        Adds the time of a phase that was measured before the request was timed, which is also added to the total
+        """
+        self.add(name, seconds)
+        self.external += seconds
+
+    def set_error(self, exc_type):
+        self.error = exc_type.__name__ if isinstance(exc_type, type) else str(exc_type)
+
+    def finish(self, request_id=None, outcome=None):
+        """
+        Writes the record of the request. The total is the time since the request was timed, plus any time added with
+        add_external. Phases timed with phase or add are already within that time.
+        """
+        if request_id is not None: self.request_id = request_id
+        total = timer() - self.start + self.external
+        self.log.write({
+            'id': self.request_id,
+            'time': time.time(),
+            'total': total,
+            'phases': self.phases,
+            'error': self.error,
+            'fallback': self.fallback,
+            'outcome': outcome or ('error' if self.error else 'scraped')
+        })
+
+
+def load_timings(filenames):
+    """
+    Reads the records of one or more timing logs
+    """
+    records = []
+    for filename in ([filenames] if isinstance(filenames, str) else filenames):
+        with open(filename) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def summarize_timings(records):
+    """
+    DataFrame of per-phase statistics in seconds over the given timing records, with each phase's share of the total
+    time. The 'total' row covers whole requests.
+    """
+    import pandas as pd  # Only needed for summaries, so that the scraper does not wait for it
+
+    phases = pd.DataFrame([record['phases'] for record in records])
+    phases['total'] = [record['total'] for record in records]
+    summary = phases.agg(['count', 'mean', 'median', lambda x: x.quantile(0.95), 'max']).T
+    summary.columns = ['count', 'mean', 'p50', 'p95', 'max']
+    summary['share'] = phases.sum() / phases['total'].sum()
+    return summary.sort_values('share', ascending=False)
+
+
+def timing_counts(records):
+    """
+    Counts of outcomes, error types and retried requests over the given timing records
+    """
+    return {
+        'requests': len({record['id'] for record in records}),
+        'outcomes': dict(Counter(record.get('outcome') for record in records)),
+        'errors': dict(Counter(record['error'] for record in records if record.get('error'))),
+        'retries': sum(1 for record in records if record.get('attempt', 1) > 1),
+        'fallbacks': sum(1 for record in records if record.get('fallback'))
+    }
+
+
+def phase_histogram(values, bins=10, width=40):
+    """
+    Text histogram of phase times, with logarithmically spaced bins since a few slow pages dominate the tail
+    """
+    import numpy as np
+
+    values = np.asarray([value for value in values if value > 0])
+    if not len(values): return '  (no samples)\n'
+    if values.min() == values.max():
+        edges = np.array([values.min(), values.max() * 1.0001])
+    else:
+        edges = np.geomspace(values.min(), values.max(), bins + 1)
+    counts, edges = np.histogram(values, bins=edges)
+    lines = ['  {:>9.1f}ms - {:>9.1f}ms {:>7d} {}'.format(low * 1e3, high * 1e3, count,
+                                                         '#' * int(np.ceil(width * count / counts.max())))
+             for low, high, count in zip(edges[:-1], edges[1:], counts)]
+    return '\n'.join(lines) + '\n'
+
+
+def timing_report(records, bins=10):
+    """
+    String displaying the per-phase statistics and histograms of the given timing records
+    """
+    summary = summarize_timings(records)
+    report = ['{}\n'.format(timing_counts(records)), summary.to_string(float_format='{:.4f}'.format), '']
+    for phase in summary.index:
+        report.append('{}:'.format(phase))
+        report.append(phase_histogram([record['total'] if phase == 'total' else record['phases'].get(phase, 0.0)
+                                       for record in records], bins=bins))
+    return '\n'.join(report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize NextRequest scraper timing logs')
+    parser.add_argument('logs', nargs='+', help='Timing logs written by NextRequestScraper')
+    parser.add_argument('--bins', type=int, default=10, help='Number of histogram bins')
+    args = parser.parse_args()
+    print(timing_report(load_timings(args.logs), bins=args.bins))
@@ -0,0 +1,96 @@
+"""
+Tests of the concurrent ID-range scraper against a MockPortal serving generated request pages.
+
+Usage: python -m pytest steven/scraper/tests
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nextrequest_async import scrape_ids_async, run_async, expand_id_ranges
+from nextrequest_html import make_session
+from nextrequest_mock_portal import MockPortal, make_mock_pages
+from nextrequest_rate import HostRateLimiter
+
+LATENCY = 0.1
+
+
+class InFlightSession:
+    """
+    Wraps a session, recording the largest number of requests in flight at once
+    """
+    def __init__(self, session):
+        self.session = session
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get(self, *args, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return self.session.get(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def portal():
+    ids = list(expand_id_ranges([('19', 1, 20)]))
+    with MockPortal(make_mock_pages(ids, num_docs=2), latency=LATENCY) as portal:
+        yield portal
+
+
+def scrape(portal, ids, concurrency=4, limiter=None):
+    rows = []
+    session = InFlightSession(make_session(pool_size=concurrency))
+    stats = run_async(scrape_ids_async(rows, portal.url, ids, session, concurrency=concurrency, limiter=limiter,
+                                       progress=10))
+    session.session.close()
+    return rows, stats, session
+
+
+def test_scrape_id_range(portal, capsys):
+    ids = list(expand_id_ranges([('19', 1, 22)]))  # 19-21 and 19-22 do not exist
+    rows, stats, session = scrape(portal, ids)
+
+    assert len(rows) == 20
+    assert sorted(row['id'] for row in rows) == sorted(ids[:20])
+    row = next(row for row in rows if row['id'] == '19-3')
+    assert row['status'] == 'CLOSED'
+    assert row['desc'] == 'Request 19-3 description'
+    assert row['depts'] == 'Police Department'
+    assert row['docs'] == ('title,link\n'
+                           'document_0.pdf,{0}/documents/2-0\n'
+                           'document_1.pdf,{0}/documents/2-1\n').format(portal.url.rsplit('/requests/', 1)[0])
+    assert row['msgs'].startswith('title,item,time\n"Request Closed\nPublic",Request completed.,')
+    assert stats['scraped'] == 20 and stats['missing'] == 2 and stats['errors'] == 0
+
+    # Throughput is reported, and the concurrent fetches overlap
+    assert stats['throughput'] == pytest.approx(stats['scraped'] / stats['runtime'])
+    assert stats['runtime'] < len(ids) * LATENCY
+    output = capsys.readouterr().out
+    assert output.count('Requests scraped: ') == 2
+    assert 'Total requests scraped: 20\tMissing: 2\tErrors: 0\tThroughput: {:.2f} req/s'.format(
+        stats['throughput']) in output
+
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_concurrency_cap(portal, concurrency):
+    ids = list(expand_id_ranges([('19', 1, 12)]))
+    rows, stats, session = scrape(portal, ids, concurrency=concurrency)
+    assert len(rows) == 12
+    assert session.max_in_flight == concurrency
+
+
+def test_rate_limit(portal):
+    ids = list(expand_id_ranges([('19', 1, 6)]))
+    rows, stats, _ = scrape(portal, ids, concurrency=6, limiter=HostRateLimiter(10))
+    assert len(rows) == 6
+    assert stats['runtime'] >= 0.5  # The first request is free, the other 5 wait a tenth of a second each
@@ -0,0 +1,138 @@
+"""
+Tests of the conditional GET page cache against a MockPortal that honours conditional headers.
+
+Usage: python -m pytest steven/scraper/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nextrequest_cache import PageCache
+from nextrequest_html import make_session
+from nextrequest_mock_portal import MockPortal, make_mock_pages
+
+IDS = ['19-1', '19-2', '19-3']
+
+
+@pytest.fixture
+def portal():
+    with MockPortal(make_mock_pages(IDS), conditional=True) as portal:
+        yield portal
+
+
+@pytest.fixture
+def session():
+    session = make_session()
+    yield session
+    session.close()
+
+
+def test_revalidates_with_conditional_requests(portal, session):
+    cache = PageCache()
+    url = portal.url + '19-1'
+
+    first = cache.get(session, url)
+    assert first.status_code == 200 and not first.from_cache
+    assert cache.stats['misses'] == 1 and len(cache) == 1
+
+    second = cache.get(session, url)
+    assert second.status_code == 200 and second.from_cache
+    assert second.text == first.text
+    assert portal.not_modified == 1
+    assert cache.stats['hits'] == 1 and cache.stats['bytes_saved'] == len(first.content)
+    assert 'Cache hits: 1/2 (50.0%)' in cache.report()
+
+
+def test_modified_page_is_fetched_again(portal, session):
+    cache = PageCache()
+    url = portal.url + '19-1'
+    cache.get(session, url)
+    portal.set_modified('19-1', portal.pages['19-1'].replace('Request 19-1 description', 'Updated description'))
+
+    response = cache.get(session, url)
+    assert not response.from_cache and 'Updated description' in response.text
+    assert cache.stats['misses'] == 2 and cache.stats['hits'] == 0
+    assert cache.get(session, url).from_cache
+
+
+def test_parse_result_reused_only_when_not_modified(portal, session):
+    cache = PageCache()
+    url = portal.url + '19-1'
+    cache.get(session, url)
+    assert cache.result(url) is None  # Just downloaded: parsed by the caller
+    cache.set_result(url, {'id': '19-1'})
+
+    cache.get(session, url)
+    assert cache.result(url) == {'id': '19-1'}
+    assert cache.stats['results_reused'] == 1
+
+
+def test_redirects_and_pages_without_validators_are_not_cached(session):
+    with MockPortal(make_mock_pages(IDS)) as portal:
+        cache = PageCache()
+        cache.get(session, portal.url + '19-1')
+        assert cache.stats['uncacheable'] == 1
+    with MockPortal(make_mock_pages(IDS), conditional=True) as portal:
+        response = cache.get(session, portal.url + '19-9')
+        assert response.history
+    assert len(cache) == 0
+
+
+def test_evicts_least_recently_used(portal, session):
+    page_size = len(portal.pages['19-1'].encode('utf-8'))
+    cache = PageCache(max_bytes=int(page_size * 2.5))
+    cache.get(session, portal.url + '19-1')
+    cache.get(session, portal.url + '19-2')
+    cache.get(session, portal.url + '19-1')  # Revalidated, so 19-2 is now the least recently used
+    cache.get(session, portal.url + '19-3')
+
+    assert cache.stats['evictions'] == 1 and len(cache) == 2
+    assert cache.total <= cache.max_bytes
+    assert cache.conditional_headers(portal.url + '19-2') == {}
+    assert cache.get(session, portal.url + '19-1').from_cache
+    assert cache.get(session, portal.url + '19-3').from_cache
+
+
+class EvictingSession:
+    """
+    Session evicting the page from cache after its conditional headers were read, as a concurrent fetch could
+    """
+    def __init__(self, session, cache):
+        self.session = session
+        self.cache = cache
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        if headers and 'If-None-Match' in headers:
+            with self.cache.lock:
+                self.cache.remove(url)
+                self.cache.conn.commit()
+        return self.session.get(url, headers=headers, **kwargs)
+
+
+def test_not_modified_after_eviction_fetches_page(portal, session):
+    cache = PageCache()
+    url = portal.url + '19-1'
+    page = cache.get(session, url).text
+
+    evicting = EvictingSession(session, cache)
+    response = cache.get(evicting, url)
+    assert response.status_code == 200 and not response.from_cache
+    assert response.text == page
+    assert len(evicting.requests) == 2 and 'If-None-Match' not in evicting.requests[1]
+    assert portal.not_modified == 1
+    assert len(cache) == 1  # Cached again
+
+
+def test_persists_across_runs(portal, session, tmp_path):
+    filename = str(tmp_path / 'cache.db')
+    url = portal.url + '19-1'
+    with PageCache(filename) as cache:
+        cache.get(session, url)
+    with PageCache(filename) as cache:
+        assert cache.get(session, url).from_cache
+        assert cache.total == len(portal.pages['19-1'].encode('utf-8'))
@@ -0,0 +1,111 @@
+"""
+Offline tests of the HTML backend's request page parser against saved pages in tests/fixtures.
+
+Usage: python -m pytest steven/scraper/tests
+"""
+
+import os
+import sys
+
+import pytest
+from lxml import html as lxml_html
+from urllib.parse import urlparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nextrequest_html import parse_request_page, parse_request_file, parse_time_quotes, MissingElementException
+from nextrequest_mock_portal import make_mock_pages
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BASE_URL = 'https://lacity.nextrequest.com/requests/19-1234'
+
+# Row expected from fixtures/request_19-1234.html, written as the Selenium backend reads the page: event titles include
+# the visibility label on a new line, and the status is upper-cased by CSS
+EXPECTED_ROW = {
+    'id': '19-1234',
+    'status': 'CLOSED',
+    'desc': 'Any and all records of overtime paid to officers of the Central Division between January 1, 2018 and '
+            'December 31, 2018.\nPlease include the payroll codes used.',
+    'date': 'April 6, 2019 via web',
+    'depts': 'Police Department (LAPD), Personnel Department',
+    'docs': 'title,link\n'
+            'Overtime 2018.pdf,https://lacity.nextrequest.com/documents/2281-overtime-2018.pdf\n'
+            'Payroll codes & descriptions.xlsx,https://lacity.nextrequest.com/documents/2282\n'
+            'Central Division roster.pdf,https://lacity.nextrequest.com/documents/2283\n',
+    'poc': 'Records Unit',
+    'msgs': 'title,item,time\n'
+            '"Request Closed\nPublic",The requested records have been released.,'
+            '"April 18, 2019, 2:05pm by Records Unit"\n'
+            '"Document(s) Released\nPublic","Overtime 2018.pdf\nPayroll codes & descriptions.xlsx",'
+            '"April 18, 2019, 2:04pm by Records Unit"\n'
+            '"Department Assignment\nPublic",Personnel Department,"April 8, 2019, 10:36am by Staff"\n'
+            '"Request Opened\nPublic",Request received via web,"April 6, 2019, 8:59am"\n'
+}
+
+
+def fixture_path(name):
+    return os.path.join(FIXTURES, name)
+
+
+def read_fixture(name):
+    with open(fixture_path(name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_parse_request_file():
+    assert parse_request_file(fixture_path('request_19-1234.html'), base_url=BASE_URL) == EXPECTED_ROW
+
+
+def test_parse_request_page_from_parsed_root():
+    root = lxml_html.fromstring(read_fixture('request_19-1234.html'))
+    assert parse_request_page(root, base_url=BASE_URL) == EXPECTED_ROW
+
+
+def test_parse_time_quotes():
+    root = lxml_html.fromstring(read_fixture('request_19-1234.html'))
+    assert parse_time_quotes(root) == ['April 18, 2019, 2:05pm by Records Unit',
+                                       'April 18, 2019, 2:04pm by Records Unit',
+                                       'April 8, 2019, 10:36am by Staff', 'April 6, 2019, 8:59am']
+
+
+def test_request_without_documents():
+    page = read_fixture('request_19-1234.html')
+    start, end = page.index('<div class="document-list">'), page.index('<section class="event-history">')
+    page = page[:start] + '<div class="document-list"><p>(none)</p></div>' + page[end:]
+    assert parse_request_page(page, base_url=BASE_URL)['docs'] is None
+
+
+def test_missing_element():
+    page = read_fixture('request_19-1234.html').replace('current-department', 'department')
+    with pytest.raises(MissingElementException):
+        parse_request_page(page, base_url=BASE_URL)
+
+
+class FakeResponse:
+    def __init__(self, url, text):
+        self.url, self.text, self.status_code = url, text, 200
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """
+    Serves make_mock_pages pages for https://example.nextrequest.com/requests/<id>?<query>, recording the URLs fetched
+    """
+    def __init__(self, pages):
+        self.pages = pages
+        self.fetched = []
+
+    def get(self, url, timeout=None):
+        self.fetched.append(url)
+        parsed = urlparse(url)
+        return FakeResponse(url, self.pages[parsed.path.rsplit('/', 1)[1]][parsed.query])
+
+
+def test_document_pages_start_at_2():
+    pages = make_mock_pages(['19-1'], num_docs=25, docs_per_page=5)
+    session = FakeSession(pages)
+    url = 'https://example.nextrequest.com/requests/19-1'
+    row = parse_request_page(pages['19-1'][''], base_url=url, session=session)
+    assert row['docs'].count('document_') == 25
+    assert sorted(session.fetched) == [url + '?documents_page={}'.format(page) for page in range(2, 6)]
@@ -0,0 +1,49 @@
+"""
+Tests of the conversion of the Selenium batch script's result into a row, against a MockPortal serving the further
+pages of a document list.
+
+Usage: python -m pytest steven/scraper/tests
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nextrequest_html import make_session, parse_request_page
+from nextrequest_js import js_result_to_row
+from nextrequest_mock_portal import MockPortal, render_request_page, render_pagy_nav
+
+EVENTS = [('Request Opened', 'Request received via web', 'April 6, 2019, 8:59am')]
+PAGE_1_DOCS = [('a.pdf', '/documents/1'), ('b.pdf', '/documents/2')]
+PAGE_2_DOCS = [('b.pdf', '/documents/2'), ('c.pdf', '/documents/3')]  # b.pdf is listed on both pages
+
+
+def render(docs, page):
+    return render_request_page('19-1', docs=docs, events=EVENTS, depts='Police Department',
+                               pagy_nav=render_pagy_nav('19-1', page, 2))
+
+
+def script_result(url):
+    """
+    What SCRAPE_REQUEST_JS returns on page 1: links as shown on the page, with /download
+    """
+    base = url.rsplit('/requests/', 1)[0]
+    return {'title': 'Request #19-1', 'status': 'Closed', 'desc': '', 'date': '', 'depts': 'Police Department',
+            'poc': 'Staff', 'url': url, 'pages': [url + '?documents_page=2'],
+            'docs': [{'title': title, 'link': base + link + '/download'} for title, link in PAGE_1_DOCS],
+            'events': [{'title': title + '\nPublic', 'item': item, 'time': time} for title, item, time in EVENTS]}
+
+
+def test_documents_repeated_across_pages_deduplicated():
+    pages = {'19-1': {'': render(PAGE_1_DOCS, 1), 'documents_page=2': render(PAGE_2_DOCS, 2)}}
+    with MockPortal(pages) as portal:
+        url = portal.url + '19-1'
+        session = make_session()
+        row = js_result_to_row(script_result(url), session=session)
+        html_row = parse_request_page(pages['19-1'][''], base_url=url, session=session)
+        session.close()
+
+    base = url.rsplit('/requests/', 1)[0]
+    assert row['docs'] == 'title,link\na.pdf,{0}/documents/1\nb.pdf,{0}/documents/2\nc.pdf,{0}/documents/3\n'.format(
+        base)
+    assert row['docs'] == html_row['docs']
@@ -0,0 +1,148 @@
+"""
+Tests of the rate limiters in simulated time, and of AdaptiveRateLimiter against a MockPortal that throttles.
+
+Usage: python -m pytest steven/scraper/tests
+"""
+
+import os
+import sys
+
+import pytest
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nextrequest_rate import TokenBucket, AdaptiveRateLimiter, SimulatedClock, retry_after_seconds
+from nextrequest_mock_portal import MockPortal, make_mock_pages
+
+URL = 'https://lacity.nextrequest.com/requests/19-1234'
+OTHER_URL = 'https://sandiego.nextrequest.com/requests/21-500'
+
+
+def make_limiter(clock, **kwargs):
+    options = dict(rate=1, floor=0.25, ceiling=2, increase=0.5, decrease=0.5, cooldown=10)
+    options.update(kwargs)
+    return AdaptiveRateLimiter(clock=clock, sleep=clock.sleep, **options)
+
+
+def rate(limiter, url=URL):
+    return limiter.bucket(url).rate
+
+
+def test_token_bucket_paces_requests():
+    clock = SimulatedClock()
+    bucket = TokenBucket(2, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):  # The burst is free
+        bucket.acquire()
+    assert clock() == 0
+    for _ in range(4):
+        bucket.acquire()
+    assert clock() == pytest.approx(2)
+
+
+def test_healthy_responses_increase_up_to_ceiling():
+    clock = SimulatedClock()
+    limiter = make_limiter(clock)
+    limiter.record(URL, status=200, latency=0.1)
+    assert rate(limiter) == pytest.approx(1.5)
+    for _ in range(5):
+        limiter.record(URL, status=200, latency=0.1)
+    assert rate(limiter) == pytest.approx(2)
+    assert limiter.stats()['lacity.nextrequest.com']['healthy'] == 6
+
+
+@pytest.mark.parametrize('response', [{'status': 429}, {'status': 500}, {'status': 503}, {'failed': True}])
+def test_congestion_decreases_down_to_floor(response):
+    clock = SimulatedClock()
+    limiter = make_limiter(clock)
+    limiter.record(URL, **response)
+    assert rate(limiter) == pytest.approx(0.5)
+    for _ in range(3):
+        clock.advance(10)
+        limiter.record(URL, **response)
+    assert rate(limiter) == pytest.approx(0.25)
+
+
+def test_decreases_once_per_cooldown():
+    clock = SimulatedClock()
+    limiter = make_limiter(clock)
+    for _ in range(5):  # A burst of concurrent failures counts once
+        limiter.record(URL, status=429)
+    assert rate(limiter) == pytest.approx(0.5)
+    clock.advance(9)
+    limiter.record(URL, status=429)
+    assert rate(limiter) == pytest.approx(0.5)
+    clock.advance(1)
+    limiter.record(URL, status=429)
+    assert rate(limiter) == pytest.approx(0.25)
+    state = limiter.stats()['lacity.nextrequest.com']
+    assert state['throttled'] == 7 and state['decreases'] == 2
+
+
+def test_slow_responses_decrease():
+    clock = SimulatedClock()
+    limiter = make_limiter(clock, target_latency=2)
+    limiter.record(URL, status=200, latency=1)
+    assert rate(limiter) == pytest.approx(1.5)
+    limiter.record(URL, status=200, latency=3)
+    assert rate(limiter) == pytest.approx(0.75)
+
+
+def test_redirect_runs_decrease():
+    clock = SimulatedClock()
+    limiter = make_limiter(clock, redirect_run=3)
+    for _ in range(2):  # Isolated redirects are missing IDs: the rate stays
+        limiter.record(URL, status=200, redirected=True)
+    assert rate(limiter) == pytest.approx(1)
+    limiter.record(URL, status=200)  # Breaks the run
+    assert rate(limiter) == pytest.approx(1.5)
+    for _ in range(3):
+        limiter.record(URL, status=200, redirected=True)
+    assert rate(limiter) == pytest.approx(0.75)
+
+
+def test_retry_after_pauses_host():
+    clock = SimulatedClock()
+    limiter = make_limiter(clock)
+    limiter.acquire(URL)
+    limiter.record(URL, status=429, retry_after=30)
+    limiter.acquire(URL)
+    assert clock() >= 30
+    limiter.acquire(OTHER_URL)  # Other hosts are not paused
+    assert rate(limiter, OTHER_URL) == pytest.approx(1)
+
+
+def test_hosts_adapt_independently():
+    clock = SimulatedClock()
+    limiter = make_limiter(clock)
+    limiter.record(URL, status=429)
+    limiter.record(OTHER_URL, status=200)
+    assert limiter.rates() == {'lacity.nextrequest.com': pytest.approx(0.5),
+                               'sandiego.nextrequest.com': pytest.approx(1.5)}
+
+
+def test_retry_after_seconds():
+    response = requests.Response()
+    assert retry_after_seconds(response) is None
+    response.headers['Retry-After'] = '120'
+    assert retry_after_seconds(response) == 120
+    response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+    assert retry_after_seconds(response) is None
+
+
+def test_backs_off_from_throttling_portal():
+    ids = ['19-{}'.format(i) for i in range(1, 21)]
+    limiter = AdaptiveRateLimiter(rate=100, floor=5, ceiling=100, increase=1, cooldown=0)
+    with MockPortal(make_mock_pages(ids), throttle_rate=10, throttle_burst=1, retry_after=0) as portal:
+        session = requests.Session()
+        for request_id in ids:
+            url = portal.url + request_id
+            limiter.acquire(url)
+            response = session.get(url)
+            limiter.record(url, status=response.status_code, retry_after=retry_after_seconds(response))
+        session.close()
+
+    state = limiter.stats()['{}:{}'.format(portal.host, portal.port)]
+    assert portal.throttled > 0
+    assert state['throttled'] == portal.throttled
+    assert state['healthy'] == len(ids) - portal.throttled
+    assert state['rate'] < 100